@@ -4,7 +4,8 @@
 import urllib
 
 from board.app import create_app
-from board.models import db, User
+from board.models import User
+from board.models.upgrade import upgrade_schema
 
 
 app = create_app()
@@ -14,7 +15,19 @@ app = create_app()
 def init_db():
     """初始化数据库
     """
-    db.create_all()
+    upgrade_schema()
     print(f"Sqlite3 database file is {app.config['SQLALCHEMY_DATABASE_URI']}.")
     name, password = User.create_administrator()
     print(f'Create admin user, name: {name}, password: {password}.')
+
+
+@app.cli.command()
+def upgrade_db():
+    """升级已有的数据库，添加新版本的映射类中新增的数据表、列和索引
+    """
+    added = upgrade_schema()
+    print(f"Sqlite3 database file is {app.config['SQLALCHEMY_DATABASE_URI']}.")
+    if added:
+        print(f"Add columns and indexes: {', '.join(added)}.")
+    else:
+        print('Database is up to date.')
@@ -0,0 +1,49 @@
+"""序列化性能测试
+
+分别使用 marshmallow 和预先生成的序列化函数序列化 10000 个 Server 实例
+再分别使用 flask.json 和 json_dumps 将结果序列化为 JSON 字符串
+打印每种方式每秒处理的记录数
+
+    $ python -m benchmarks.serializers
+"""
+
+import time
+from datetime import datetime
+from flask.json import dumps as flask_dumps
+
+from board.app import create_app
+from board.models import Server, ServerSchema, dump_server
+from board.common.serializers import json_dumps, orjson
+
+
+ROWS = 10000
+
+
+def make_servers(count):
+    now = datetime.now()
+    return [Server(id=i, name=f'redis-{i}', description='benchmark',
+        host='10.0.0.1', port=6379, password=None, created_time=now,
+        updated_time=now) for i in range(count)]
+
+
+def measure(name, func, count):
+    start = time.perf_counter()
+    result = func()
+    elapsed = time.perf_counter() - start
+    print(f'{name:<32} {count / elapsed:>12,.0f} rows/sec')
+    return result
+
+
+def main():
+    servers = make_servers(ROWS)
+    data = measure('ServerSchema().dump(many=True)',
+            lambda: ServerSchema().dump(servers, many=True).data, ROWS)
+    measure('dump_server', lambda: [dump_server(s) for s in servers], ROWS)
+    with create_app().app_context():
+        measure('flask.json.dumps', lambda: flask_dumps(data), ROWS)
+        encoder = 'orjson' if orjson is not None else 'flask.json'
+        measure(f'json_dumps ({encoder})', lambda: json_dumps(data), ROWS)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,46 @@
+"""应用启动时间测试
+
+每次在新的 Python 进程中导入 board.app 并调用 create_app ，统计冷启动耗时
+同时打印创建应用之后是否已经导入了 wechatpy 等较重的模块
+
+    $ python -m benchmarks.startup
+"""
+
+import sys
+import json
+import statistics
+import subprocess
+
+
+RUNS = 10
+
+# 在子进程中运行的代码
+SCRIPT = '''
+import sys, time, json
+start = time.perf_counter()
+from board.app import create_app
+create_app()
+elapsed = time.perf_counter() - start
+print(json.dumps({'elapsed': elapsed,
+    'modules': [m for m in ('wechatpy', 'requests') if m in sys.modules]}))
+'''
+
+
+def run_once():
+    output = subprocess.check_output([sys.executable, '-c', SCRIPT])
+    return json.loads(output)
+
+
+def main():
+    results = [run_once() for _ in range(RUNS)]
+    times = [result['elapsed'] * 1000 for result in results]
+    print(f'create_app() cold start, {RUNS} runs')
+    print(f'{"min":<8} {min(times):>8.1f} ms')
+    print(f'{"median":<8} {statistics.median(times):>8.1f} ms')
+    print(f'{"max":<8} {max(times):>8.1f} ms')
+    modules = ', '.join(results[0]['modules']) or 'none'
+    print(f'heavy modules imported: {modules}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,44 @@
+"""监控数据汇总性能测试
+
+模拟 SERVERS 个服务器的最新 INFO 数据，分为 20 个标签，打印每次汇总的耗时
+
+    $ python -m benchmarks.summary
+"""
+
+import time
+import random
+
+from board.metrics import summarize
+
+
+SERVERS = 2000
+ROUNDS = 20
+
+
+def make_samples(count):
+    samples = []
+    for i in range(count):
+        info = {
+            'used_memory': random.randint(1 << 20, 1 << 30),
+            'maxmemory': 1 << 30,
+            'instantaneous_ops_per_sec': random.randint(0, 50000),
+            'connected_clients': random.randint(1, 500),
+            'role': 'master' if i % 3 else 'slave',
+            'keyspace_hits': random.randint(0, 10 ** 9),
+            'keyspace_misses': random.randint(0, 10 ** 8),
+        }
+        samples.append((f'tag-{i % 20}', info))
+    return samples
+
+
+def main():
+    samples = make_samples(SERVERS)
+    start = time.perf_counter()
+    for _ in range(ROUNDS):
+        summarize(samples)
+    elapsed = (time.perf_counter() - start) / ROUNDS
+    print(f'summarize {SERVERS} servers: {elapsed * 1000:.2f} ms')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,4 @@
+from .rules import parse_rule, Condition, RuleError
+from .engine import AlertEngine, AlertEvent
+
+alert_engine = AlertEngine()
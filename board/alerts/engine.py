@@ -0,0 +1,225 @@
+"""告警引擎模块
+
+告警引擎注册为后台采集器的监听函数，每轮采集结束后逐个样本评估告警规则
+规则按服务器 ID 建立索引，每个样本只评估适用于该服务器的规则
+每条规则在每个服务器上的状态单独记录，只有状态变化时才发送通知：
+
+- 条件满足并持续 duration 秒后进入告警状态，发送告警通知
+- 已告警的规则使用回差判断是否恢复，恢复后发送恢复通知
+- 同一规则在同一服务器上的告警通知至少间隔 ALERT_MIN_INTERVAL 秒
+  因间隔不足而未发送的告警，间隔足够时如果仍处于告警状态则补发
+- 通知只发送给绑定了微信的管理员，或者 ALERT_RECIPIENTS 中列出的用户
+"""
+
+import threading
+from datetime import datetime
+from collections import namedtuple
+
+from ..models import db, User, Server, AlertRule
+from ..wx import wx_outbox
+
+
+# 状态变化事件，status 为 'firing' 或 'resolved'
+AlertEvent = namedtuple('AlertEvent',
+        'rule_id rule_name expression server_id status timestamp value')
+
+
+class AlertState:
+    """某条规则在某个服务器上的状态
+    """
+
+    __slots__ = ('pending_since', 'firing', 'notified', 'last_notified',
+            'since', 'value')
+
+    def __init__(self):
+        # 条件开始满足的时间戳，条件不满足时为 None
+        self.pending_since = None
+        self.firing = False
+        # 本次告警是否已经发送了通知
+        self.notified = False
+        self.last_notified = None
+        # 进入告警状态的时间戳
+        self.since = None
+        self.value = None
+
+
+class AlertEngine:
+    """告警规则评估引擎
+    """
+
+    def __init__(self, app=None):
+        self.hysteresis = 0.05
+        self.min_interval = 300
+        self.template_id = None
+        # 接收通知的用户名列表，None 表示全部管理员
+        self.recipients = None
+        # 规则索引，键是服务器 ID ，None 对应适用于全部服务器的规则
+        # 值是 (规则 ID, 规则名, 规则字符串, Condition 对象) 元组
+        self._rules = None
+        self._states = {}
+        self._lock = threading.Lock()
+        if app:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """根据配置项设置回差和通知间隔，并在采集器中注册监听函数
+        """
+        config = app.config
+        self.hysteresis = config.get('ALERT_HYSTERESIS', 0.05)
+        self.min_interval = config.get('ALERT_MIN_INTERVAL', 300)
+        self.template_id = config.get('WX_ALERT_TEMPLATE_ID')
+        self.recipients = config.get('ALERT_RECIPIENTS')
+        with self._lock:
+            self._rules = None
+            self._states.clear()
+        app.extensions['alert_engine'] = self
+        if config.get('ALERTS_ENABLED', True):
+            app.extensions['metrics_collector'].add_listener(self.evaluate)
+
+    def reload(self):
+        """告警规则被修改后调用，下次评估前重新加载规则
+        """
+        self._rules = None
+
+    def load_rules(self):
+        """从数据库中加载启用的告警规则并建立索引，须在应用上下文中调用
+        """
+        rules = {}
+        for rule in AlertRule.query.filter_by(enabled=True):
+            item = (rule.id, rule.name, rule.expression, rule.condition)
+            rules.setdefault(rule.server_id, []).append(item)
+        rule_ids = {item[0] for items in rules.values() for item in items}
+        with self._lock:
+            # 移除已被删除或禁用的规则的状态
+            for key in [key for key in self._states if key[0] not in rule_ids]:
+                del self._states[key]
+            self._rules = {key: tuple(items) for key, items in rules.items()}
+        return self._rules
+
+    def evaluate(self, samples):
+        """评估一轮采集的全部样本，须在应用上下文中调用
+
+        Args:
+            samples (list): 元素是 (服务器 ID, 时间戳, INFO 字典)
+
+        Return:
+            list: 本轮产生的需要通知的 AlertEvent
+        """
+        rules = self._rules if self._rules is not None else self.load_rules()
+        common = rules.get(None, ())
+        events = []
+        with self._lock:
+            for server_id, timestamp, info in samples:
+                for rule in rules.get(server_id, ()) + common:
+                    event = self.check(rule, server_id, timestamp, info)
+                    if event is not None:
+                        events.append(event)
+        if events:
+            self.notify(events)
+        return events
+
+    def check(self, rule, server_id, timestamp, info):
+        """评估一条规则，状态变化且需要通知时返回 AlertEvent ，调用者须持有锁
+        """
+        rule_id, name, expression, condition = rule
+        key = (rule_id, server_id)
+        state = self._states.get(key)
+        if state is None:
+            state = self._states[key] = AlertState()
+        value = None
+        if info is not None and not condition.unreachable:
+            value = info.get(condition.field)
+
+        if not state.firing:
+            if not condition.check(info):
+                state.pending_since = None
+                return None
+            if state.pending_since is None:
+                state.pending_since = timestamp
+            if timestamp - state.pending_since < condition.duration:
+                return None
+            state.firing = True
+            state.since = timestamp
+            state.value = value
+            # 频繁告警时，距离上次通知不足 min_interval 秒则不发送通知
+            last = state.last_notified
+            if last is not None and timestamp - last < self.min_interval:
+                state.notified = False
+                return None
+            state.notified = True
+            state.last_notified = timestamp
+            return AlertEvent(rule_id, name, expression, server_id, 'firing',
+                    timestamp, value)
+
+        state.value = value
+        # 已告警的规则使用回差判断是否恢复，无法判断时保持告警状态
+        if condition.check(info, self.hysteresis) is not False:
+            # 进入告警状态时因间隔不足没有通知，间隔足够后补发
+            if state.notified or \
+                    timestamp - state.last_notified < self.min_interval:
+                return None
+            state.notified = True
+            state.last_notified = timestamp
+            return AlertEvent(rule_id, name, expression, server_id, 'firing',
+                    timestamp, value)
+        state.firing = False
+        state.pending_since = None
+        state.since = None
+        # 没有发送告警通知的告警，恢复时也不发送通知
+        if not state.notified:
+            return None
+        state.notified = False
+        return AlertEvent(rule_id, name, expression, server_id, 'resolved',
+                timestamp, value)
+
+    def active(self):
+        """当前处于告警状态的规则
+
+        Return:
+            list: 元素是字典，包括规则 ID 、服务器 ID 、告警开始时间和当前值
+        """
+        with self._lock:
+            return [{'rule_id': rule_id, 'server_id': server_id,
+                'since': state.since, 'value': state.value}
+                for (rule_id, server_id), state in self._states.items()
+                if state.firing]
+
+    def notify(self, events):
+        """通过微信公众号向接收通知的用户发送通知
+
+        没有配置 ALERT_RECIPIENTS 时发送给全部绑定了微信的管理员
+        """
+        names = dict(db.session.query(Server.id, Server.name))
+        query = db.session.query(User.wx_id).filter(User.wx_id.isnot(None))
+        if self.recipients is None:
+            query = query.filter(User.is_admin.is_(True))
+        else:
+            query = query.filter(User.name.in_(self.recipients))
+        users = [wx_id for wx_id, in query]
+        for event in events:
+            for wx_id in users:
+                self.send(wx_id, event,
+                        names.get(event.server_id, event.server_id))
+
+    def send(self, wx_id, event, server_name):
+        """发送一条通知，配置了模板 ID 时发送模板消息，否则发送客服消息
+
+        通知放入微信出站队列，采集线程不等待微信 API 返回
+        """
+        title = '告警' if event.status == 'firing' else '恢复'
+        time = datetime.fromtimestamp(event.timestamp).strftime(
+                '%Y-%m-%d %H:%M:%S')
+        if self.template_id:
+            data = {
+                'first': {'value': f'Redis Board {title}：{event.rule_name}'},
+                'keyword1': {'value': str(server_name)},
+                'keyword2': {'value': event.expression},
+                'keyword3': {'value': time},
+                'remark': {'value': f'当前值：{event.value}'},
+            }
+            wx_outbox.put('message.send_template', wx_id, self.template_id,
+                    data)
+        else:
+            content = (f'[{title}] {event.rule_name}\n服务器：{server_name}\n'
+                    f'规则：{event.expression}\n当前值：{event.value}\n{time}')
+            wx_outbox.put('message.send_text', wx_id, content)
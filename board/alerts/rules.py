@@ -0,0 +1,123 @@
+"""告警规则解析模块
+
+告警规则是一个字符串，例如：
+
+    used_memory > 80% maxmemory for 2m      内存使用量超过最大内存的 80% 持续 2 分钟
+    connected_clients > 1000                客户端连接数超过 1000
+    used_memory >= 2gb for 30s              内存使用量达到 2GB 持续 30 秒
+    unreachable for 1m                      服务器持续 1 分钟无法连接
+
+规则在保存时解析为 Condition 对象，评估时不再解析字符串
+"""
+
+import re
+import operator
+from collections import namedtuple
+
+
+OPERATORS = {
+        '>': operator.gt,
+        '>=': operator.ge,
+        '<': operator.lt,
+        '<=': operator.le,
+        '==': operator.eq,
+        '!=': operator.ne,
+}
+
+# 数值的单位
+UNITS = {'': 1, 'kb': 1024, 'mb': 1024 ** 2, 'gb': 1024 ** 3}
+# 持续时间的单位
+DURATIONS = {'s': 1, 'm': 60, 'h': 3600}
+
+_pattern = re.compile(r'''
+    ^(?:
+        (?P<unreachable>unreachable)
+        |
+        (?P<field>[a-z_][a-z0-9_]*)\s*
+        (?P<op>>=|<=|==|!=|>|<)\s*
+        (?P<value>\d+(?:\.\d+)?)
+        (?:(?P<percent>%)\s*(?P<ref>[a-z_][a-z0-9_]*)|(?P<unit>kb|mb|gb)?)
+    )
+    (?:\s+for\s+(?P<duration>\d+)(?P<duration_unit>[smh]))?$
+''', re.VERBOSE)
+
+
+class RuleError(ValueError):
+    """无效的告警规则
+    """
+
+    pass
+
+
+class Condition(namedtuple('Condition', 'field op threshold ref duration')):
+    """解析后的告警条件
+
+    field 为 None 表示服务器无法连接的条件
+    ref 不为 None 时，阈值为 threshold 乘以监控数据中 ref 字段的值
+    duration 是条件需要持续满足的秒数
+    """
+
+    __slots__ = ()
+
+    @property
+    def unreachable(self):
+        return self.field is None
+
+    def limit(self, info):
+        """根据监控数据计算实际的阈值，无法计算时返回 None
+        """
+        if self.ref is None:
+            return self.threshold
+        base = info.get(self.ref)
+        # 例如 maxmemory 为 0 表示不限制内存，此时规则不适用
+        if not isinstance(base, (int, float)) or not base:
+            return None
+        return self.threshold * base
+
+    def check(self, info, hysteresis=0.0):
+        """检查监控数据是否满足条件
+
+        Args:
+            info (dict): INFO 数据，None 表示服务器无法连接
+            hysteresis (float): 回差比例，大于 0 时阈值向不满足条件的方向移动
+                                用于判断已触发的告警是否恢复，避免数值在阈值附近波动时反复告警
+
+        Return:
+            bool: 是否满足条件，无法判断时返回 None
+        """
+        if self.unreachable:
+            return info is None
+        if info is None:
+            return None
+        value = info.get(self.field)
+        if not isinstance(value, (int, float)):
+            return None
+        if (limit := self.limit(info)) is None:
+            return None
+        if self.op in ('>', '>='):
+            limit *= 1 - hysteresis
+        elif self.op in ('<', '<='):
+            limit *= 1 + hysteresis
+        return OPERATORS[self.op](value, limit)
+
+
+def parse_rule(expression):
+    """将告警规则字符串解析为 Condition 对象
+
+    Raise:
+        RuleError: 规则格式无效
+    """
+    match = _pattern.match(expression.strip().lower())
+    if match is None:
+        raise RuleError(f'Invalid rule: {expression}.')
+    duration = 0
+    if match['duration']:
+        duration = int(match['duration']) * DURATIONS[match['duration_unit']]
+    if match['unreachable']:
+        return Condition(None, None, None, None, duration)
+    value = float(match['value'])
+    if match['percent']:
+        return Condition(match['field'], match['op'], value / 100,
+                match['ref'], duration)
+    value *= UNITS[match['unit'] or '']
+    return Condition(match['field'], match['op'], value, None, duration)
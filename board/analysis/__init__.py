@@ -0,0 +1,6 @@
+from .jobs import Job, JobRunner
+from .keyspace import PrefixTrie, scan_keyspace
+from .bigkeys import BigKeysResult, TopKeys, find_bigkeys
+from .monitor import MonitorResult, SpaceSaving, sample_monitor
+
+job_runner = JobRunner()
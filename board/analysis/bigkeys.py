@@ -0,0 +1,180 @@
+"""大键和热键分析
+
+使用 SCAN 命令逐批遍历键，按采样率抽取一部分键，先用管道执行 TYPE 命令获取类型
+再用管道执行 MEMORY USAGE 和对应类型的长度命令（STRLEN 、HLEN 等）
+内存淘汰策略是 LFU 时还会执行 OBJECT FREQ 获取访问频率，用来找出热键
+
+每项指标只用一个容量为 N 的最小堆保存最大的 N 个键
+无论服务器上有多少个键，分析任务占用的内存都是固定的
+采样按键名的 CRC32 值决定，同一个键在任务停止后继续执行时的采样结果不变
+"""
+
+import time
+import heapq
+import zlib
+import threading
+
+
+# 每种类型的键获取元素个数的命令
+LENGTH_COMMANDS = {
+        'string': 'STRLEN',
+        'hash': 'HLEN',
+        'list': 'LLEN',
+        'set': 'SCARD',
+        'zset': 'ZCARD',
+        'stream': 'XLEN',
+}
+
+
+class TopKeys:
+    """保存分数最大的 N 个键的最小堆
+    """
+
+    def __init__(self, size):
+        self.size = size
+        # 元素是 (分数, 键名, 附加信息) ，堆顶是分数最小的键
+        self._heap = []
+
+    def push(self, score, key, extra=None):
+        item = (score, key, extra)
+        if len(self._heap) < self.size:
+            heapq.heappush(self._heap, item)
+        elif score > self._heap[0][0]:
+            heapq.heapreplace(self._heap, item)
+
+    def items(self):
+        """按分数从大到小排列的 (分数, 键名, 附加信息) 列表
+        """
+        return sorted(self._heap, reverse=True)
+
+    def __len__(self):
+        return len(self._heap)
+
+
+class BigKeysResult:
+    """大键和热键分析结果
+
+    Args:
+        top (int): 每项指标保存的键数
+    """
+
+    def __init__(self, top=20):
+        self.top = top
+        self.sampled = 0
+        # 内存淘汰策略，为 LFU 策略时才能获取访问频率
+        self.policy = None
+        self.hot_enabled = False
+        self.memory = TopKeys(top)
+        # 每种类型分别保存元素最多的键
+        self.length = {name: TopKeys(top) for name in LENGTH_COMMANDS}
+        self.hot = TopKeys(top)
+        self._lock = threading.Lock()
+
+    def add(self, key, key_type, memory, length, freq):
+        with self._lock:
+            self.sampled += 1
+            if memory is not None:
+                self.memory.push(memory, key, key_type)
+            if length is not None and key_type in self.length:
+                self.length[key_type].push(length, key)
+            if freq is not None:
+                self.hot.push(freq, key, key_type)
+
+    def to_dict(self):
+        with self._lock:
+            return {
+                'sampled': self.sampled,
+                'policy': self.policy,
+                'memory': [{'key': key, 'type': key_type, 'memory': memory}
+                    for memory, key, key_type in self.memory.items()],
+                'length': {name: [{'key': key, 'length': length}
+                    for length, key, _ in heap.items()]
+                    for name, heap in self.length.items() if len(heap)},
+                'hot': [{'key': key, 'type': key_type, 'freq': freq}
+                    for freq, key, key_type in self.hot.items()]
+                    if self.hot_enabled else None,
+            }
+
+
+def _text(value):
+    if isinstance(value, bytes):
+        return value.decode('utf-8', errors='replace')
+    return value
+
+
+def _number(value):
+    return value if isinstance(value, int) else None
+
+
+def sampled(key, rate):
+    """根据键名的 CRC32 值判断是否抽取该键
+    """
+    if rate >= 1:
+        return True
+    if isinstance(key, str):
+        key = key.encode()
+    return zlib.crc32(key) % 10000 < rate * 10000
+
+
+def find_bigkeys(client, job):
+    """在后台线程中运行的大键和热键分析任务
+
+    Args:
+        client (object): Redis 客户端
+        job (object): 任务对象，job.result 是 BigKeysResult 实例
+                      job.params 包括 match 、count 、sample_rate 、hot 和 max_ops
+    """
+    params = job.params
+    result = job.result
+    rate = params['sample_rate']
+    max_ops = params['max_ops']
+    if params.get('hot') and result.policy is None:
+        result.policy = client.info('memory').get('maxmemory_policy')
+        # 只有 LFU 淘汰策略下 OBJECT FREQ 命令才可用
+        result.hot_enabled = 'lfu' in (result.policy or '')
+    while not job.stopping:
+        started = time.monotonic()
+        cursor, keys = client.scan(job.cursor, match=params.get('match'),
+                count=params['count'])
+        job.scanned += len(keys)
+        keys = [key for key in keys if sampled(key, rate)]
+        ops = 1
+        if keys:
+            ops += analyze(client, keys, result)
+        job.cursor = cursor
+        job.updated_at = time.time()
+        if cursor == 0 or job.throttle(started, ops, max_ops):
+            return
+
+
+def analyze(client, keys, result):
+    """分析一批键，返回执行的命令数
+    """
+    pipe = client.pipeline(transaction=False)
+    for key in keys:
+        pipe.type(key)
+    types = [_text(key_type) for key_type in
+            pipe.execute(raise_on_error=False)]
+    # 已经被删除的键类型是 none ，其它未知类型（例如模块类型）只统计内存
+    items = [(key, key_type) for key, key_type in zip(keys, types)
+            if isinstance(key_type, str) and key_type != 'none']
+    pipe = client.pipeline(transaction=False)
+    for key, key_type in items:
+        pipe.memory_usage(key)
+        if (command := LENGTH_COMMANDS.get(key_type)):
+            pipe.execute_command(command, key)
+        if result.hot_enabled:
+            pipe.execute_command('OBJECT', 'FREQ', key)
+    values = iter(pipe.execute(raise_on_error=False))
+    ops = len(keys)
+    # 按照放入管道的顺序依次取出每个键的结果
+    for key, key_type in items:
+        memory = _number(next(values))
+        length = freq = None
+        if key_type in LENGTH_COMMANDS:
+            length = _number(next(values))
+        if result.hot_enabled:
+            freq = _number(next(values))
+        result.add(_text(key), key_type, memory, length, freq)
+        ops += 1 + (key_type in LENGTH_COMMANDS) + result.hot_enabled
+    return ops
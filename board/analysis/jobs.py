@@ -0,0 +1,179 @@
+"""后台分析任务
+
+键空间分析之类的任务要遍历 Redis 服务器的全部键，耗时很长，不能在请求中执行
+JobRunner 在后台线程池中运行任务，每个服务器的每种任务同时只有一个
+任务对象保存进度和中间结果，停止后可以从上次的游标继续执行
+"""
+
+import time
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from redis import StrictRedis
+
+from ..common.pools import redis_pools
+
+
+logger = logging.getLogger(__name__)
+
+
+class Job:
+    """后台任务
+
+    state 的值是：
+    pending 等待运行，running 正在运行，stopped 已停止，done 已完成，failed 失败
+    """
+
+    def __init__(self, kind, server_id, params, result):
+        self.kind = kind
+        self.server_id = server_id
+        self.params = params
+        # 中间结果和最终结果，须实现 to_dict 方法
+        self.result = result
+        self.state = 'pending'
+        # SCAN 命令的游标，0 表示从头开始
+        self.cursor = 0
+        self.scanned = 0
+        self.error = None
+        self.started_at = None
+        self.updated_at = None
+        self.finished_at = None
+        self._stop = threading.Event()
+
+    @property
+    def active(self):
+        return self.state in ('pending', 'running')
+
+    @property
+    def stopping(self):
+        return self._stop.is_set()
+
+    def stop(self):
+        self._stop.set()
+
+    def wait(self, seconds):
+        """等待一段时间，任务被停止时立即返回 True
+        """
+        return self._stop.wait(seconds)
+
+    def throttle(self, started, ops, max_ops):
+        """限制每秒执行的命令数，任务被停止时返回 True
+
+        Args:
+            started (float): 本批命令开始执行的时间，time.monotonic() 的返回值
+            ops (int): 本批执行的命令数
+            max_ops (int): 每秒最多执行的命令数
+        """
+        delay = ops / max_ops - (time.monotonic() - started)
+        if delay > 0:
+            return self.wait(delay)
+        return self.stopping
+
+    def to_dict(self, result=True):
+        """转换为字典，result 为 False 时不包括分析结果
+        """
+        data = {
+            'kind': self.kind,
+            'server_id': self.server_id,
+            'state': self.state,
+            'params': self.params,
+            'cursor': self.cursor,
+            'scanned': self.scanned,
+            'error': self.error,
+            'started_at': self.started_at,
+            'updated_at': self.updated_at,
+            'finished_at': self.finished_at,
+        }
+        if result:
+            data['result'] = self.result.to_dict()
+        return data
+
+
+class JobRunner:
+    """在后台线程池中运行分析任务
+    """
+
+    def __init__(self, app=None):
+        self.max_jobs = 2
+        self._jobs = {}
+        self._executor = None
+        self._lock = threading.Lock()
+        if app:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.max_jobs = app.config.get('ANALYSIS_MAX_JOBS', 2)
+        with self._lock:
+            for job in self._jobs.values():
+                job.stop()
+            self._jobs.clear()
+        app.extensions['job_runner'] = self
+
+    def get(self, kind, server_id):
+        """获取某个服务器最近一次的某种任务，不存在则返回 None
+        """
+        return self._jobs.get((kind, server_id))
+
+    def submit(self, kind, server, task, params, result, resume=False):
+        """创建并提交任务
+
+        Args:
+            kind (str): 任务类型，例如 'keyspace'
+            server (object): Server 实例
+            task (function): 任务函数，参数是 Redis 客户端和任务对象
+            params (dict): 任务参数，resume 为 True 时使用上次任务的参数
+            result (object): 保存结果的对象，resume 为 True 时使用上次任务的结果
+            resume (bool): 从上次停止的位置继续执行
+
+        Return:
+            tuple: (任务对象, 是否是新提交的任务)
+                   该服务器已有正在运行的同类任务时返回该任务
+        """
+        key = (kind, server.id)
+        with self._lock:
+            previous = self._jobs.get(key)
+            if previous is not None and previous.active:
+                return previous, False
+            if resume and previous is not None and previous.state != 'done':
+                job = Job(kind, server.id, previous.params, previous.result)
+                job.cursor = previous.cursor
+                job.scanned = previous.scanned
+                job.started_at = previous.started_at
+            else:
+                job = Job(kind, server.id, params, result)
+                job.cursor = params.get('cursor', 0)
+            self._jobs[key] = job
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_jobs,
+                        thread_name_prefix='board-analysis')
+        # 在当前线程中读取映射类实例的属性，工作线程只接触连接池
+        self._executor.submit(self._run, job, task, server.pool_key)
+        return job, True
+
+    def stop(self, kind, server_id):
+        """停止任务，已扫描的结果和游标保留，可以继续执行
+        """
+        job = self._jobs.get((kind, server_id))
+        if job is not None and job.active:
+            job.stop()
+        return job
+
+    @staticmethod
+    def _run(job, task, pool_key):
+        if job.stopping:
+            job.state = 'stopped'
+            return
+        job.state = 'running'
+        job.started_at = job.started_at or time.time()
+        try:
+            # 任务运行期间连接池不会因为空闲超时被断开
+            with redis_pools.hold(*pool_key) as pool:
+                task(StrictRedis(connection_pool=pool), job)
+        except Exception as e:
+            logger.exception('Analysis job %s of server %s failed.',
+                    job.kind, job.server_id)
+            job.state = 'failed'
+            job.error = str(e)
+        else:
+            job.state = 'stopped' if job.stopping else 'done'
+        job.updated_at = job.finished_at = time.time()
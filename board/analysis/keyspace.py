@@ -0,0 +1,148 @@
+"""键空间分析
+
+使用 SCAN 命令逐批遍历全部键，每批键使用管道执行 MEMORY USAGE 、TYPE 和 TTL 命令
+再按分隔符把键名拆分为前缀，累加到前缀树中，得到每个前缀的键数和内存用量
+例如分隔符是 ':' 时，键 'user:42:profile' 累加到前缀 'user:' 和 'user:42:'
+
+扫描时按 max_ops 限制每秒对 Redis 服务器执行的命令数，避免影响线上服务
+"""
+
+import time
+import threading
+
+
+# 某个节点的子节点过多时，新出现的前缀都累加到这个节点
+OVERFLOW = '*'
+
+
+class PrefixNode:
+    """前缀树的节点
+    """
+
+    __slots__ = ('keys', 'memory', 'no_ttl', 'types', 'children')
+
+    def __init__(self):
+        self.keys = 0
+        self.memory = 0
+        # 没有设置过期时间的键数
+        self.no_ttl = 0
+        self.types = {}
+        self.children = {}
+
+    def add(self, memory, key_type, ttl):
+        self.keys += 1
+        self.memory += memory
+        if ttl == -1:
+            self.no_ttl += 1
+        self.types[key_type] = self.types.get(key_type, 0) + 1
+
+
+class PrefixTrie:
+    """按键名前缀汇总键数和内存用量的前缀树
+
+    Args:
+        delimiter (str): 键名中的分隔符
+        depth (int): 最多汇总几级前缀
+        max_children (int): 每个节点最多保存的子节点数
+                            键名中包含 ID 之类的部分时，避免前缀树占用过多内存
+    """
+
+    def __init__(self, delimiter=':', depth=3, max_children=1000):
+        self.delimiter = delimiter
+        self.depth = depth
+        self.max_children = max_children
+        self.root = PrefixNode()
+        # 扫描线程写入的同时，请求线程可能在读取
+        self._lock = threading.Lock()
+
+    def add(self, key, memory, key_type, ttl):
+        """累加一个键
+        """
+        # 最后一部分是键名自身，不是前缀
+        parts = key.split(self.delimiter, self.depth)[:-1]
+        with self._lock:
+            node = self.root
+            node.add(memory, key_type, ttl)
+            for part in parts:
+                child = node.children.get(part)
+                if child is None:
+                    if len(node.children) >= self.max_children:
+                        part = OVERFLOW
+                    child = node.children.setdefault(part, PrefixNode())
+                child.add(memory, key_type, ttl)
+                node = child
+
+    def to_dict(self, limit=20):
+        """转换为字典，每个节点只保留内存用量最大的 limit 个子节点
+        """
+        with self._lock:
+            return self._node_dict('', self.root, limit)
+
+    def _node_dict(self, prefix, node, limit):
+        children = sorted(node.children.items(),
+                key=lambda item: item[1].memory, reverse=True)
+        return {
+            'prefix': prefix,
+            'keys': node.keys,
+            'memory': node.memory,
+            'no_ttl': node.no_ttl,
+            'types': dict(node.types),
+            'children': [self._node_dict(
+                f'{prefix}{part}{self.delimiter}', child, limit)
+                for part, child in children[:limit]],
+            # 因数量限制没有返回的子节点数
+            'truncated': max(len(children) - limit, 0),
+        }
+
+
+def _text(value):
+    if isinstance(value, bytes):
+        return value.decode('utf-8', errors='replace')
+    return value
+
+
+def scan_keyspace(client, job):
+    """在后台线程中运行的键空间分析任务
+
+    Args:
+        client (object): Redis 客户端
+        job (object): 任务对象，job.result 是 PrefixTrie 实例
+                      job.params 包括 match 、count 、samples 和 max_ops
+    """
+    params = job.params
+    trie = job.result
+    match = params.get('match')
+    count = params['count']
+    samples = params.get('samples')
+    max_ops = params['max_ops']
+    while not job.stopping:
+        started = time.monotonic()
+        cursor, keys = client.scan(job.cursor, match=match, count=count)
+        if keys:
+            pipe = client.pipeline(transaction=False)
+            for key in keys:
+                pipe.memory_usage(key, samples)
+                pipe.type(key)
+                pipe.ttl(key)
+            # 键在 SCAN 之后可能被删除或者 Redis 版本不支持 MEMORY 命令
+            # 单个命令出错不影响其它结果
+            results = pipe.execute(raise_on_error=False)
+            for i, key in enumerate(keys):
+                memory, key_type, ttl = results[i * 3:i * 3 + 3]
+                key_type = _text(key_type)
+                # 已经被删除的键类型是 none
+                if isinstance(key_type, Exception) or key_type == 'none':
+                    continue
+                if not isinstance(memory, int):
+                    memory = 0
+                if not isinstance(ttl, int):
+                    ttl = -1
+                trie.add(_text(key), memory, key_type, ttl)
+        job.cursor = cursor
+        job.scanned += len(keys)
+        job.updated_at = time.time()
+        if cursor == 0:
+            return
+        # 本批执行了 1 条 SCAN 命令和每个键 3 条命令，按 max_ops 计算需要等待的时间
+        if job.throttle(started, 1 + len(keys) * 3, max_ops):
+            return
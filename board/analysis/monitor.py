@@ -0,0 +1,138 @@
+"""MONITOR 命令采样
+
+MONITOR 命令会把服务器执行的每条命令都发送给客户端，对服务器有明显的性能影响
+所以采样任务有最长时间和最多命令数两项限制，达到任一限制即断开连接
+
+命令名和键名前缀分别使用 Space-Saving 算法统计出现次数最多的若干项
+无论采样期间收到多少条命令，占用的内存都是固定的
+"""
+
+import time
+import threading
+
+
+# 第一个参数不是键名的命令，不统计键名前缀
+KEYLESS_COMMANDS = frozenset((
+        'AUTH', 'BGREWRITEAOF', 'BGSAVE', 'CLIENT', 'CLUSTER', 'COMMAND',
+        'CONFIG', 'DBSIZE', 'DEBUG', 'DISCARD', 'ECHO', 'EVAL', 'EVALSHA',
+        'EXEC', 'FLUSHALL', 'FLUSHDB', 'HELLO', 'INFO', 'LASTSAVE', 'LATENCY',
+        'MEMORY', 'MODULE', 'MULTI', 'OBJECT', 'PING', 'PSUBSCRIBE',
+        'PUBLISH', 'PUBSUB', 'PUNSUBSCRIBE', 'QUIT', 'RANDOMKEY', 'READONLY',
+        'REPLCONF', 'ROLE', 'SAVE', 'SCAN', 'SCRIPT', 'SELECT', 'SLOWLOG',
+        'SUBSCRIBE', 'SWAPDB', 'TIME', 'UNSUBSCRIBE', 'UNWATCH', 'WAIT',
+        'XGROUP', 'XINFO', 'XREAD', 'XREADGROUP',
+))
+
+
+class SpaceSaving:
+    """Space-Saving 算法，在固定内存中统计出现次数最多的元素
+
+    最多保存 size 个元素，已满时新元素替换次数最少的元素，并继承其次数
+    继承的次数是该元素次数的误差上界，真实次数在 count - error 和 count 之间
+    出现次数超过 total / size 的元素一定会被保存
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self.total = 0
+        # 键是元素，值是 [次数, 误差]
+        self._counters = {}
+
+    def add(self, item, count=1):
+        self.total += count
+        counter = self._counters.get(item)
+        if counter is not None:
+            counter[0] += count
+        elif len(self._counters) < self.size:
+            self._counters[item] = [count, 0]
+        else:
+            victim = min(self._counters, key=lambda k: self._counters[k][0])
+            floor = self._counters.pop(victim)[0]
+            self._counters[item] = [floor + count, floor]
+
+    def items(self, limit=None):
+        """按次数从大到小排列的 (元素, 次数, 误差) 列表
+        """
+        items = sorted(((item, count, error) for item, (count, error)
+                in self._counters.items()), key=lambda x: x[1], reverse=True)
+        return items[:limit]
+
+    def __len__(self):
+        return len(self._counters)
+
+
+def key_prefix(key, delimiter):
+    """键名中第一个分隔符及其之前的部分，没有分隔符时返回键名自身
+    """
+    head, sep, _ = key.partition(delimiter)
+    return head + sep
+
+
+class MonitorResult:
+    """MONITOR 采样结果
+
+    Args:
+        size (int): 命令名和键名前缀各自最多保存的项数
+        delimiter (str): 键名中的分隔符
+    """
+
+    def __init__(self, size=200, delimiter=':'):
+        self.delimiter = delimiter
+        self.commands = SpaceSaving(size)
+        self.prefixes = SpaceSaving(size)
+        self._lock = threading.Lock()
+
+    @property
+    def sampled(self):
+        return self.commands.total
+
+    def add(self, line):
+        """统计一条 MONITOR 输出的命令，例如 'SET user:1 foo'
+        """
+        if not line:
+            return
+        command, _, args = line.partition(' ')
+        command = command.upper()
+        with self._lock:
+            self.commands.add(command)
+            if args and command not in KEYLESS_COMMANDS:
+                key = args.partition(' ')[0]
+                self.prefixes.add(key_prefix(key, self.delimiter))
+
+    def to_dict(self, limit=20):
+        with self._lock:
+            return {
+                'sampled': self.sampled,
+                'commands': [{'command': command, 'count': count,
+                    'error': error} for command, count, error
+                    in self.commands.items(limit)],
+                'prefixes': [{'prefix': prefix, 'count': count,
+                    'error': error} for prefix, count, error
+                    in self.prefixes.items(limit)],
+            }
+
+
+def sample_monitor(client, job):
+    """在后台线程中运行的 MONITOR 采样任务
+
+    Args:
+        client (object): Redis 客户端
+        job (object): 任务对象，job.result 是 MonitorResult 实例
+                      job.params 包括 duration 和 max_commands
+    """
+    params = job.params
+    result = job.result
+    deadline = time.monotonic() + params['duration']
+    # 退出 with 语句时断开该连接，不会把处于 MONITOR 状态的连接放回连接池
+    with client.monitor() as monitor:
+        connection = monitor.connection
+        while not job.stopping and result.sampled < params['max_commands']:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return
+            # 每次最多等待 1 秒，以便及时响应停止请求
+            if not connection.can_read(timeout=min(remaining, 1)):
+                continue
+            result.add(monitor.next_command()['command'])
+            job.scanned += 1
+            job.updated_at = time.time()
@@ -3,8 +3,13 @@ from flask import Flask
 
 from .config import configs
 from .models import db
+from .common.pools import redis_pools
+from .common.cache import token_cache
+from .metrics import collector, store, broadcaster, replication
+from .alerts import alert_engine
+from .analysis import job_runner
 from .views import api
-from .wx import wx_dispatcher
+from .wx import wx_dispatcher, wx_outbox
 
 
 def create_app():
@@ -29,9 +34,30 @@ def create_app():
     # 键是 'sqlalchemy' ，值是 flask_sqlalchemy.__init__._SQLAlchemyState 类的实例
     # 该实例的 db 属性值就是这个 db ，connectors 属性值是空字典
     db.init_app(app)
+
+    # 根据配置项设置 Redis 连接池注册表的最大连接数、空闲超时等参数
+    redis_pools.init_app(app)
+
+    # 缓存验证通过的 token ，避免每个请求都验证签名和查询数据库
+    token_cache.init_app(app)
+
+    # 后台采集器定时获取全部服务器的监控数据，生产环境默认开启
+    collector.init_app(app)
+    # 每轮采集的数据写入单独的 metrics 数据库，并自动汇总和清理
+    store.init_app(app)
+    # 每轮采集的数据以增量事件的形式推送给订阅者
+    broadcaster.init_app(app)
+    # 根据每轮采集的数据跟踪主从关系和复制延迟
+    replication.init_app(app)
+    # 告警引擎在每轮采集后评估告警规则，状态变化时发送微信通知
+    alert_engine.init_app(app)
+    # 键空间分析等耗时较长的任务在后台线程池中运行
+    job_runner.init_app(app)
     
     # 这步操作用于创建微信客户端以及注册消息处理器，其中用到了 app 的配置项
     wx_dispatcher.init_app(app)
+    # 调用微信 API 的操作放入出站队列，由后台线程限速、合并和重试
+    wx_outbox.init_app(app)
 
     # 如果是开发环境则创建所有数据库表
     if app.debug:
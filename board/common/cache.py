@@ -0,0 +1,108 @@
+"""缓存模块
+
+LRUCache 是线程安全的、带过期时间的定长缓存
+TokenCache 使用 LRUCache 缓存已经验证过的 token 和对应的用户信息
+"""
+
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from flask import current_app
+
+
+class LRUCache:
+    """带过期时间的最近最少使用缓存
+    """
+
+    def __init__(self, maxsize=1024, ttl=60):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        # 值是 (过期时间戳, 缓存对象) 元组，最近使用的放在最后
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        """获取缓存对象，不存在或已过期则返回 default
+        """
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return default
+            expire_at, value = item
+            if expire_at <= time.time():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, expire_at=None):
+        """添加缓存对象
+
+        Args:
+            expire_at (float): 过期时间戳，不能晚于 ttl 秒之后
+        """
+        deadline = time.time() + self.ttl
+        expire_at = deadline if expire_at is None else min(expire_at, deadline)
+        with self._lock:
+            self._data[key] = (expire_at, value)
+            self._data.move_to_end(key)
+            # 超出容量时移除最久未被使用的缓存对象
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def remove_if(self, predicate):
+        """移除满足条件的全部缓存对象
+        """
+        with self._lock:
+            keys = [key for key, (_, value) in self._data.items()
+                    if predicate(value)]
+            for key in keys:
+                del self._data[key]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class TokenCache:
+    """缓存验证通过的 token 及其对应的用户信息
+
+    每个应用拥有自己的缓存，键是 token 的摘要，值是用户快照
+    """
+
+    def __init__(self, app=None):
+        if app:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.extensions['token_cache'] = LRUCache(
+                app.config.get('TOKEN_CACHE_SIZE', 1024),
+                app.config.get('TOKEN_CACHE_TTL', 60))
+
+    @property
+    def cache(self):
+        return current_app.extensions['token_cache']
+
+    @staticmethod
+    def digest(token):
+        """计算 token 的摘要，避免在内存中长期保存 token 原文
+        """
+        return hashlib.sha256(token.encode()).hexdigest()
+
+    def get(self, token):
+        return self.cache.get(self.digest(token))
+
+    def set(self, token, user, expire_at=None):
+        self.cache.set(self.digest(token), user, expire_at)
+
+    def invalidate_user(self, user_id):
+        """用户被修改或删除后，移除该用户全部 token 的缓存
+        """
+        self.cache.remove_if(lambda user: user.id == user_id)
+
+
+token_cache = TokenCache()
@@ -0,0 +1,122 @@
+"""列表 API 的分页、过滤和字段筛选
+
+分页使用游标（keyset）方式：按主键排序，游标是上一页最后一条记录的 ID
+无论翻到第几页，数据库都只需要按主键索引定位，不会像 OFFSET 那样越往后越慢
+"""
+
+import sys
+from flask import current_app, request
+from sqlalchemy.orm import load_only
+
+from .errors import RestError
+
+
+def prefix_upper(prefix):
+    """以 prefix 为前缀的字符串的上界，不存在上界时返回 None
+
+    末尾的字符已经是最大的 Unicode 字符时无法加一，去掉它再处理前一个字符
+    """
+    prefix = prefix.rstrip(chr(sys.maxunicode))
+    if not prefix:
+        return None
+    return prefix[:-1] + chr(ord(prefix[-1]) + 1)
+
+
+def filter_query(query, model, filters):
+    """根据查询参数过滤数据
+
+    Args:
+        query (object): 查询对象
+        model (class): 映射类
+        filters (dict): 键是查询参数名，值是 (字段名, 过滤方式) 元组
+                        过滤方式为 'eq' 表示相等，'prefix' 表示前缀匹配
+    """
+    for param, (name, op) in filters.items():
+        if not (value := request.args.get(param)):
+            continue
+        column = getattr(model, name)
+        if op == 'prefix':
+            # 不使用 LIKE ，而是转换为范围查询，这样可以利用字段的索引
+            # 例如前缀 'ab' 转换为 'ab' <= name < 'ac'
+            query = query.filter(column >= value)
+            if (upper := prefix_upper(value)) is not None:
+                query = query.filter(column < upper)
+        else:
+            query = query.filter(column == value)
+    return query
+
+
+def parse_fields(schema_class):
+    """解析查询参数 fields ，返回需要的字段名元组，未提供则返回 None
+    """
+    if not (fields := request.args.get('fields')):
+        return None
+    fields = tuple(fields.split(','))
+    available = {name for name, field in schema_class._declared_fields.items()
+            if not field.load_only}
+    if (unknown := set(fields) - available):
+        unknown = ','.join(sorted(unknown))
+        raise RestError(400, f'Unknown fields: {unknown}.')
+    return fields
+
+
+def restrict_columns(query, model, fields):
+    """只查询需要的字段，fields 为 None 时查询全部字段
+    """
+    if fields is None:
+        return query
+    columns = model.__table__.columns
+    names = [name for name in fields if name in columns]
+    # 主键总是会被查询出来，这里至少要提供一个字段
+    return query.options(load_only(*(names or ['id'])))
+
+
+def typed_arg(name, convert, default=None):
+    """获取查询参数并用 convert 转换类型，未提供时返回 default ，无法转换时返回 400 错误
+
+    request.args.get(name, type=int) 会把无效的值也当作未提供
+    """
+    if (value := request.args.get(name)) is None:
+        return default
+    try:
+        return convert(value)
+    except ValueError:
+        raise RestError(400, f'Invalid {name}.')
+
+
+def int_arg(name, default=None):
+    """获取整数类型的查询参数，规则同 typed_arg
+    """
+    return typed_arg(name, int, default)
+
+
+def float_arg(name, default=None):
+    """获取数值类型的查询参数，规则同 typed_arg
+    """
+    return typed_arg(name, float, default)
+
+
+def paginate(query, model):
+    """根据查询参数 limit 和 cursor 分页
+
+    未提供 limit 时返回全部数据，以保持与分页功能之前的 API 兼容
+    此时返回的是迭代器，每次从数据库中读取一批记录，可以配合流式响应使用
+
+    Return:
+        items (iterable): 当前页的映射类实例
+        headers (dict): 还有下一页时包含 X-Next-Cursor 字段
+    """
+    query = query.order_by(model.id)
+    if (cursor := int_arg('cursor')) is not None:
+        query = query.filter(model.id > cursor)
+    if (limit := int_arg('limit')) is None:
+        return iter(query.yield_per(500)), {}
+    max_limit = current_app.config.get('LIST_MAX_LIMIT', 1000)
+    if limit < 1 or limit > max_limit:
+        raise RestError(400, f'Limit must be between 1 and {max_limit}.')
+    # 多查询一条记录，用来判断是否还有下一页
+    items = query.limit(limit + 1).all()
+    if len(items) <= limit:
+        return items, {}
+    items = items[:limit]
+    return items, {'X-Next-Cursor': str(items[-1].id)}
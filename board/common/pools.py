@@ -0,0 +1,128 @@
+"""Redis 连接池注册表模块
+
+以前每次访问 Server.redis 都会新建一个 StrictRedis 实例
+也就等于新建一个连接池，每次 ping 或 info 都要重新建立 TCP 连接并执行 AUTH
+这里实现一个进程级的连接池注册表，以 (host, port, password) 为键缓存连接池
+同一个 Redis 服务器的多次请求复用已经建立好的连接
+"""
+
+import time
+import threading
+from contextlib import contextmanager
+from redis import BlockingConnectionPool
+
+
+class RedisPoolRegistry:
+    """进程级 Redis 连接池注册表
+    """
+
+    def __init__(self, app=None):
+        # 字典的键是 (host, port, password) 元组
+        # 值是 [连接池, 最后一次使用的时间戳, 正在长时间使用的任务数] 列表
+        self._pools = {}
+        self._lock = threading.Lock()
+        self.max_connections = 10
+        self.timeout = 5
+        self.idle_timeout = 300
+        self.socket_timeout = 3
+        if app:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """根据应用配置项设置连接池参数
+        """
+        config = app.config
+        self.max_connections = config.get('REDIS_POOL_MAX_CONNECTIONS', 10)
+        self.timeout = config.get('REDIS_POOL_TIMEOUT', 5)
+        self.idle_timeout = config.get('REDIS_POOL_IDLE_TIMEOUT', 300)
+        self.socket_timeout = config.get('REDIS_SOCKET_TIMEOUT', 3)
+        app.extensions['redis_pools'] = self
+
+    def get(self, host, port, password=None):
+        """获取某个 Redis 服务器的连接池，不存在则创建
+
+        Args:
+            host (str): Redis 服务器地址
+            port (int): Redis 服务器端口
+            password (str): Redis 服务器密码
+
+        Return:
+            object: BlockingConnectionPool 实例
+        """
+        key = (host, port, password)
+        now = time.monotonic()
+        with self._lock:
+            self._evict_idle(now)
+            item = self._pools.get(key)
+            if item is None:
+                # 连接池中的连接全部被占用时，最多等待 timeout 秒
+                # 而不是像默认的 ConnectionPool 那样无限制地新建连接
+                pool = BlockingConnectionPool(
+                        host=host, port=port, password=password,
+                        max_connections=self.max_connections,
+                        timeout=self.timeout,
+                        socket_timeout=self.socket_timeout,
+                        socket_connect_timeout=self.socket_timeout)
+                item = self._pools[key] = [pool, now, 0]
+            item[1] = now
+            return item[0]
+
+    @contextmanager
+    def hold(self, host, port, password=None):
+        """在 with 语句中长时间使用某个 Redis 服务器的连接池
+
+        分析任务之类的操作只在开始时获取一次连接池，之后不再访问注册表
+        使用期间该连接池不会因为空闲超时被移除，结束时更新最后一次使用的时间
+        """
+        key = (host, port, password)
+        pool = self.get(host, port, password)
+        with self._lock:
+            if (item := self._pools.get(key)) is not None and item[0] is pool:
+                item[2] += 1
+        try:
+            yield pool
+        finally:
+            with self._lock:
+                item = self._pools.get(key)
+                if item is not None and item[0] is pool:
+                    item[1] = time.monotonic()
+                    item[2] -= 1
+
+    def invalidate(self, host, port, password=None):
+        """移除某个 Redis 服务器的连接池并断开其全部连接
+
+        在服务器的地址、端口、密码被修改或服务器被删除时调用
+        """
+        with self._lock:
+            item = self._pools.pop((host, port, password), None)
+        if item is not None:
+            item[0].disconnect()
+
+    def clear(self):
+        """移除全部连接池
+        """
+        with self._lock:
+            items = list(self._pools.values())
+            self._pools.clear()
+        for pool, *_ in items:
+            pool.disconnect()
+
+    def _evict_idle(self, now):
+        """断开并移除长时间未被使用的连接池，调用者须持有锁
+        """
+        if not self.idle_timeout:
+            return
+        expired = [key for key, (_, last_used, holds) in self._pools.items()
+                if not holds and now - last_used > self.idle_timeout]
+        for key in expired:
+            pool = self._pools.pop(key)[0]
+            pool.disconnect()
+
+    def __len__(self):
+        return len(self._pools)
+
+    def __contains__(self, key):
+        return key in self._pools
+
+
+redis_pools = RedisPoolRegistry()
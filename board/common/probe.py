@@ -0,0 +1,105 @@
+"""并发检测 Redis 服务器状态的模块
+
+逐个调用 Server.status 时，只要有一个服务器无法连接，就要等到套接字超时
+服务器多了以后很容易超过微信公众号 5 秒的回复时限
+这里使用线程池同时 ping 全部服务器，并设置单个检测和整体检测的时限
+单个检测使用以时限为套接字超时的独立连接，连接池较长的超时不会让工作线程被占用更久
+"""
+
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+from flask import current_app
+from redis import Connection, RedisError, TimeoutError
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    """获取进程内共享的线程池，首次调用时创建
+    """
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            workers = current_app.config.get('PROBE_MAX_WORKERS', 32)
+            _executor = ThreadPoolExecutor(max_workers=workers,
+                    thread_name_prefix='board-probe')
+        return _executor
+
+
+def _ping(pool_key, timeout):
+    """在线程池中运行，ping 某个服务器并返回状态字符串
+
+    建立连接、AUTH 和 PING 的每次读写都以 timeout 为套接字超时
+    """
+    host, port, password = pool_key
+    connection = Connection(host=host, port=port, password=password,
+            socket_timeout=timeout, socket_connect_timeout=timeout)
+    try:
+        connection.send_command('PING')
+        connection.read_response()
+        return 'ok'
+    except TimeoutError:
+        return 'timeout'
+    except RedisError:
+        return 'error'
+    finally:
+        connection.disconnect()
+
+
+def batch_deadline(count, limit=None):
+    """并发检测 count 个服务器所需的整体时限
+
+    线程池每次最多同时检测 PROBE_MAX_WORKERS 个服务器
+    每个检测在建立连接、AUTH 和 PING 时各最多等待 PROBE_TIMEOUT 秒
+    按需要检测的批数计算整体时限，不小于 PROBE_DEADLINE ，不超过 limit
+    """
+    config = current_app.config
+    workers = config.get('PROBE_MAX_WORKERS', 32)
+    batches = -(-count // workers)
+    deadline = max(batches * 3 * config.get('PROBE_TIMEOUT', 2),
+            config.get('PROBE_DEADLINE', 4))
+    return deadline if limit is None else min(deadline, limit)
+
+
+def probe_servers(servers, timeout=None, deadline=None):
+    """并发检测多个 Redis 服务器的状态
+
+    Args:
+        servers (iterable): Server 实例
+        timeout (float): 单个服务器的检测时限，单位是秒
+        deadline (float): 全部服务器的检测时限，单位是秒
+
+    Return:
+        dict: 键是服务器 ID ，值是 'ok' 、'error' 或 'timeout'
+    """
+    # 在当前线程中读取映射类实例的属性，工作线程只接触连接池
+    targets = {server.id: server.pool_key for server in servers}
+    return probe(targets, timeout, deadline)
+
+
+def probe(targets, timeout=None, deadline=None):
+    """并发检测多个 Redis 服务器的状态
+
+    Args:
+        targets (dict): 键可以是任意标识，值是 (host, port, password) 元组
+        timeout (float): 单个服务器的检测时限，单位是秒
+        deadline (float): 全部服务器的检测时限，单位是秒
+
+    Return:
+        dict: 键是 targets 中的标识，值是 'ok' 、'error' 或 'timeout'
+    """
+    config = current_app.config
+    timeout = config.get('PROBE_TIMEOUT', 2) if timeout is None else timeout
+    deadline = config.get('PROBE_DEADLINE', 4) if deadline is None else deadline
+    executor = get_executor()
+    futures = {executor.submit(_ping, pool_key, timeout): key
+            for key, pool_key in targets.items()}
+    done, not_done = wait(futures, timeout=deadline)
+    result = {futures[future]: future.result() for future in done}
+    # 到达整体时限仍未完成的检测标记为超时，尚未开始的检测直接取消
+    for future in not_done:
+        future.cancel()
+        result[futures[future]] = 'timeout'
+    return result
@@ -1,9 +1,9 @@
-from collections import Mapping
-from flask import request, make_response, Response, g
-from flask.json import dumps
+from collections.abc import Mapping, Iterator
+from flask import request, make_response, Response, g, stream_with_context
 from flask.views import MethodView
 
 from .errors import RestError
+from .serializers import json_dumps as dumps
 
 
 # 继承 MethodView 类创建新的视图方法类
@@ -15,7 +15,10 @@ class RestView(MethodView):
     """
 
     content_type = 'application/json; charset=utf-8'
+    ndjson_content_type = 'application/x-ndjson; charset=utf-8'
     method_decorators = []
+    # 流式响应时，累积到这么多字符才发送一次
+    chunk_size = 8192
 
     # 如果遇到报错，例如 RestError ，就调用此方法
     # 这是在 dispatch_request 方法中设置的
@@ -80,6 +83,11 @@ class RestView(MethodView):
                     message = value
             data = {'ok': False, 'message': message}
 
+        # 视图函数返回生成器等迭代器时，以流的形式逐条序列化并发送
+        # 这样无论数据有多少，内存中都不必同时保存全部数据
+        if isinstance(data, Iterator):
+            return self.stream(data, code, headers)
+
         # dumps 方法将 data 这个列表序列化成为字符串，再在末尾加个换行符
         result = dumps(data) + '\n'
         # make_response 方法返回带响应码的 Response 对象
@@ -90,6 +98,41 @@ class RestView(MethodView):
         # 将 Response 对象返回给浏览器
         return response
 
+    def stream(self, data, code, headers):
+        """返回流式响应
+
+        请求头 Accept 为 application/x-ndjson 时，每行一个 JSON 对象
+        否则返回一个 JSON 数组，与非流式响应的格式相同
+        """
+        best = request.accept_mimetypes.best_match(
+                ['application/json', 'application/x-ndjson'])
+        ndjson = best == 'application/x-ndjson'
+
+        def generate():
+            buf, size = [], 0
+            if not ndjson:
+                buf.append('[')
+            for i, item in enumerate(data):
+                if ndjson:
+                    text = dumps(item) + '\n'
+                else:
+                    text = dumps(item) if i == 0 else ',' + dumps(item)
+                buf.append(text)
+                size += len(text)
+                if size >= self.chunk_size:
+                    yield ''.join(buf)
+                    buf, size = [], 0
+            if not ndjson:
+                buf.append(']\n')
+            yield ''.join(buf)
+
+        # stream_with_context 保证生成器运行时仍然可以访问请求上下文和数据库
+        response = Response(stream_with_context(generate()), code)
+        response.headers.extend(headers)
+        response.headers['Content-Type'] = (self.ndjson_content_type
+                if ndjson else self.content_type)
+        return response
+
     # 该方法用于解析视图函数的返回值
     @staticmethod
     def unpack(value):
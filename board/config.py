@@ -12,10 +12,105 @@ class DevConfig:
     DEBUG = True
     SQLALCHEMY_TRACK_MODIFICATIONS = False
     SQLALCHEMY_DATABASE_URI = 'sqlite://'
+    # 监控数据保存在单独的数据库中
+    SQLALCHEMY_BINDS = {'metrics': 'sqlite://'}
+
+    # token 缓存配置：最多缓存的 token 数量、缓存有效秒数
+    TOKEN_CACHE_SIZE = 1024
+    TOKEN_CACHE_TTL = 60
+
+    # Redis 连接池配置：每个服务器的最大连接数、等待空闲连接的秒数
+    # 连接池空闲多少秒后被移除、连接及读写的超时秒数
+    REDIS_POOL_MAX_CONNECTIONS = 10
+    REDIS_POOL_TIMEOUT = 5
+    REDIS_POOL_IDLE_TIMEOUT = 300
+    REDIS_SOCKET_TIMEOUT = 3
+
+    # 并发检测服务器状态的配置：单个检测时限、整体检测时限、线程池大小
+    # 整体时限须小于微信公众号要求的 5 秒回复时限
+    PROBE_TIMEOUT = 2
+    PROBE_DEADLINE = 4
+    PROBE_MAX_WORKERS = 32
+
+    # 列表 API 每页最多返回的记录数
+    LIST_MAX_LIMIT = 1000
+
+    # 批量导入服务器时每次最多导入的记录数，以及检测连接的整体时限的上限秒数
+    BULK_MAX_ROWS = 5000
+    BULK_PROBE_MAX_DEADLINE = 120
+
+    # 后台采集监控数据的配置：是否开启、采集间隔秒数、每个服务器保存的样本数
+    METRICS_COLLECTOR = False
+    METRICS_INTERVAL = 10
+    METRICS_CAPACITY = 360
+
+    # 慢查询：每轮采集 SLOWLOG GET 获取的记录数（为 0 时不采集慢查询和延迟数据）
+    # 以及每个服务器最多保存的慢查询记录数
+    SLOWLOG_FETCH_SIZE = 128
+    SLOWLOG_CAPACITY = 1024
+    # 每轮采集时是否执行 INFO commandstats 计算每种命令的调用速率
+    METRICS_COMMANDSTATS = True
+    # 监控数据推送：每隔多少轮发送一次完整数据、每个订阅者最多积压的事件数
+    # 以及没有事件时发送保活注释的间隔秒数
+    METRICS_STREAM_SNAPSHOT = 30
+    METRICS_STREAM_QUEUE = 16
+    METRICS_STREAM_KEEPALIVE = 15
+    # 计算复制时间延迟时每个主节点保存的偏移量样本数
+    REPLICATION_HISTORY = 360
+
+    # 监控数据持久化的配置：是否开启、原始数据、每分钟和每小时汇总数据的保存秒数
+    METRICS_PERSIST = False
+    METRICS_RAW_RETENTION = 6 * 3600
+    METRICS_MINUTE_RETENTION = 2 * 86400
+    METRICS_HOUR_RETENTION = 90 * 86400
+
+    # 后台分析任务：同时运行的任务数
+    ANALYSIS_MAX_JOBS = 2
+    # 键空间分析和大键分析：每批扫描的键数、每秒最多执行的命令数
+    # 以及键空间分析时每个前缀最多保存的子前缀数
+    KEYSPACE_SCAN_COUNT = 1000
+    KEYSPACE_MAX_OPS = 5000
+    KEYSPACE_MAX_CHILDREN = 1000
+    # 大键分析：每项指标返回的键数、默认采样率
+    # 以及微信消息查看结果时，结果超过多少秒需要重新分析
+    BIGKEYS_TOP = 20
+    BIGKEYS_SAMPLE_RATE = 1.0
+    BIGKEYS_MAX_AGE = 3600
+    # MONITOR 采样：默认和最长采样秒数、最多采样的命令数
+    # 以及命令名和键名前缀各自最多统计的项数
+    MONITOR_DURATION = 10
+    MONITOR_MAX_DURATION = 60
+    MONITOR_MAX_COMMANDS = 100000
+    MONITOR_TOP_SIZE = 200
+
+    # 告警配置：是否开启、恢复判断的回差比例、同一告警两次通知的最小间隔秒数
+    # 以及接收通知的用户名列表，None 表示全部绑定了微信的管理员
+    ALERTS_ENABLED = True
+    ALERT_HYSTERESIS = 0.05
+    ALERT_MIN_INTERVAL = 300
+    ALERT_RECIPIENTS = None
 
     WX_TOKEN = 'board-token'
     WX_APP_ID = os.environ.get('WX_APP_ID')
     WX_SECRET = os.environ.get('WX_SECRET')
+    # 发送告警通知使用的模板消息 ID ，未设置时发送文本客服消息
+    WX_ALERT_TEMPLATE_ID = os.environ.get('WX_ALERT_TEMPLATE_ID')
+    # 多个进程共享微信 access token 使用的 Redis 地址，例如 redis://localhost:6379/0
+    WX_SESSION_REDIS_URL = os.environ.get('WX_SESSION_REDIS_URL')
+
+    # 微信 API 出站队列：是否使用后台线程发送、每秒调用数、允许突发的调用数、每批最多取出的调用数
+    # 队列最大长度、最多重试次数和首次重试的等待秒数
+    WX_OUTBOX_WORKER = True
+    WX_OUTBOX_RATE = 20
+    WX_OUTBOX_BURST = 20
+    WX_OUTBOX_BATCH = 50
+    WX_OUTBOX_MAXSIZE = 10000
+    WX_OUTBOX_RETRIES = 3
+    WX_OUTBOX_BACKOFF = 1
+
+    # 处理慢命令的后台线程数，每个微信用户同时处理的慢命令数
+    WX_SLOW_WORKERS = 4
+    WX_SLOW_MAX_INFLIGHT = 1
 
 
 class ProConfig(DevConfig):
@@ -23,12 +118,17 @@ class ProConfig(DevConfig):
     """
 
     DEBUG = False
+    METRICS_COLLECTOR = True
+    METRICS_PERSIST = True
     # sqlite 数据库文件路径
     # os.getcwd() 获取执行程序时所在的目录的绝对路径
     # replace 方法是为了兼容 Windows 系统中使用反斜杠表示目录结构的情况
     path = os.path.join(os.getcwd(), 'board.db').replace('\\', '/')
     # 数据库的地址格式：'sqlite://host:port/path' ，host:port 为空
     SQLALCHEMY_DATABASE_URI = f'sqlite:///{path}'
+    # 监控数据保存在同一目录下的 metrics.db 文件中
+    metrics_path = os.path.join(os.getcwd(), 'metrics.db').replace('\\', '/')
+    SQLALCHEMY_BINDS = {'metrics': f'sqlite:///{metrics_path}'}
 
 
 configs = {
@@ -0,0 +1,13 @@
+from .collector import MetricsCollector, FIELDS
+from .store import MetricsStore
+from .slowlog import SlowlogBuffer, SlowlogEntry, aggregate
+from .commands import CommandRates
+from .stream import MetricsBroadcaster
+from .summary import FleetSummary, summarize
+from .topology import Topology, Node, discover
+from .replication import ReplicationTracker
+
+collector = MetricsCollector()
+store = MetricsStore()
+broadcaster = MetricsBroadcaster()
+replication = ReplicationTracker()
@@ -0,0 +1,354 @@
+"""后台监控数据采集模块
+
+以前每个 HTTP 请求都会对 Redis 服务器执行一次 INFO 命令
+N 个用户同时查看监控页面，被监控的 Redis 服务器就要承受 N 倍的压力
+这里使用一个后台线程按固定间隔采集全部服务器的监控数据
+监控数据 API 直接返回最近一次采集的结果
+"""
+
+import time
+import logging
+import threading
+from concurrent.futures import wait
+from redis import StrictRedis, RedisError
+
+from ..models import Server
+from ..common.pools import redis_pools
+from ..common.probe import get_executor
+from .ring import RingBuffer
+from .slowlog import SlowlogBuffer, queue_commands, parse_results
+from .commands import CommandRates
+from .topology import Topology, discover
+
+
+logger = logging.getLogger(__name__)
+
+
+# 环形缓冲区中保存的数值型字段
+FIELDS = (
+        'uptime_in_seconds',
+        'connected_clients',
+        'blocked_clients',
+        'used_memory',
+        'used_memory_rss',
+        'used_memory_peak',
+        'maxmemory',
+        'mem_fragmentation_ratio',
+        'total_connections_received',
+        'total_commands_processed',
+        'instantaneous_ops_per_sec',
+        'instantaneous_input_kbps',
+        'instantaneous_output_kbps',
+        'rejected_connections',
+        'expired_keys',
+        'evicted_keys',
+        'keyspace_hits',
+        'keyspace_misses',
+        'connected_slaves',
+        'master_repl_offset',
+        'used_cpu_sys',
+        'used_cpu_user',
+)
+
+
+def fetch(pool, slowlog_size=0, events=(), commandstats=False):
+    """在线程池中运行，获取某个服务器的 INFO 数据以及命令统计、慢查询和延迟数据
+
+    这些命令在同一个管道中执行，每个服务器每轮只需一次网络往返
+
+    Args:
+        slowlog_size (int): SLOWLOG GET 获取的记录数，为 0 时不获取慢查询和延迟数据
+        events (list): 需要获取历史数据的延迟事件
+        commandstats (bool): 是否执行 INFO commandstats
+
+    Return:
+        tuple: (INFO 字典, INFO commandstats 字典, parse_results 的返回值)
+               未获取的数据为 None
+    """
+    pipe = StrictRedis(connection_pool=pool).pipeline(transaction=False)
+    pipe.info()
+    if commandstats:
+        pipe.info('commandstats')
+    if slowlog_size:
+        queue_commands(pipe, slowlog_size, events)
+    info, *results = pipe.execute(raise_on_error=False)
+    if isinstance(info, Exception):
+        raise info
+    stats = results.pop(0) if commandstats else None
+    if isinstance(stats, Exception):
+        stats = None
+    extra = parse_results(results, events) if slowlog_size else None
+    return info, stats, extra
+
+
+class MetricsCollector:
+    """定时采集全部 Redis 服务器监控数据的采集器
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self.interval = 10
+        self.capacity = 360
+        self._buffers = {}
+        # 每个服务器最近一次采集到的完整 INFO 数据：(时间戳, 字典)
+        self._latest = {}
+        # 每个服务器的慢查询和延迟数据
+        self._slowlogs = {}
+        self.slowlog_size = 128
+        self.slowlog_capacity = 1024
+        # 每个服务器的命令调用速率
+        self._commands = {}
+        self.commandstats = True
+        # 每个 cluster 和 sentinel 服务器的拓扑
+        self._topologies = {}
+        self._listeners = []
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        if app:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """根据应用配置项设置采集间隔和缓冲区大小
+        """
+        self.app = app
+        self.interval = app.config.get('METRICS_INTERVAL', 10)
+        self.capacity = app.config.get('METRICS_CAPACITY', 360)
+        self.slowlog_size = app.config.get('SLOWLOG_FETCH_SIZE', 128)
+        self.slowlog_capacity = app.config.get('SLOWLOG_CAPACITY', 1024)
+        self.commandstats = app.config.get('METRICS_COMMANDSTATS', True)
+        self.clear()
+        app.extensions['metrics_collector'] = self
+        # 在处理第一个请求之前才启动采集线程
+        # 这样执行 flask init-db 之类的命令时不会启动线程
+        if app.config.get('METRICS_COLLECTOR', False):
+            app.before_first_request(self.start)
+
+    def add_listener(self, listener):
+        """添加监听函数，每轮采集结束后调用
+
+        监听函数的参数是列表，列表中的元素是 (服务器 ID, 时间戳, INFO 字典)
+        INFO 字典为 None 表示本轮采集时该服务器无法连接或超时
+        每次创建应用都会调用 init_app ，这里要避免重复添加
+        """
+        if listener not in self._listeners:
+            self._listeners.append(listener)
+
+    def start(self):
+        """启动后台采集线程
+        """
+        if self.running:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run,
+                name='board-metrics', daemon=True)
+        self._thread.start()
+
+    @property
+    def running(self):
+        """后台采集线程是否正在运行
+        """
+        return self._thread is not None and self._thread.is_alive()
+
+    def stop(self):
+        """停止后台采集线程
+        """
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def clear(self):
+        """清空全部监控数据
+        """
+        with self._lock:
+            self._buffers.clear()
+            self._latest.clear()
+            self._slowlogs.clear()
+            self._commands.clear()
+            self._topologies.clear()
+
+    def _run(self):
+        while not self._stop.is_set():
+            started = time.monotonic()
+            try:
+                with self.app.app_context():
+                    self.collect()
+            except Exception:
+                logger.exception('Collect metrics failed.')
+            # 扣除本轮采集所用的时间，保证采集间隔稳定
+            elapsed = time.monotonic() - started
+            self._stop.wait(max(self.interval - elapsed, 0))
+
+    def collect(self):
+        """并发采集全部服务器的监控数据，须在应用上下文中调用
+
+        cluster 和 sentinel 类型的服务器先发现拓扑，再并发采集每个数据节点
+        """
+        servers = Server.query.all()
+        executor = get_executor()
+        deadline = time.monotonic() + self.interval
+        clustered = [s for s in servers if s.kind in ('cluster', 'sentinel')]
+        discoveries = {executor.submit(discover, s.kind,
+            self.topology(s.id, s.kind).entries(s.host, s.port), s.password,
+            s.master_name): s for s in clustered}
+        futures = {executor.submit(fetch, redis_pools.get(*s.pool_key),
+                self.slowlog_size, self.slowlog_events(s.id),
+                self.commandstats): s.id for s in servers
+                if s.kind not in ('cluster', 'sentinel')}
+        # 拓扑发现最多占用半个采集间隔，超时或失败时沿用上一轮的拓扑
+        done, not_done = wait(discoveries, timeout=self.interval / 2)
+        for future in not_done:
+            future.cancel()
+        for future in done:
+            server = discoveries[future]
+            try:
+                nodes, peers = future.result()
+            except RedisError:
+                logger.warning('Discover topology of server %s failed.',
+                        server.id)
+            else:
+                self.topology(server.id).update(time.time(), nodes, peers)
+        node_futures = {executor.submit(fetch, redis_pools.get(node.host,
+            node.port, s.password)): (s.id, node.addr) for s in clustered
+            for node in self.topology(s.id).nodes.values()}
+        # 一轮采集最多耗时一个采集间隔，超时的服务器本轮不记录数据
+        done, not_done = wait([*futures, *node_futures],
+                timeout=max(deadline - time.monotonic(), 0))
+        now = time.time()
+        samples = []
+        node_infos = {s.id: {} for s in clustered}
+        for future in not_done:
+            future.cancel()
+            if future in node_futures:
+                server_id, addr = node_futures[future]
+                node_infos[server_id][addr] = None
+            else:
+                samples.append((futures[future], now, None))
+        for future in done:
+            try:
+                info, stats, extra = future.result()
+            except RedisError:
+                info = stats = extra = None
+            if future in node_futures:
+                server_id, addr = node_futures[future]
+                node_infos[server_id][addr] = info
+                continue
+            if stats is not None:
+                self.record_commands(futures[future], now, stats)
+            if extra is not None:
+                self.record_slowlog(futures[future], *extra)
+            samples.append((futures[future], now, info))
+        # 每个 cluster 和 sentinel 服务器的样本是其全部数据节点的汇总
+        for server_id, infos in node_infos.items():
+            info = self.topology(server_id).record(infos, FIELDS)
+            samples.append((server_id, now, info))
+        # 移除已被删除的服务器的数据
+        self.retain({s.id for s in servers}, {s.id for s in clustered})
+        for server_id, timestamp, info in samples:
+            if info is not None:
+                self.record(server_id, timestamp, info)
+        for listener in self._listeners:
+            try:
+                listener(samples)
+            except Exception:
+                logger.exception('Metrics listener %r failed.', listener)
+        return samples
+
+    def record(self, server_id, timestamp, info):
+        """保存某个服务器的一个样本
+        """
+        with self._lock:
+            buffer = self._buffers.get(server_id)
+            if buffer is None:
+                buffer = self._buffers[server_id] = RingBuffer(FIELDS,
+                        self.capacity)
+            self._latest[server_id] = (timestamp, info)
+        buffer.append(timestamp, info)
+
+    def slowlog_events(self, server_id):
+        """某个服务器已知的延迟事件
+        """
+        buffer = self._slowlogs.get(server_id)
+        return buffer.events if buffer is not None else []
+
+    def record_slowlog(self, server_id, slowlog, latest, histories):
+        """保存某个服务器的慢查询和延迟数据
+        """
+        with self._lock:
+            buffer = self._slowlogs.get(server_id)
+            if buffer is None:
+                buffer = self._slowlogs[server_id] = SlowlogBuffer(
+                        self.slowlog_capacity)
+        buffer.ingest(slowlog, latest, histories)
+
+    def record_commands(self, server_id, timestamp, stats):
+        """保存某个服务器的一次 INFO commandstats 采样
+        """
+        with self._lock:
+            rates = self._commands.get(server_id)
+            if rates is None:
+                rates = self._commands[server_id] = CommandRates()
+        rates.update(timestamp, stats)
+
+    def topology(self, server_id, kind=None):
+        """获取某个服务器的拓扑，提供 kind 时不存在则创建，否则返回 None
+        """
+        with self._lock:
+            topology = self._topologies.get(server_id)
+            # 服务器类型被修改后重新发现拓扑
+            if kind is not None and (topology is None or topology.kind != kind):
+                topology = self._topologies[server_id] = Topology(kind)
+            return topology
+
+    def retain(self, server_ids, clustered=()):
+        """只保留指定服务器的数据，拓扑只保留 clustered 中的服务器
+        """
+        with self._lock:
+            for server_id in set(self._buffers) - set(server_ids):
+                del self._buffers[server_id]
+                self._latest.pop(server_id, None)
+            for server_id in set(self._slowlogs) - set(server_ids):
+                del self._slowlogs[server_id]
+            for server_id in set(self._commands) - set(server_ids):
+                del self._commands[server_id]
+            for server_id in set(self._topologies) - set(clustered):
+                del self._topologies[server_id]
+
+    def latest(self, server_id, max_age=None):
+        """获取某个服务器最近一次采集的 INFO 数据
+
+        Args:
+            server_id (int): 服务器 ID
+            max_age (float): 数据的最大有效秒数，None 表示不限制
+
+        Return:
+            dict: INFO 数据，没有数据或数据过期则返回 None
+        """
+        item = self._latest.get(server_id)
+        if item is None:
+            return None
+        timestamp, info = item
+        if max_age is not None and time.time() - timestamp > max_age:
+            return None
+        return info
+
+    def latest_sample(self, server_id):
+        """获取某个服务器最近一次采集的 (时间戳, INFO 字典) ，没有数据则返回 None
+        """
+        return self._latest.get(server_id)
+
+    def history(self, server_id):
+        """获取某个服务器的环形缓冲区，没有数据则返回 None
+        """
+        return self._buffers.get(server_id)
+
+    def slowlog(self, server_id):
+        """获取某个服务器的慢查询和延迟数据，没有数据则返回 None
+        """
+        return self._slowlogs.get(server_id)
+
+    def commands(self, server_id):
+        """获取某个服务器的命令调用速率，没有数据则返回 None
+        """
+        return self._commands.get(server_id)
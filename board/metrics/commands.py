@@ -0,0 +1,76 @@
+"""按命令统计的调用速率
+
+INFO commandstats 返回每种命令自服务器启动以来的累计调用次数和累计耗时
+采集器每轮把它与 INFO 放在同一个管道中执行，用相邻两次采样的差值计算
+每种命令每秒的调用次数和这段时间内每次调用的平均耗时
+"""
+
+import threading
+
+
+def parse_commandstats(stats):
+    """解析 INFO commandstats 的结果
+
+    Return:
+        dict: 键是大写的命令名，值是 (累计调用次数, 累计耗时微秒数)
+    """
+    commands = {}
+    for name, value in stats.items():
+        if not name.startswith('cmdstat_') or not isinstance(value, dict):
+            continue
+        commands[name[8:].upper()] = (int(value.get('calls', 0)),
+                int(value.get('usec', 0)))
+    return commands
+
+
+class CommandRates:
+    """某个服务器每种命令的调用速率
+
+    只保存上一次的累计值和最近一次计算出的速率，占用的内存与命令种类数成正比
+    """
+
+    def __init__(self):
+        # 上一次采样：(时间戳, parse_commandstats 的返回值)
+        self._previous = None
+        # 最近一次计算结果：(时间戳, 间隔秒数, 速率列表)
+        self._rates = None
+        self._lock = threading.Lock()
+
+    def update(self, timestamp, stats):
+        """加入一次 INFO commandstats 采样，与上一次采样相减得到速率
+        """
+        current = parse_commandstats(stats)
+        with self._lock:
+            previous, self._previous = self._previous, (timestamp, current)
+        if previous is None or timestamp <= previous[0]:
+            return
+        elapsed = timestamp - previous[0]
+        rates = []
+        for command, (calls, usec) in current.items():
+            last_calls, last_usec = previous[1].get(command, (0, 0))
+            delta = calls - last_calls
+            # 累计值变小说明服务器重启过或者执行了 CONFIG RESETSTAT
+            # 该命令本轮只作为新的基准，不计算速率，其他命令不受影响
+            if delta <= 0 or usec < last_usec:
+                continue
+            rates.append({
+                'command': command,
+                'calls': delta,
+                'calls_per_sec': delta / elapsed,
+                'usec_per_call': (usec - last_usec) / delta,
+                'usec_per_sec': (usec - last_usec) / elapsed,
+            })
+        rates.sort(key=lambda item: item['calls_per_sec'], reverse=True)
+        with self._lock:
+            self._rates = (timestamp, elapsed, rates)
+
+    def to_dict(self, limit=None):
+        """最近一次计算出的速率，按每秒调用次数从大到小排列
+
+        只有一次采样时还不能计算速率，返回 None
+        """
+        if (rates := self._rates) is None:
+            return None
+        timestamp, elapsed, commands = rates
+        return {'timestamp': timestamp, 'interval': elapsed,
+                'commands': commands[:limit]}
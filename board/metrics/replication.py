@@ -0,0 +1,213 @@
+"""主从复制关系和复制延迟
+
+只使用采集器每轮已经获取的完整 INFO 数据，不对 Redis 服务器执行额外的命令：
+- 主节点的 slaveN 字段列出了每个从节点的地址、状态和已确认的复制偏移量
+- 从节点的 master_host 、master_port 和 master_link_status 字段指向其主节点
+
+字节延迟是主节点的 master_repl_offset 与从节点偏移量之差
+时间延迟根据主节点最近若干轮的偏移量计算：找到偏移量不超过从节点偏移量的最后一轮
+从节点已包含主节点在该轮之前写入的全部数据，该轮到现在的时间就是从节点落后的时间
+"""
+
+import re
+import bisect
+import threading
+from collections import deque
+
+from ..models import db, Server
+
+
+SLAVE_FIELD = re.compile(r'^slave\d+$')
+
+
+def parse_replication(info):
+    """从 INFO 数据中取出复制相关的字段
+
+    Return:
+        dict: 不是单个 Redis 服务器的数据（例如 cluster 的汇总数据）时返回 None
+    """
+    role = info.get('role')
+    if role not in ('master', 'slave'):
+        return None
+    replicas = []
+    # 从节点也可以有自己的从节点
+    for key, value in info.items():
+        if SLAVE_FIELD.match(key) and isinstance(value, dict):
+            addr = f"{value.get('ip')}:{value.get('port')}"
+            replicas.append({'addr': addr, 'state': value.get('state'),
+                'offset': int(value.get('offset', 0)),
+                'ack_lag': value.get('lag')})
+    state = {'role': role, 'offset': info.get('master_repl_offset', 0),
+            'replid': info.get('master_replid'), 'replicas': replicas,
+            'master': None, 'link_status': None}
+    if role == 'slave':
+        host, port = info.get('master_host'), info.get('master_port')
+        state['master'] = f'{host}:{port}'
+        state['link_status'] = info.get('master_link_status')
+        state['offset'] = info.get('slave_repl_offset', state['offset'])
+    return state
+
+
+class OffsetHistory:
+    """主节点最近若干轮的复制偏移量，用来计算从节点的时间延迟
+    """
+
+    __slots__ = ('timestamps', 'offsets')
+
+    def __init__(self, size):
+        self.timestamps = deque(maxlen=size)
+        self.offsets = deque(maxlen=size)
+
+    def append(self, timestamp, offset):
+        # 偏移量变小说明主节点重启过或者发生了主从切换，之前的数据不再可比
+        if self.offsets and offset < self.offsets[-1]:
+            self.timestamps.clear()
+            self.offsets.clear()
+        self.timestamps.append(timestamp)
+        self.offsets.append(offset)
+
+    def lag(self, offset):
+        """偏移量为 offset 的从节点落后的秒数
+
+        Return:
+            tuple: (秒数, 是否精确) ，offset 早于保存的最早数据时
+                   返回最早数据到现在的秒数作为下限；没有数据时返回 (None, False)
+        """
+        if not self.offsets:
+            return None, False
+        now = self.timestamps[-1]
+        if offset >= self.offsets[-1]:
+            return 0, True
+        # 主节点偏移量不超过 offset 的最后一轮
+        index = bisect.bisect_right(self.offsets, offset) - 1
+        if index < 0:
+            return now - self.timestamps[0], False
+        return now - self.timestamps[index], True
+
+
+def standalone_servers():
+    """全部单个 Redis 服务器：(ID, 名称, 主机, 端口)
+
+    cluster 和 sentinel 类型服务器的主从关系由拓扑发现处理，这里不包括
+    """
+    return db.session.query(Server.id, Server.name, Server.host,
+            Server.port).filter(db.or_(Server.kind.is_(None),
+                Server.kind == 'standalone')).all()
+
+
+class ReplicationTracker:
+    """根据采集器的数据跟踪主从关系、角色变化和复制延迟
+    """
+
+    def __init__(self, app=None):
+        self.history_size = 360
+        # 每个服务器最近一次的复制数据：(时间戳, parse_replication 的返回值)
+        self._states = {}
+        self._offsets = {}
+        # 角色变化记录，元素是 (时间戳, 服务器 ID, 原角色, 新角色)
+        self.changes = deque(maxlen=200)
+        self._lock = threading.Lock()
+        if app:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.history_size = app.config.get('REPLICATION_HISTORY', 360)
+        self.clear()
+        app.extensions['replication_tracker'] = self
+        app.extensions['metrics_collector'].add_listener(self.update)
+
+    def clear(self):
+        with self._lock:
+            self._states.clear()
+            self._offsets.clear()
+            self.changes.clear()
+
+    def update(self, samples):
+        """采集器的监听函数，参数格式见 MetricsCollector.add_listener
+        """
+        with self._lock:
+            # 移除已被删除的服务器的数据
+            server_ids = {server_id for server_id, _, _ in samples}
+            for server_id in self._states.keys() - server_ids:
+                del self._states[server_id]
+                self._offsets.pop(server_id, None)
+            for server_id, timestamp, info in samples:
+                if info is None or (state := parse_replication(info)) is None:
+                    continue
+                previous = self._states.get(server_id)
+                if previous is not None and \
+                        previous[1]['role'] != state['role']:
+                    self.changes.append((timestamp, server_id,
+                        previous[1]['role'], state['role']))
+                self._states[server_id] = (timestamp, state)
+                history = self._offsets.get(server_id)
+                if history is None:
+                    history = self._offsets[server_id] = OffsetHistory(
+                            self.history_size)
+                history.append(timestamp, state['offset'])
+
+    def graph(self, servers=None):
+        """构建主从关系图
+
+        Args:
+            servers (iterable): 元素是 (服务器 ID, 名称, 主机, 端口)
+                                默认是数据库中全部单个 Redis 服务器，须在应用上下文中调用
+
+        Return:
+            dict: nodes 是节点列表，未登记的主从节点只有地址
+                  edges 是主节点到从节点的边，changes 是角色变化记录
+        """
+        if servers is None:
+            servers = standalone_servers()
+        with self._lock:
+            return self._graph(servers)
+
+    def _graph(self, servers):
+        states = self._states
+        nodes = {}
+        names = {}
+        for server_id, name, host, port in servers:
+            addr = f'{host}:{port}'
+            names[server_id] = name
+            timestamp, state = states.get(server_id, (None, None))
+            nodes[addr] = {'addr': addr, 'server_id': server_id, 'name': name,
+                    'role': state and state['role'],
+                    'offset': state and state['offset'],
+                    'updated_at': timestamp}
+        edges = {}
+        for node in list(nodes.values()):
+            if (item := states.get(node['server_id'])) is None:
+                continue
+            state = item[1]
+            history = self._offsets.get(node['server_id'])
+            for replica in state['replicas']:
+                lag, exact = history.lag(replica['offset']) if history \
+                        else (None, False)
+                edges[(node['addr'], replica['addr'])] = {
+                    'master': node['addr'], 'replica': replica['addr'],
+                    'state': replica['state'],
+                    'offset_lag': max(state['offset'] - replica['offset'], 0),
+                    'time_lag': lag, 'time_lag_exact': exact,
+                    'ack_lag': replica['ack_lag']}
+                nodes.setdefault(replica['addr'], {'addr': replica['addr']})
+        # 主节点未登记时，只能从从节点的数据得知主从关系
+        for node in list(nodes.values()):
+            if (item := states.get(node.get('server_id'))) is None:
+                continue
+            state = item[1]
+            key = (state['master'], node['addr'])
+            if state['master'] is None or key in edges:
+                continue
+            edges[key] = {'master': state['master'], 'replica': node['addr'],
+                    'state': state['link_status'], 'offset_lag': None,
+                    'time_lag': None, 'time_lag_exact': False,
+                    'ack_lag': None}
+            nodes.setdefault(state['master'], {'addr': state['master']})
+        return {
+            'nodes': sorted(nodes.values(), key=lambda node: node['addr']),
+            'edges': sorted(edges.values(),
+                key=lambda edge: (edge['master'], edge['replica'])),
+            'changes': [{'timestamp': timestamp, 'server_id': server_id,
+                'name': names.get(server_id), 'from': old, 'to': new}
+                for timestamp, server_id, old, new in self.changes],
+        }
@@ -0,0 +1,94 @@
+"""定长环形缓冲区模块
+
+每个 Redis 服务器对应一个 RingBuffer 实例，用于在内存中保存最近的监控数据
+每个字段使用一个 array('d') 存储，比保存字典列表节省得多
+缓冲区写满之后，新数据覆盖最旧的数据，内存占用固定不变
+"""
+
+import math
+import threading
+from array import array
+
+
+class RingBuffer:
+    """按列存储数值型监控数据的环形缓冲区
+    """
+
+    def __init__(self, fields, capacity):
+        self.fields = tuple(fields)
+        self.capacity = capacity
+        # 每个字段的位置，用于根据字段名找到对应的列
+        self._positions = {name: i for i, name in enumerate(self.fields)}
+        self._times = array('d', [0.0]) * capacity
+        self._columns = [array('d', [math.nan]) * capacity
+                for _ in self.fields]
+        # _next 是下一次写入的位置，_size 是当前保存的样本数量
+        self._next = 0
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return self._size
+
+    def append(self, timestamp, values):
+        """写入一个样本
+
+        Args:
+            timestamp (float): 采样时间戳
+            values (dict): 监控数据，只保存 fields 中的数值型字段
+        """
+        with self._lock:
+            i = self._next
+            self._times[i] = timestamp
+            for name, column in zip(self.fields, self._columns):
+                column[i] = to_float(values.get(name))
+            self._next = (i + 1) % self.capacity
+            self._size = min(self._size + 1, self.capacity)
+
+    def latest_time(self):
+        """最新样本的时间戳，没有样本时返回 None
+        """
+        with self._lock:
+            if not self._size:
+                return None
+            return self._times[self._next - 1]
+
+    def since(self, timestamp=None, fields=None):
+        """获取某个时间之后的全部样本，按时间先后排序
+
+        Args:
+            timestamp (float): 只返回晚于该时间戳的样本，None 表示全部
+            fields (list): 需要的字段，None 表示全部
+
+        Return:
+            dict: 键 timestamps 对应时间戳列表
+                  键 values 对应字典，字典的键是字段名，值是数据列表
+        """
+        fields = self.fields if fields is None else fields
+        positions = [self._positions[name] for name in fields]
+        with self._lock:
+            start = (self._next - self._size) % self.capacity
+            indexes = [(start + n) % self.capacity for n in range(self._size)]
+            if timestamp is not None:
+                indexes = [i for i in indexes if self._times[i] > timestamp]
+            times = [self._times[i] for i in indexes]
+            values = {name: [from_float(self._columns[p][i]) for i in indexes]
+                    for name, p in zip(fields, positions)}
+        return {'timestamps': times, 'values': values}
+
+
+def to_float(value):
+    """将监控数据转换为浮点数，无法转换的记为 NaN
+    """
+    if value is None or isinstance(value, (str, bytes, dict)):
+        return math.nan
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return math.nan
+
+
+def from_float(value):
+    """NaN 无法序列化为 JSON ，将其转换为 None
+    """
+    return None if math.isnan(value) else value
@@ -0,0 +1,159 @@
+"""慢查询日志和延迟监控数据
+
+采集器每轮对每个服务器执行一次管道，在 INFO 命令之后同时执行：
+
+- SLOWLOG GET n ：只保存 ID 大于上次最大 ID 的记录，已经读过的记录不会重复保存
+- LATENCY LATEST ：每种延迟事件最近一次和最大的延迟
+- LATENCY HISTORY <event> ：上一轮发现的每种延迟事件的历史数据，只保存新的数据点
+
+每个服务器的数据保存在一个 SlowlogBuffer 中，慢查询记录保存为元组，数量有上限
+"""
+
+import threading
+from collections import deque, namedtuple
+
+
+# 慢查询记录，duration 的单位是微秒，args 是截断后的完整命令
+SlowlogEntry = namedtuple('SlowlogEntry', 'id start_time duration command args')
+
+# 保存的命令参数的最大长度
+MAX_ARGS_LENGTH = 128
+
+
+def _text(value):
+    if isinstance(value, bytes):
+        return value.decode('utf-8', errors='replace')
+    return value
+
+
+def queue_commands(pipe, slowlog_size, events):
+    """在管道中加入获取慢查询和延迟数据的命令
+
+    Args:
+        pipe (object): 已经加入了 INFO 命令的管道
+        slowlog_size (int): SLOWLOG GET 获取的记录数
+        events (list): 需要获取历史数据的延迟事件
+    """
+    pipe.slowlog_get(slowlog_size)
+    pipe.execute_command('LATENCY', 'LATEST')
+    for event in events:
+        pipe.execute_command('LATENCY', 'HISTORY', event)
+
+
+def parse_results(results, events):
+    """解析 queue_commands 加入的命令的结果
+
+    旧版本的 Redis 不支持 LATENCY 命令，这类命令的结果是异常对象，视为没有数据
+
+    Return:
+        tuple: (慢查询记录列表, LATENCY LATEST 结果, {事件: LATENCY HISTORY 结果})
+    """
+    slowlog, latest, *histories = results
+    if isinstance(slowlog, Exception):
+        slowlog = []
+    if isinstance(latest, Exception):
+        latest = []
+    histories = {event: history for event, history in zip(events, histories)
+            if not isinstance(history, Exception)}
+    return slowlog, latest, histories
+
+
+class SlowlogBuffer:
+    """某个服务器的慢查询记录和延迟数据
+
+    Args:
+        capacity (int): 最多保存的慢查询记录数
+        history_size (int): 每种延迟事件最多保存的历史数据点数
+    """
+
+    def __init__(self, capacity=1024, history_size=160):
+        self.last_id = None
+        self._entries = deque(maxlen=capacity)
+        # 键是事件名，值是 (时间戳, 最近一次延迟, 最大延迟)
+        self._latest = {}
+        self._histories = {}
+        self._history_size = history_size
+        self._lock = threading.Lock()
+
+    @property
+    def events(self):
+        """已知的延迟事件，下一轮采集时获取这些事件的历史数据
+        """
+        return list(self._latest)
+
+    def ingest(self, slowlog, latest, histories):
+        """保存一轮采集的数据
+
+        Args:
+            slowlog (list): SLOWLOG GET 的结果，ID 从大到小排列
+            latest (list): LATENCY LATEST 的结果
+            histories (dict): 键是事件名，值是 LATENCY HISTORY 的结果
+        """
+        with self._lock:
+            self._ingest_slowlog(slowlog)
+            for event, timestamp, last, peak in latest:
+                self._latest[_text(event)] = (int(timestamp), int(last),
+                        int(peak))
+            for event, history in histories.items():
+                self._ingest_history(_text(event), history)
+
+    def _ingest_slowlog(self, slowlog):
+        if not slowlog:
+            return
+        # 最大 ID 比上次小说明服务器重启过或者执行了 SLOWLOG RESET
+        if self.last_id is not None and slowlog[0]['id'] < self.last_id:
+            self.last_id = None
+        new = [item for item in slowlog
+                if self.last_id is None or item['id'] > self.last_id]
+        for item in reversed(new):
+            args = _text(item['command'])
+            command = args.split(' ', 1)[0].upper()
+            self._entries.append(SlowlogEntry(item['id'], item['start_time'],
+                item['duration'], command, args[:MAX_ARGS_LENGTH]))
+        self.last_id = slowlog[0]['id']
+
+    def _ingest_history(self, event, history):
+        points = self._histories.get(event)
+        if points is None:
+            points = self._histories[event] = deque(maxlen=self._history_size)
+        last = points[-1][0] if points else 0
+        # LATENCY HISTORY 的结果按时间从早到晚排列
+        for timestamp, latency in history:
+            if timestamp > last:
+                points.append((int(timestamp), int(latency)))
+
+    def entries(self, since=None):
+        """开始时间晚于 since 的慢查询记录，最新的排在最前面
+        """
+        with self._lock:
+            entries = list(self._entries)
+        if since is not None:
+            entries = [entry for entry in entries if entry.start_time > since]
+        entries.reverse()
+        return entries
+
+    def latency(self):
+        """每种延迟事件的最近一次延迟、最大延迟和历史数据，单位是毫秒
+        """
+        with self._lock:
+            return {event: {'timestamp': timestamp, 'latest': last,
+                'max': peak, 'history': list(self._histories.get(event, ()))}
+                for event, (timestamp, last, peak) in self._latest.items()}
+
+
+def aggregate(entries):
+    """按命令名汇总慢查询记录，按总耗时从大到小排列
+    """
+    stats = {}
+    for entry in entries:
+        item = stats.get(entry.command)
+        if item is None:
+            item = stats[entry.command] = {'command': entry.command,
+                    'count': 0, 'total': 0, 'max': 0}
+        item['count'] += 1
+        item['total'] += entry.duration
+        item['max'] = max(item['max'], entry.duration)
+    for item in stats.values():
+        item['avg'] = item['total'] / item['count']
+    return sorted(stats.values(), key=lambda item: item['total'],
+            reverse=True)
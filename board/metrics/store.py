@@ -0,0 +1,140 @@
+"""监控数据持久化模块
+
+后台采集器每完成一轮采集，就把全部服务器的数值型监控数据在一个事务中写入数据库
+原始数据会被逐级汇总为每分钟和每小时的数据，各级数据超过保存期限后被删除
+这样既能保存数周的历史数据，又不会让数据库无限制地增长
+"""
+
+import time
+from sqlalchemy import func, cast, select
+
+from ..models import db
+from ..models.metric import MetricSample, RAW, MINUTE, HOUR
+
+
+class MetricsStore:
+    """监控数据存储引擎
+    """
+
+    # 每种精度的数据由哪种精度的数据汇总而来
+    SOURCES = {MINUTE: RAW, HOUR: MINUTE}
+
+    def __init__(self, app=None):
+        # 各级数据的保存期限，单位是秒
+        self.retention = {RAW: 6 * 3600, MINUTE: 2 * 86400, HOUR: 90 * 86400}
+        # 每种精度已经汇总到的时间戳
+        self._watermarks = {}
+        if app:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """根据配置项设置保存期限，并在采集器中注册监听函数
+        """
+        config = app.config
+        self.retention = {
+                RAW: config.get('METRICS_RAW_RETENTION', 6 * 3600),
+                MINUTE: config.get('METRICS_MINUTE_RETENTION', 2 * 86400),
+                HOUR: config.get('METRICS_HOUR_RETENTION', 90 * 86400),
+        }
+        self._watermarks.clear()
+        app.extensions['metrics_store'] = self
+        if app.config.get('METRICS_PERSIST', False):
+            app.extensions['metrics_collector'].add_listener(self.save)
+
+    def save(self, samples):
+        """在一个事务中写入一轮采集的全部数据，并完成汇总和清理
+
+        Args:
+            samples (list): 元素是 (服务器 ID, 时间戳, INFO 字典)
+        """
+        # 无法连接的服务器没有监控数据
+        samples = [sample for sample in samples if sample[2] is not None]
+        if not samples:
+            return
+        fields = MetricSample.value_fields()
+        rows = []
+        for server_id, timestamp, info in samples:
+            row = {'server_id': server_id, 'resolution': RAW,
+                    'timestamp': int(timestamp)}
+            for name in fields:
+                value = info.get(name)
+                row[name] = value if isinstance(value, (int, float)) else None
+            rows.append(row)
+        # 多个进程同时采集时可能写入相同的数据，遇到主键冲突直接忽略
+        stmt = MetricSample.__table__.insert().prefix_with('OR IGNORE')
+        self._execute(stmt, rows)
+        now = max(int(timestamp) for _, timestamp, _ in samples)
+        self.rollup(MINUTE, now)
+        self.rollup(HOUR, now)
+        self.expire(now)
+        db.session.commit()
+
+    def rollup(self, resolution, now=None):
+        """将低一级精度的数据汇总为 resolution 精度的数据
+
+        只汇总已经结束的时间段，当前所在的时间段等下一次再汇总
+        """
+        now = int(time.time()) if now is None else now
+        end = now // resolution * resolution
+        start = self._watermark(resolution)
+        if start is None or start >= end:
+            return
+        source = self.SOURCES[resolution]
+        table = MetricSample.__table__
+        bucket = (table.c.timestamp / resolution) * resolution
+        columns = [table.c.server_id, db.literal(resolution), bucket]
+        for name in MetricSample.value_fields():
+            column = table.c[name]
+            if name in MetricSample.COUNTERS:
+                columns.append(func.max(column))
+            else:
+                columns.append(cast(func.avg(column), column.type))
+        query = select(columns).where(db.and_(
+                table.c.resolution == source,
+                table.c.timestamp >= start,
+                table.c.timestamp < end,
+        )).group_by(table.c.server_id, bucket)
+        names = ['server_id', 'resolution', 'timestamp']
+        names.extend(MetricSample.value_fields())
+        stmt = table.insert().prefix_with('OR IGNORE').from_select(names, query)
+        self._execute(stmt)
+        self._watermarks[resolution] = end
+
+    def expire(self, now=None):
+        """删除超过保存期限的数据
+        """
+        now = int(time.time()) if now is None else now
+        for resolution, seconds in self.retention.items():
+            MetricSample.query.filter(
+                    MetricSample.resolution == resolution,
+                    MetricSample.timestamp < now - seconds,
+            ).delete(synchronize_session=False)
+
+    def _watermark(self, resolution):
+        """获取某种精度已经汇总到的时间戳
+
+        进程启动后首次调用时从数据库中查询，之后保存在内存中
+        """
+        if resolution in self._watermarks:
+            return self._watermarks[resolution]
+        table = MetricSample.__table__
+        # 已有汇总数据时，从最后一个汇总时间段的下一个时间段开始
+        last = self._scalar(select([func.max(table.c.timestamp)]).where(
+                table.c.resolution == resolution))
+        if last is not None:
+            return last + resolution
+        # 没有汇总数据时，从最早的源数据所在的时间段开始
+        first = self._scalar(select([func.min(table.c.timestamp)]).where(
+                table.c.resolution == self.SOURCES[resolution]))
+        if first is None:
+            return None
+        return first // resolution * resolution
+
+    @staticmethod
+    def _execute(stmt, params=None):
+        # 只有提供 bind 参数，会话才会使用 metrics 数据库的连接
+        bind = db.get_engine(bind=MetricSample.__bind_key__)
+        return db.session.execute(stmt, params, bind=bind)
+
+    def _scalar(self, stmt):
+        return self._execute(stmt).scalar()
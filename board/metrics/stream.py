@@ -0,0 +1,181 @@
+"""通过 Server-Sent Events 推送监控数据的变化
+
+每轮采集结束后，每个服务器只计算一次与上一轮相比发生变化的字段，并序列化为一条事件
+同一条事件的字符串放入该服务器全部订阅者的队列，订阅者再多也不会增加 INFO 命令和计算量
+
+事件有三种：
+- snapshot 完整的 INFO 数据，订阅时以及每隔若干轮发送一次，客户端据此重新同步
+- delta 只包含变化的字段，值为 null 表示该字段已不存在
+- unavailable 本轮采集时服务器无法连接，下一次有数据时发送 snapshot
+"""
+
+import json
+import queue
+import threading
+
+
+def diff(previous, current):
+    """比较两次 INFO 数据，返回变化的字段，已不存在的字段值为 None
+    """
+    changed = {key: value for key, value in current.items()
+            if key not in previous or previous[key] != value}
+    for key in previous.keys() - current.keys():
+        changed[key] = None
+    return changed
+
+
+def format_event(event, event_id, data):
+    """序列化为 Server-Sent Events 格式的字符串
+    """
+    data = json.dumps(data, ensure_ascii=False, separators=(',', ':'))
+    return f'id: {event_id}\nevent: {event}\ndata: {data}\n\n'
+
+
+class Channel:
+    """某个服务器的订阅者和上一次推送的数据
+    """
+
+    __slots__ = ('info', 'seq', 'since_snapshot', 'subscribers')
+
+    def __init__(self):
+        self.info = None
+        self.seq = 0
+        self.since_snapshot = 0
+        self.subscribers = set()
+
+    def event(self, event, timestamp, data=None, event_id=None):
+        """构造一条事件，未指定 event_id 时使用下一个序号
+
+        重新同步用的 snapshot 代替的是已有的事件，使用其序号
+        这样其他订阅者收到的事件序号是连续的
+        """
+        if event_id is None:
+            self.seq += 1
+            event_id = self.seq
+        payload = {'timestamp': timestamp}
+        if data is not None:
+            payload['data'] = data
+        return format_event(event, event_id, payload)
+
+
+class Subscriber:
+    """某个订阅者的事件队列
+
+    队列已满说明客户端读取太慢，丢弃积压的事件，之后发送 snapshot 重新同步
+    """
+
+    def __init__(self, size):
+        self.queue = queue.Queue(size)
+        self.lagging = False
+
+    def put(self, message):
+        try:
+            self.queue.put_nowait(message)
+        except queue.Full:
+            self.lagging = True
+
+    def reset(self, message):
+        """清空积压的事件，只保留 message
+        """
+        while True:
+            try:
+                self.queue.get_nowait()
+            except queue.Empty:
+                break
+        self.lagging = False
+        self.put(message)
+
+    def get(self, timeout):
+        """获取下一条事件，超时返回 None
+        """
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+
+class MetricsBroadcaster:
+    """把采集器的数据以增量事件的形式广播给订阅者
+    """
+
+    def __init__(self, app=None):
+        self.snapshot_every = 30
+        self.queue_size = 16
+        self.keepalive = 15
+        self._channels = {}
+        self._lock = threading.Lock()
+        if app:
+            self.init_app(app)
+
+    def init_app(self, app):
+        config = app.config
+        self.snapshot_every = config.get('METRICS_STREAM_SNAPSHOT', 30)
+        self.queue_size = config.get('METRICS_STREAM_QUEUE', 16)
+        self.keepalive = config.get('METRICS_STREAM_KEEPALIVE', 15)
+        with self._lock:
+            self._channels.clear()
+        app.extensions['metrics_broadcaster'] = self
+        app.extensions['metrics_collector'].add_listener(self.publish)
+
+    def subscribe(self, server_id, timestamp=None, info=None):
+        """订阅某个服务器的监控数据
+
+        还没有推送过数据时，以 timestamp 和 info 作为初始数据，通常是采集器的最新数据
+        订阅者的队列中第一条事件是 snapshot ，之后的 delta 都以它为基准
+        """
+        subscriber = Subscriber(self.queue_size)
+        with self._lock:
+            channel = self._channels.get(server_id)
+            if channel is None:
+                channel = self._channels[server_id] = Channel()
+            if channel.info is None and info is not None:
+                channel.info = (timestamp, info)
+            if channel.info is not None:
+                # snapshot 对应最近一次推送的数据，还没有推送过时才使用新的序号
+                subscriber.put(channel.event('snapshot', *channel.info,
+                    event_id=channel.seq or None))
+            channel.subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, server_id, subscriber):
+        with self._lock:
+            channel = self._channels.get(server_id)
+            if channel is None:
+                return
+            channel.subscribers.discard(subscriber)
+            # 没有订阅者时不再保存该服务器的数据
+            if not channel.subscribers:
+                del self._channels[server_id]
+
+    def publish(self, samples):
+        """采集器的监听函数，参数格式见 MetricsCollector.add_listener
+        """
+        with self._lock:
+            for server_id, timestamp, info in samples:
+                if (channel := self._channels.get(server_id)) is not None:
+                    self._publish(channel, timestamp, info)
+
+    def _publish(self, channel, timestamp, info):
+        snapshot = None
+        if info is None:
+            channel.info = None
+            message = channel.event('unavailable', timestamp)
+        elif channel.info is None or \
+                channel.since_snapshot + 1 >= self.snapshot_every:
+            message = snapshot = channel.event('snapshot', timestamp, info)
+            channel.since_snapshot = 0
+        else:
+            message = channel.event('delta', timestamp,
+                    diff(channel.info[1], info))
+            channel.since_snapshot += 1
+        if info is not None:
+            channel.info = (timestamp, info)
+        for subscriber in channel.subscribers:
+            if subscriber.lagging and info is not None:
+                # 丢弃积压的事件，从完整数据重新开始
+                if snapshot is None:
+                    snapshot = channel.event('snapshot', timestamp, info,
+                            channel.seq)
+                subscriber.reset(snapshot)
+            else:
+                subscriber.put(message)
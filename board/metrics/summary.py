@@ -0,0 +1,99 @@
+"""全部服务器的监控数据汇总
+
+只使用采集器保存的最新数据，不对 Redis 服务器执行任何命令
+每个服务器只读取几个字段并累加，1000 个服务器的汇总耗时在毫秒级
+"""
+
+from collections import Counter
+
+
+# 返回的命中率百分位数
+PERCENTILES = (50, 90, 99)
+
+
+def percentile(values, p):
+    """已排序列表的百分位数，使用最近秩方法
+    """
+    if not values:
+        return None
+    rank = max(int(len(values) * p / 100 + 0.5), 1)
+    return values[min(rank, len(values)) - 1]
+
+
+class FleetSummary:
+    """累加一组服务器的最新监控数据
+    """
+
+    __slots__ = ('servers', 'available', 'used_memory', 'maxmemory',
+            'ops_per_sec', 'connected_clients', 'roles', 'hit_ratios')
+
+    def __init__(self):
+        self.servers = 0
+        # 有最新数据的服务器数
+        self.available = 0
+        self.used_memory = 0
+        self.maxmemory = 0
+        self.ops_per_sec = 0
+        self.connected_clients = 0
+        self.roles = Counter()
+        self.hit_ratios = []
+
+    def add(self, info):
+        """累加一个服务器的 INFO 数据，None 表示没有最新数据
+        """
+        self.servers += 1
+        if info is None:
+            return
+        get = info.get
+        self.available += 1
+        self.used_memory += get('used_memory', 0)
+        self.maxmemory += get('maxmemory', 0)
+        self.ops_per_sec += get('instantaneous_ops_per_sec', 0)
+        self.connected_clients += get('connected_clients', 0)
+        self.roles[get('role', 'unknown')] += 1
+        hits = get('keyspace_hits', 0)
+        total = hits + get('keyspace_misses', 0)
+        # 没有读取过键的服务器没有命中率
+        if total:
+            self.hit_ratios.append(hits / total)
+
+    def to_dict(self):
+        ratios = sorted(self.hit_ratios)
+        return {
+            'servers': self.servers,
+            'available': self.available,
+            'used_memory': self.used_memory,
+            'maxmemory': self.maxmemory,
+            'ops_per_sec': self.ops_per_sec,
+            'connected_clients': self.connected_clients,
+            'roles': dict(self.roles),
+            'hit_ratio': {
+                'min': ratios[0] if ratios else None,
+                'max': ratios[-1] if ratios else None,
+                'avg': sum(ratios) / len(ratios) if ratios else None,
+                **{f'p{p}': percentile(ratios, p) for p in PERCENTILES},
+            },
+        }
+
+
+def summarize(samples):
+    """汇总全部服务器的最新数据
+
+    Args:
+        samples (iterable): 元素是 (分组名, INFO 字典) ，不分组时分组名为 None
+
+    Return:
+        dict: total 是全部服务器的汇总，groups 是每个分组的汇总
+    """
+    total = FleetSummary()
+    groups = {}
+    for group, info in samples:
+        total.add(info)
+        if group is not None:
+            summary = groups.get(group)
+            if summary is None:
+                summary = groups[group] = FleetSummary()
+            summary.add(info)
+    return {'total': total.to_dict(),
+            'groups': {name: summary.to_dict()
+                for name, summary in groups.items()}}
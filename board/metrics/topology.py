@@ -0,0 +1,291 @@
+"""Redis Cluster 和 Sentinel 的拓扑发现
+
+类型为 cluster 或 sentinel 的服务器只需登记一个入口节点：
+- cluster 通过 CLUSTER NODES 获取全部节点、主从关系和每个主节点负责的槽
+- sentinel 通过 SENTINEL MASTER 和 SENTINEL SLAVES 获取某个主节点及其从节点
+  并通过 SENTINEL SENTINELS 获取监控该主节点的其他 Sentinel
+
+采集器每轮先发现拓扑，与上一轮比较只记录变化（节点增减、主从切换、槽迁移、节点状态）
+再并发采集每个数据节点的 INFO ，按分片（主节点及其从节点）汇总
+"""
+
+import threading
+from collections import deque, namedtuple
+from redis import StrictRedis, RedisError
+
+from ..common.pools import redis_pools
+
+
+# 拓扑中的节点
+# role 是 master 或 replica ，master 是从节点所属主节点的地址，主节点为 None
+# slots 是主节点负责的槽区间 ((起始槽, 结束槽), ...) ，state 是 ok 或 fail
+Node = namedtuple('Node', 'addr host port role master slots state')
+
+# 汇总时按分片累加的字段
+SHARD_FIELDS = ('used_memory', 'instantaneous_ops_per_sec',
+        'connected_clients')
+
+# 汇总整个集群的 INFO 数据时取最小值和最大值的字段，其余字段累加
+MIN_FIELDS = frozenset(('uptime_in_seconds',))
+MAX_FIELDS = frozenset(('mem_fragmentation_ratio', 'master_repl_offset'))
+
+
+def _text(value):
+    if isinstance(value, bytes):
+        return value.decode('utf-8', errors='replace')
+    return value
+
+
+def parse_cluster_nodes(text):
+    """解析 CLUSTER NODES 的输出
+
+    每行的格式是：
+    <id> <ip:port@cport[,hostname]> <flags> <master> <ping> <pong> <epoch> <link> <slot> ...
+    槽可能是单个槽、槽区间或者 [slot->-id] 形式的迁移中的槽，后者忽略
+
+    Return:
+        dict: 键是节点地址，值是 Node 实例
+    """
+    lines = [line.split() for line in _text(text).splitlines() if line]
+    addrs = {}
+    for fields in lines:
+        addr = fields[1].split('@', 1)[0]
+        host, _, port = addr.rpartition(':')
+        # 节点还没有分配地址时是 :0 之类的形式，无法连接
+        if host and port.isdigit() and int(port):
+            addrs[fields[0]] = (addr, host, int(port))
+    nodes = {}
+    for node_id, _, flags, master, *_, link in (f[:8] for f in lines):
+        if node_id not in addrs:
+            continue
+        addr, host, port = addrs[node_id]
+        flags = flags.split(',')
+        nodes[addr] = Node(addr, host, port,
+                'master' if 'master' in flags else 'replica',
+                addrs[master][0] if master in addrs else None, (),
+                'fail' if 'fail' in flags or 'fail?' in flags
+                    or link != 'connected' else 'ok')
+    for fields in lines:
+        if fields[0] not in addrs:
+            continue
+        slots = []
+        for item in fields[8:]:
+            if item.startswith('['):
+                continue
+            start, _, end = item.partition('-')
+            slots.append((int(start), int(end or start)))
+        if slots:
+            addr = addrs[fields[0]][0]
+            nodes[addr] = nodes[addr]._replace(slots=tuple(slots))
+    return nodes
+
+
+def sentinel_nodes(master, replicas):
+    """根据 SENTINEL MASTER 和 SENTINEL SLAVES 的结果构造节点
+    """
+    addr = f"{master['ip']}:{master['port']}"
+    nodes = {addr: Node(addr, master['ip'], int(master['port']), 'master',
+        None, (), 'fail' if master.get('is_sdown') else 'ok')}
+    for item in replicas:
+        replica = f"{item['ip']}:{item['port']}"
+        down = item.get('is_sdown') or item.get('is_disconnected')
+        nodes[replica] = Node(replica, item['ip'], int(item['port']),
+                'replica', addr, (), 'fail' if down else 'ok')
+    return nodes
+
+
+def discover(kind, entries, password=None, master_name=None):
+    """在线程池中运行，依次尝试每个入口节点，获取拓扑
+
+    Args:
+        kind (str): cluster 或 sentinel
+        entries (list): 入口节点 (host, port) 列表
+                        通常是登记的地址和上一轮发现的其他入口节点
+        password (str): 节点密码
+        master_name (str): Sentinel 监控的主节点名称
+
+    Return:
+        nodes (dict): 键是节点地址，值是 Node 实例
+        peers (list): 之后可以作为入口节点的 (host, port) 列表
+                      cluster 是全部主节点，sentinel 是其他 Sentinel
+    """
+    error = None
+    for host, port in entries:
+        client = StrictRedis(connection_pool=redis_pools.get(host, port,
+            password))
+        try:
+            if kind == 'sentinel':
+                nodes = sentinel_nodes(client.sentinel_master(master_name),
+                        client.sentinel_slaves(master_name))
+                # 数据节点不能执行 SENTINEL 命令，只有 Sentinel 可以作为入口节点
+                peers = [(item['ip'], int(item['port'])) for item
+                        in client.sentinel_sentinels(master_name)]
+                return nodes, peers
+            # 不使用 redis-py 的 CLUSTER NODES 解析函数，它会丢弃槽区间的格式
+            nodes = parse_cluster_nodes(client.execute_command('CLUSTER',
+                'NODES'))
+            return nodes, [(node.host, node.port) for node in nodes.values()
+                    if node.role == 'master']
+        except RedisError as e:
+            error = e
+    raise error or RedisError('No entry node.')
+
+
+def diff_nodes(previous, current):
+    """比较两次发现的拓扑，返回变化列表
+    """
+    changes = []
+    for addr in previous.keys() - current.keys():
+        changes.append({'type': 'removed', 'node': addr})
+    for addr, node in current.items():
+        old = previous.get(addr)
+        if old is None:
+            changes.append({'type': 'added', 'node': addr, 'role': node.role})
+            continue
+        for field in ('role', 'master', 'slots', 'state'):
+            if getattr(old, field) != getattr(node, field):
+                changes.append({'type': field, 'node': addr,
+                    'from': getattr(old, field), 'to': getattr(node, field)})
+    return sorted(changes, key=lambda change: change['node'])
+
+
+def slot_count(slots):
+    return sum(end - start + 1 for start, end in slots)
+
+
+class Topology:
+    """某个 cluster 或 sentinel 服务器的拓扑和每个节点最近一次的 INFO 数据
+
+    Args:
+        kind (str): cluster 或 sentinel
+        history (int): 最多保存的拓扑变化数
+    """
+
+    def __init__(self, kind, history=200):
+        self.kind = kind
+        self.nodes = {}
+        # 上一次发现时得知的其他入口节点
+        self.peers = []
+        self.updated_at = None
+        # 元素是 (时间戳, 变化)
+        self.changes = deque(maxlen=history)
+        self.infos = {}
+        self._lock = threading.Lock()
+
+    def entries(self, host, port):
+        """发现拓扑时依次尝试的入口节点：登记的地址和上一次发现的其他入口节点
+
+        cluster 是已知的主节点，sentinel 是已知的其他 Sentinel
+        """
+        entries = [(host, port)]
+        entries.extend(peer for peer in self.peers if peer != (host, port))
+        return entries
+
+    def update(self, timestamp, nodes, peers=()):
+        """保存新发现的拓扑和其他入口节点，返回与上一次相比的变化
+        """
+        with self._lock:
+            self.peers = list(peers)
+            # 第一次发现时全部节点都是新增的，不作为变化记录
+            changes = diff_nodes(self.nodes, nodes) if self.nodes else []
+            self.changes.extend((timestamp, change) for change in changes)
+            self.nodes = nodes
+            self.updated_at = timestamp
+            for addr in self.infos.keys() - nodes.keys():
+                del self.infos[addr]
+        return changes
+
+    def record(self, infos, fields):
+        """保存本轮每个节点的 INFO 数据并汇总
+
+        Args:
+            infos (dict): 键是节点地址，值是 INFO 字典，无法连接的节点值为 None
+            fields (tuple): 需要汇总的数值型字段
+
+        Return:
+            dict: 整个集群的 INFO 数据，全部节点都无法连接时为 None
+        """
+        with self._lock:
+            self.infos = {addr: info for addr, info in infos.items()
+                    if addr in self.nodes}
+            info = aggregate_infos(self.nodes, self.infos, fields)
+        if info is not None:
+            info['role'] = self.kind
+        return info
+
+    def shards(self):
+        """每个分片的汇总数据，按主节点地址排序
+        """
+        with self._lock:
+            return build_shards(self.nodes, self.infos)
+
+    def to_dict(self, since=None):
+        with self._lock:
+            nodes = [{**node._asdict(), 'slots': [list(s) for s in node.slots],
+                'available': self.infos.get(node.addr) is not None}
+                for node in sorted(self.nodes.values())]
+            changes = [{'timestamp': timestamp, **change}
+                    for timestamp, change in self.changes
+                    if since is None or timestamp > since]
+        return {'updated_at': self.updated_at, 'nodes': nodes,
+                'shards': self.shards(), 'changes': changes}
+
+
+def aggregate_infos(nodes, infos, fields):
+    """把全部数据节点的 INFO 数据汇总为一个字典，格式与单个服务器的相同
+    """
+    available = [info for info in infos.values() if info is not None]
+    if not available:
+        return None
+    total = {}
+    for info in available:
+        for key in fields:
+            if (value := info.get(key)) is None:
+                continue
+            if key not in total:
+                total[key] = value
+            elif key in MIN_FIELDS:
+                total[key] = min(total[key], value)
+            elif key in MAX_FIELDS:
+                total[key] = max(total[key], value)
+            else:
+                total[key] += value
+    masters = [node for node in nodes.values() if node.role == 'master']
+    total.update({
+        'cluster_nodes': len(nodes),
+        'cluster_nodes_available': len(available),
+        'cluster_masters': len(masters),
+        'cluster_slots_assigned': sum(slot_count(node.slots)
+            for node in masters),
+    })
+    return total
+
+
+def build_shards(nodes, infos):
+    shards = {}
+    for node in nodes.values():
+        master = node.addr if node.role == 'master' else node.master
+        shard = shards.get(master)
+        if shard is None:
+            shard = shards[master] = {'master': master, 'replicas': [],
+                    'slots': 0, 'keys': 0, 'available': 0,
+                    **{field: 0 for field in SHARD_FIELDS}}
+        if node.role == 'master':
+            shard['slots'] = slot_count(node.slots)
+        else:
+            shard['replicas'].append(node.addr)
+        if (info := infos.get(node.addr)) is None:
+            continue
+        shard['available'] += 1
+        for field in SHARD_FIELDS:
+            shard[field] += info.get(field, 0)
+        # 键数只统计主节点，从节点上是相同的键
+        if node.role == 'master':
+            shard['keys'] = sum(value.get('keys', 0) for key, value
+                    in info.items() if key.startswith('db')
+                    and isinstance(value, dict))
+    for shard in shards.values():
+        shard['replicas'].sort()
+        shard['keys_per_slot'] = shard['keys'] / shard['slots'] \
+                if shard['slots'] else None
+    return [shards[master] for master in sorted(shards, key=str)]
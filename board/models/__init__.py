@@ -1,3 +1,5 @@
 from .base import db, BaseModel
-from .user import User, UserSchema
-from .server import Server, ServerSchema
+from .user import User, UserSchema, dump_user
+from .server import Server, ServerSchema, INFO_SECTIONS, dump_server
+from .metric import MetricSample
+from .alert import AlertRule, AlertRuleSchema
@@ -0,0 +1,69 @@
+"""该模块实现告警规则映射类及其序列化类
+"""
+
+from marshmallow import Schema, fields, validate, post_load
+from marshmallow import validates, ValidationError
+
+from .base import db, BaseModel
+from .server import Server
+
+
+class AlertRule(BaseModel):
+    """告警规则映射类
+    """
+
+    __tablename__ = 'alert_rule'
+
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(64))
+    # server_id 为空表示规则适用于全部服务器
+    server_id = db.Column(db.Integer, db.ForeignKey('redis_server.id'),
+            index=True)
+    # SQLite 默认不检查外键，删除服务器时由 ORM 删除其告警规则
+    server = db.relationship('Server', backref=db.backref('alert_rules',
+        cascade='all, delete-orphan'))
+    expression = db.Column(db.String(256))
+    enabled = db.Column(db.Boolean, default=True)
+
+    @property
+    def condition(self):
+        """解析后的告警条件
+        """
+        # board.alerts 包会导入映射类，这里在函数内导入以避免循环导入
+        from ..alerts.rules import parse_rule
+        return parse_rule(self.expression)
+
+
+class AlertRuleSchema(Schema):
+    """告警规则序列化类
+    """
+
+    id = fields.Integer(dump_only=True)
+    name = fields.String(required=True, validate=validate.Length(2, 64))
+    server_id = fields.Integer(allow_none=True)
+    expression = fields.String(required=True, validate=validate.Length(1, 256))
+    enabled = fields.Boolean()
+    created_time = fields.DateTime(dump_only=True)
+    updated_time = fields.DateTime(dump_only=True)
+
+    @validates('server_id')
+    def validate_server_id(self, value):
+        if value is not None and Server.query.get(value) is None:
+            raise ValidationError('Redis server not exists.')
+
+    @validates('expression')
+    def validate_expression(self, value):
+        from ..alerts.rules import parse_rule, RuleError
+        try:
+            parse_rule(value)
+        except RuleError as e:
+            raise ValidationError(str(e))
+
+    @post_load
+    def create_or_update(self, data):
+        instance = self.context.get('instance', None)
+        if instance is None:
+            return AlertRule(**data)
+        for key, value in data.items():
+            setattr(instance, key, value)
+        return instance
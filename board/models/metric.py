@@ -0,0 +1,79 @@
+"""该模块实现持久化保存的监控数据映射类
+
+监控数据保存在单独的数据库中（配置项 SQLALCHEMY_BINDS 的 metrics 字段）
+这样大量的监控数据不会使保存用户和服务器的 board.db 文件膨胀
+每条记录就是某个服务器在某个时刻的一组数值型监控数据
+"""
+
+from .base import db
+
+
+# 数据精度，单位是秒：0 是原始数据，60 是每分钟汇总，3600 是每小时汇总
+RAW, MINUTE, HOUR = 0, 60, 3600
+
+
+class MetricSample(db.Model):
+    """监控数据映射类
+    """
+
+    __tablename__ = 'metric_sample'
+    __bind_key__ = 'metrics'
+    # 汇总和清理过期数据时按精度和时间戳查询
+    __table_args__ = (
+            db.Index('ix_metric_sample_resolution_timestamp',
+                'resolution', 'timestamp'),
+    )
+
+    server_id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    resolution = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    timestamp = db.Column(db.Integer, primary_key=True, autoincrement=False)
+
+    used_memory = db.Column(db.Integer)
+    used_memory_rss = db.Column(db.Integer)
+    mem_fragmentation_ratio = db.Column(db.Float)
+    connected_clients = db.Column(db.Integer)
+    blocked_clients = db.Column(db.Integer)
+    instantaneous_ops_per_sec = db.Column(db.Integer)
+    instantaneous_input_kbps = db.Column(db.Float)
+    instantaneous_output_kbps = db.Column(db.Float)
+    total_commands_processed = db.Column(db.Integer)
+    keyspace_hits = db.Column(db.Integer)
+    keyspace_misses = db.Column(db.Integer)
+    expired_keys = db.Column(db.Integer)
+    evicted_keys = db.Column(db.Integer)
+
+    # 汇总时，累计型字段取时间段内的最大值，其余字段取平均值
+    COUNTERS = ('total_commands_processed', 'keyspace_hits',
+            'keyspace_misses', 'expired_keys', 'evicted_keys')
+
+    @classmethod
+    def value_fields(cls):
+        """全部监控数据字段名
+        """
+        keys = ('server_id', 'resolution', 'timestamp')
+        return tuple(column.name for column in cls.__table__.columns
+                if column.name not in keys)
+
+    @classmethod
+    def query_range(cls, server_id, resolution, since=None, until=None):
+        """按时间范围查询某个服务器某种精度的监控数据
+
+        Args:
+            server_id (int): 服务器 ID
+            resolution (int): 数据精度，RAW 、MINUTE 或 HOUR
+            since (int): 起始时间戳，不包含
+            until (int): 截止时间戳，包含
+
+        Return:
+            list: MetricSample 实例，按时间先后排序
+        """
+        query = cls.query.filter_by(server_id=server_id, resolution=resolution)
+        if since is not None:
+            query = query.filter(cls.timestamp > since)
+        if until is not None:
+            query = query.filter(cls.timestamp <= until)
+        return query.order_by(cls.timestamp).all()
+
+    def __repr__(self):
+        return (f'<{self.__class__.__name__}: {self.server_id} '
+                f'{self.resolution} {self.timestamp}>')
@@ -6,7 +6,25 @@ from marshmallow import Schema, fields, validate, post_load
 from marshmallow import validates_schema, ValidationError
 
 from .base import db, BaseModel
-from ..common.errors import RestError
+from ..common.errors import RestError, RedisConnectError
+from ..common.pools import redis_pools
+from ..common.serializers import get_dumper
+
+
+# INFO 命令支持的分组名称
+INFO_SECTIONS = ('server', 'clients', 'memory', 'persistence', 'stats',
+        'replication', 'cpu', 'commandstats', 'cluster', 'keyspace', 'modules',
+        'errorstats', 'default', 'all', 'everything')
+
+
+# 服务器类型：单个 Redis 服务器、Redis Cluster 和 Sentinel 管理的主从节点
+# 后两种类型登记的是入口节点，其它节点由采集器自动发现
+KINDS = ('standalone', 'cluster', 'sentinel')
+
+# 主机地址：IPv4 地址或者主机名，主机名最后一部分不能全是数字
+HOST_PATTERN = (r'^(?:\d{1,3}(?:\.\d{1,3}){3}'
+        r'|(?:[A-Za-z0-9](?:[A-Za-z0-9-]{0,61}[A-Za-z0-9])?\.)*'
+        r'[A-Za-z](?:[A-Za-z0-9-]{0,61}[A-Za-z0-9])?)$')
 
 
 # 该类的实例即为连接 Redis 服务器的客户端对象
@@ -19,13 +37,50 @@ class Server(BaseModel):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(64), unique=True)
     description = db.Column(db.String(512))
-    host = db.Column(db.String(15))
+    host = db.Column(db.String(255), index=True)
     port = db.Column(db.Integer, default=6379)
     password = db.Column(db.String())
+    # 标签，例如业务线或机房名称，汇总监控数据时可以按标签分组
+    tag = db.Column(db.String(64), index=True)
+    kind = db.Column(db.String(16), default='standalone')
+    # Sentinel 监控的主节点名称，kind 为 sentinel 时必须提供
+    master_name = db.Column(db.String(64))
+
+    @property
+    def pool_key(self):
+        """连接池注册表中该服务器对应的键
+        """
+        return (self.host, self.port, self.password)
 
     @property
     def redis(self):
-        return StrictRedis(self.host, self.port, password=self.password)
+        # 连接池由注册表统一管理，同一服务器的多个客户端对象共享连接
+        pool = redis_pools.get(*self.pool_key)
+        return StrictRedis(connection_pool=pool)
+
+    def delete(self):
+        """删除服务器及其告警规则，没有其他服务器使用其连接池时断开连接池中的连接
+        """
+        # board.alerts 包会导入映射类，这里在函数内导入以避免循环导入
+        from ..alerts import alert_engine
+        pool_key = self.pool_key
+        has_rules = bool(self.alert_rules)
+        super().delete()
+        self.release_pool(pool_key)
+        if has_rules:
+            alert_engine.reload()
+
+    @classmethod
+    def release_pool(cls, pool_key):
+        """没有服务器再使用 pool_key 对应的连接池时，断开并移除该连接池
+
+        地址、端口和密码都相同的服务器共享同一个连接池
+        其他服务器仍在使用时保留连接池，以免断开采集器和视图正在使用的连接
+        """
+        host, port, password = pool_key
+        if not cls.query.filter_by(host=host, port=port,
+                password=password).count():
+            redis_pools.invalidate(*pool_key)
 
     def ping(self):
         """测试 Redis 服务器能否正常连接，返回值是布尔值"""
@@ -33,12 +88,26 @@ class Server(BaseModel):
             return self.redis.ping()
         except RedisError:
             msg = f'Redis server {self.host} can\'t be connected.'
-            raise RestError(400, msg)
+            raise RedisConnectError(400, msg)
+
+    def get_metrics(self, sections=None):
+        """获取 Redis 服务器监控信息，返回值是字典
 
-    def get_metrics(self):
-        """获取 Redis 服务器监控信息，返回值是字典"""
+        Args:
+            sections (list): INFO 分组名称，例如 ['memory', 'stats']
+                             为空时获取默认的全部分组
+        """
         try:
-            return self.redis.info()
+            if not sections:
+                return self.redis.info()
+            # 每个分组执行一次 INFO <section> ，使用管道只需一次网络往返
+            pipe = self.redis.pipeline(transaction=False)
+            for section in sections:
+                pipe.info(section)
+            metrics = {}
+            for result in pipe.execute():
+                metrics.update(result)
+            return metrics
         except RedisError:
             raise RestError(400, 
                     f"Redis server {self.host} can't be connected.")
@@ -75,11 +144,15 @@ class ServerSchema(Schema):
     id = fields.Integer(dump_only=True)
     name = fields.String(required=True, validate=validate.Length(2, 64))
     description = fields.String(validate=validate.Length(0, 512))
-    # host 必须是 IPv4 地址，通过正则验证
-    host = fields.String(required=True,
-            validate=validate.Regexp(r'^\d{1,3}\.\d{1,3}\.\d{1,3}\.\d{1,3}$'))
+    # host 必须是 IPv4 地址或主机名，通过正则验证
+    host = fields.String(required=True, validate=[validate.Length(1, 255),
+        validate.Regexp(HOST_PATTERN)])
     port = fields.Integer(validate=validate.Range(1024, 65536))
     password = fields.String()
+    tag = fields.String(allow_none=True, validate=validate.Length(0, 64))
+    kind = fields.String(allow_none=True, validate=validate.OneOf(KINDS))
+    master_name = fields.String(allow_none=True,
+            validate=validate.Length(1, 64))
     updated_at = fields.DateTime(dump_only=True)
     created_at = fields.DateTime(dump_only=True)
 
@@ -89,15 +162,32 @@ class ServerSchema(Schema):
     # 参数 data 是一个字典对象
     @validates_schema
     def validate_schema(self, data):
-        # 如果字典中没有 port 字段，将其设为默认值 6379
-        if 'port' not in data:
-            data['port'] = 6379
         # 当前类继承了 marshmallow.schema.Schema 类
         # 而 Schema 继承了同模块下的 BaseSchema 类
         # BaseSchema.__init__ 中定义了实例属性 context 的默认值为空字典
         # 如果服务器已经存在，在相关请求出现时
         # self.context 的 instance 字段值会被定义为 Server 实例
         instance = self.context.get('instance', None)
+        # 创建服务器时，如果字典中没有 port 字段，将其设为默认值 6379
+        # 更新服务器时不能这样做，否则只修改名字也会把端口改回 6379
+        if instance is None and 'port' not in data:
+            data['port'] = 6379
+        kind = data.get('kind', instance.kind if instance else 'standalone')
+        master_name = data.get('master_name',
+                instance.master_name if instance else None)
+        if kind == 'sentinel' and not master_name:
+            raise ValidationError('Sentinel master name is required.',
+                    'master_name')
+        # 部分更新时可能没有 name 字段，无需检查重名
+        if 'name' not in data:
+            return
+        # 批量导入时预先一次性查询出已存在的服务器名，存入 context 的 names 字段
+        # 这样就不必每条记录都查询一次数据库
+        if (names := self.context.get('names')) is not None:
+            if data['name'] in names:
+                raise ValidationError('Redis server is already existed.',
+                        'name')
+            return
         server = Server.query.filter_by(name=data['name']).first()
         # 创建服务器时，server 的值为 None，验证完毕
         # 更新服务器时，如果更新服务器的 name ，server 的值也是 None ，验证完毕
@@ -122,3 +212,8 @@ class ServerSchema(Schema):
         for key, value in data.items():
             setattr(instance, key, value)
         return instance
+
+
+# 预先生成 Server 实例的序列化函数，结果与 ServerSchema().dump(obj).data 相同
+# 列表 API 使用它代替 ServerSchema ，速度快得多
+dump_server = get_dumper(ServerSchema)
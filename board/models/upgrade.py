@@ -0,0 +1,66 @@
+"""数据库结构升级
+
+db.create_all 只创建不存在的数据表，不会修改已有的数据表
+映射类新增字段后，已有的数据库缺少对应的列，查询该映射类时会报错
+这里对比映射类和数据库中的实际结构，为已有的数据表添加缺少的列和索引
+可以重复执行，已经存在的列和索引不会再次添加
+
+SQLite 不限制 VARCHAR 的长度，例如 redis_server.host 从 15 加长到 255 不需要修改数据表
+"""
+
+from flask import current_app
+from sqlalchemy import inspect
+from sqlalchemy.schema import CreateColumn
+
+from .base import db
+
+
+def missing_columns(engine, table):
+    """数据表中不存在的映射类字段，数据表本身不存在时返回空列表
+    """
+    inspector = inspect(engine)
+    if table.name not in inspector.get_table_names():
+        return []
+    names = {column['name'] for column in inspector.get_columns(table.name)}
+    return [column for column in table.columns if column.name not in names]
+
+
+def add_column(engine, table, column):
+    """为已有的数据表添加一列
+
+    新增的列不能是主键或者非空约束的列
+    字段有固定的默认值时，已有的记录使用默认值，否则为 NULL
+    """
+    ddl = CreateColumn(column).compile(dialect=engine.dialect)
+    engine.execute(f'ALTER TABLE {table.name} ADD COLUMN {ddl}')
+    if column.default is not None and column.default.is_scalar:
+        engine.execute(table.update().where(column.is_(None)).values(
+            {column.name: column.default.arg}))
+
+
+def missing_indexes(engine, table):
+    """数据表中不存在的映射类索引
+    """
+    names = {index['name'] for index in inspect(engine).get_indexes(table.name)}
+    return [index for index in table.indexes if index.name not in names]
+
+
+def upgrade_schema():
+    """创建不存在的数据表，并为已有的数据表添加缺少的列和索引，须在应用上下文中调用
+
+    Return:
+        list: 添加的列和索引，列是 '表名.列名' 字符串，索引是索引名
+    """
+    db.create_all()
+    added = []
+    binds = [None, *(current_app.config.get('SQLALCHEMY_BINDS') or {})]
+    for bind in binds:
+        engine = db.get_engine(bind=bind)
+        for table in db.get_tables_for_bind(bind):
+            for column in missing_columns(engine, table):
+                add_column(engine, table, column)
+                added.append(f'{table.name}.{column.name}')
+            for index in missing_indexes(engine, table):
+                index.create(engine)
+                added.append(index.name)
+    return added
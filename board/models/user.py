@@ -1,4 +1,5 @@
 import jwt
+from collections import namedtuple
 from datetime import datetime, timedelta
 from werkzeug.security import generate_password_hash, check_password_hash
 from flask import current_app
@@ -8,6 +9,11 @@ from marshmallow import validates_schema, ValidationError
 
 from .base import db, BaseModel
 from ..common.errors import InvalidTokenError, AuthenticationError
+from ..common.serializers import get_dumper
+
+
+# 用户快照，只包含认证之后需要用到的字段，可以安全地缓存
+UserSnapshot = namedtuple('UserSnapshot', 'id name email is_admin wx_id')
 
 
 class User(BaseModel):
@@ -96,6 +102,22 @@ class User(BaseModel):
         Return:
             object: 返回用户对象（User 类实例）
         """
+        payload = cls.decode_token(token, verify_exp)
+        if not (user := cls.query.get(payload['uid'])):
+            raise InvalidTokenError(403, 'User not exists.')
+        return user
+
+    @staticmethod
+    def decode_token(token, verify_exp=True):
+        """验证 token 并返回载荷，不查询数据库
+
+        Args:
+            token (str): JSON WEB TOKEN
+            verify_exp (bool): 是否验证 token 的过期时间
+
+        Return:
+            dict: token 的载荷
+        """
         # verify_exp 的值如果为 False ，则不验证 token 的过期时间
         # 也就是说即使 token 过期也没关系，还是可以得到 payload
         # 如果 verify_exp 等于 True ，则验证 token 的过期时间
@@ -118,10 +140,13 @@ class User(BaseModel):
         # 检查是否过了允许刷新的时间，刷新时间是 token 过期后 10 分钟内
         if payload['refresh_exp'] < timegm(datetime.now().utctimetuple()):
             raise InvalidTokenError(403, 'Invalid token.')
-        # 经过上面的层层检查后
-        if not (user := cls.query.get(payload['uid'])):
-            raise InvalidTokenError(403, 'User not exists.')
-        return user
+        return payload
+
+    def snapshot(self):
+        """生成用户快照
+        """
+        return UserSnapshot(self.id, self.name, self.email, self.is_admin,
+                self.wx_id)
 
     @classmethod
     def create_administrator(cls):
@@ -193,3 +218,7 @@ class UserSchema(Schema):
         for key, value in data.items():
             setattr(instance, key, value)
         return instance
+
+
+# 预先生成 User 实例的序列化函数，结果与 UserSchema().dump(obj).data 相同
+dump_user = get_dumper(UserSchema)
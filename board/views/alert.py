@@ -0,0 +1,79 @@
+"""该模块实现告警规则管理和告警查询视图
+"""
+
+from flask import request, g
+
+from ..common.rest import RestView
+from ..alerts import alert_engine
+from ..models import AlertRule, AlertRuleSchema
+from .decorators import ObjectMustExists, TokenAuthenticate
+
+
+class AlertListView(RestView):
+    """该视图类用于获取当前处于告警状态的规则
+    """
+
+    method_decorators = (TokenAuthenticate(), )
+
+    def get(self):
+        """获取当前的告警列表"""
+
+        return alert_engine.active()
+
+
+class AlertRuleListView(RestView):
+    """该视图类用于获取告警规则列表和创建告警规则，只有管理员用户才有相关权限
+    """
+
+    method_decorators = (TokenAuthenticate(admin=True), )
+
+    def get(self):
+        """获取告警规则列表"""
+
+        rules = AlertRule.query.order_by(AlertRule.id)
+        data, _ = AlertRuleSchema(many=True).dump(rules)
+        return data
+
+    def post(self):
+        """创建告警规则"""
+
+        data = request.get_json()
+        rule, errors = AlertRuleSchema().load(data)
+        if errors:
+            return errors, 400
+        rule.save()
+        alert_engine.reload()
+        return {'ok': True, 'id': rule.id}, 201
+
+
+class AlertRuleDetailView(RestView):
+    """该视图类用于对某个告警规则进行查询、更新和删除操作
+    """
+
+    method_decorators = (TokenAuthenticate(admin=True),
+            ObjectMustExists(AlertRule))
+
+    def get(self, object_id):
+        """获取告警规则"""
+
+        data, _ = AlertRuleSchema().dump(g.instance)
+        return data
+
+    def put(self, object_id):
+        """更新告警规则"""
+
+        schema = AlertRuleSchema(context={'instance': g.instance})
+        data = request.get_json()
+        rule, errors = schema.load(data, partial=True)
+        if errors:
+            return errors, 400
+        rule.save()
+        alert_engine.reload()
+        return {'ok': True}
+
+    def delete(self, object_id):
+        """删除告警规则"""
+
+        g.instance.delete()
+        alert_engine.reload()
+        return {'ok': True}, 204
@@ -0,0 +1,209 @@
+"""该模块实现 Redis 服务器的键空间分析、大键分析和命令采样视图
+"""
+
+from flask import request, g, current_app
+
+from ..common.rest import RestView
+from ..common.errors import RestError
+from ..common.listing import int_arg
+from ..analysis import job_runner, PrefixTrie, scan_keyspace
+from ..analysis import BigKeysResult, find_bigkeys
+from ..analysis import MonitorResult, sample_monitor
+from ..metrics import collector
+from ..models import Server
+from .decorators import ObjectMustExists, TokenAuthenticate
+
+
+class AnalysisJobView(RestView):
+    """分析任务视图基类
+
+    分析任务在后台运行，POST 请求启动任务，GET 请求查询进度和结果
+    DELETE 请求停止任务，之后可以使用 resume 参数从停止的位置继续
+    任务会对线上服务器执行 SCAN 、MEMORY USAGE 或 MONITOR 等命令
+    所以普通用户只能查询，启动和停止任务须有管理员权限
+    """
+
+    method_decorators = {
+        'get': [TokenAuthenticate(), ObjectMustExists(Server)],
+        'post': [TokenAuthenticate(admin=True), ObjectMustExists(Server)],
+        'delete': [TokenAuthenticate(admin=True), ObjectMustExists(Server)],
+    }
+
+    # 以下三项由子类设置：任务类型、在后台线程中运行的任务函数
+    # 以及根据任务参数创建任务结果对象的方法
+    kind = None
+    task = None
+    make_result = None
+
+    def get(self, object_id):
+        """查询任务进度和结果"""
+
+        if (job := job_runner.get(self.kind, object_id)) is None:
+            raise RestError(404, 'Analysis not started.')
+        data = job.to_dict(result=False)
+        data['result'] = self.dump_result(job.result)
+        return data
+
+    def post(self, object_id):
+        """启动分析任务，请求数据中的 resume 为 true 表示继续上次停止的任务"""
+
+        data = request.get_json(silent=True) or {}
+        params = self.get_params(data)
+        job, created = job_runner.submit(self.kind, g.instance, self.task,
+                params, self.make_result(params), resume=bool(data.get('resume')))
+        if not created:
+            raise RestError(409, 'Analysis is running.')
+        return job.to_dict(), 202
+
+    def delete(self, object_id):
+        """停止分析任务"""
+
+        if job_runner.stop(self.kind, object_id) is None:
+            raise RestError(404, 'Analysis not started.')
+        return {'ok': True}
+
+    def dump_result(self, result):
+        return result.to_dict()
+
+    def get_params(self, data):
+        """校验请求数据，返回任务参数，子类在此基础上添加自己的参数
+
+        match SCAN 的匹配模式，count 每批扫描的键数
+        max_ops 每秒最多执行的命令数，cursor 起始游标
+        """
+        config = current_app.config
+        params = {
+            'match': data.get('match'),
+            'count': data.get('count', config.get('KEYSPACE_SCAN_COUNT', 1000)),
+            'max_ops': data.get('max_ops',
+                config.get('KEYSPACE_MAX_OPS', 5000)),
+            'cursor': data.get('cursor', 0),
+        }
+        for name in ('count', 'max_ops'):
+            if not isinstance(params[name], int) or params[name] < 1:
+                raise RestError(400, f'Invalid {name}.')
+        # 不能超过配置的最大命令数，避免影响线上服务
+        params['max_ops'] = min(params['max_ops'],
+                config.get('KEYSPACE_MAX_OPS', 5000))
+        if not isinstance(params['cursor'], int) or params['cursor'] < 0:
+            raise RestError(400, 'Invalid cursor.')
+        return params
+
+
+class KeyspaceAnalysisView(AnalysisJobView):
+    """按键名前缀分析某个 Redis 服务器的内存用量
+    """
+
+    kind = 'keyspace'
+    task = staticmethod(scan_keyspace)
+
+    def dump_result(self, result):
+        """查询参数 limit 是每个前缀最多返回的子前缀数
+        """
+        if (limit := int_arg('limit', 20)) < 1:
+            raise RestError(400, 'Invalid limit.')
+        return result.to_dict(limit)
+
+    def make_result(self, params):
+        return PrefixTrie(params['delimiter'], params['depth'],
+                current_app.config.get('KEYSPACE_MAX_CHILDREN', 1000))
+
+    def get_params(self, data):
+        """delimiter 前缀分隔符，depth 最多汇总几级前缀，samples MEMORY USAGE 的采样数
+        """
+        params = super().get_params(data)
+        params['delimiter'] = data.get('delimiter', ':')
+        params['depth'] = data.get('depth', 3)
+        params['samples'] = data.get('samples')
+        if not isinstance(params['delimiter'], str) or \
+                not params['delimiter']:
+            raise RestError(400, 'Invalid delimiter.')
+        if not isinstance(params['depth'], int) or params['depth'] < 1:
+            raise RestError(400, 'Invalid depth.')
+        if params['samples'] is not None and \
+                (not isinstance(params['samples'], int) or params['samples'] < 0):
+            raise RestError(400, 'Invalid samples.')
+        return params
+
+
+class BigKeysView(AnalysisJobView):
+    """找出某个 Redis 服务器内存用量最大、元素最多和访问最频繁的键
+    """
+
+    kind = 'bigkeys'
+    task = staticmethod(find_bigkeys)
+
+    def make_result(self, params):
+        return BigKeysResult(params['top'])
+
+    def get_params(self, data):
+        """top 每项指标返回的键数，sample_rate 采样率，hot 为 true 时查找热键
+        """
+        config = current_app.config
+        params = super().get_params(data)
+        params['top'] = data.get('top', config.get('BIGKEYS_TOP', 20))
+        params['sample_rate'] = data.get('sample_rate',
+                config.get('BIGKEYS_SAMPLE_RATE', 1.0))
+        params['hot'] = bool(data.get('hot', True))
+        if not isinstance(params['top'], int) or not 1 <= params['top'] <= 1000:
+            raise RestError(400, 'Invalid top.')
+        rate = params['sample_rate']
+        if not isinstance(rate, (int, float)) or not 0 < rate <= 1:
+            raise RestError(400, 'Invalid sample_rate.')
+        return params
+
+
+class CommandTopView(AnalysisJobView):
+    """某个 Redis 服务器的命令流量分布
+
+    GET 请求返回采集器根据 INFO commandstats 计算的每种命令的调用速率
+    以及最近一次 MONITOR 采样统计出的最频繁的命令和键名前缀
+    POST 请求启动 MONITOR 采样，DELETE 请求提前停止采样
+    MONITOR 对服务器的影响最大，与其他分析任务一样只有管理员可以启动和停止
+    """
+
+    kind = 'monitor'
+    task = staticmethod(sample_monitor)
+
+    def get(self, object_id):
+        """查询参数 limit 是每项统计最多返回的项数"""
+
+        limit = request.args.get('limit', 20, type=int)
+        if limit < 1:
+            raise RestError(400, 'Invalid limit.')
+        rates = collector.commands(object_id)
+        data = {'commandstats': rates.to_dict(limit) if rates else None,
+                'monitor': None}
+        if (job := job_runner.get(self.kind, object_id)) is not None:
+            data['monitor'] = job.to_dict(result=False)
+            data['monitor']['result'] = job.result.to_dict(limit)
+        return data
+
+    def make_result(self, params):
+        return MonitorResult(current_app.config.get('MONITOR_TOP_SIZE', 200),
+                params['delimiter'])
+
+    def get_params(self, data):
+        """duration 采样秒数，max_commands 最多采样的命令数，delimiter 键名分隔符
+
+        MONITOR 采样不使用 SCAN ，不需要基类的参数
+        """
+        config = current_app.config
+        params = {
+            'duration': data.get('duration', config.get('MONITOR_DURATION', 10)),
+            'max_commands': data.get('max_commands',
+                config.get('MONITOR_MAX_COMMANDS', 100000)),
+            'delimiter': data.get('delimiter', ':'),
+        }
+        for name in ('duration', 'max_commands'):
+            if not isinstance(params[name], (int, float)) or params[name] <= 0:
+                raise RestError(400, f'Invalid {name}.')
+        # 不能超过配置的上限，避免长时间影响线上服务
+        params['duration'] = min(params['duration'],
+                config.get('MONITOR_MAX_DURATION', 60))
+        params['max_commands'] = min(params['max_commands'],
+                config.get('MONITOR_MAX_COMMANDS', 100000))
+        if not isinstance(params['delimiter'], str) or \
+                not params['delimiter']:
+            raise RestError(400, 'Invalid delimiter.')
+        return params
@@ -1,7 +1,8 @@
 from functools import wraps
 from flask import g, request
 
-from ..common.errors import RestError, AuthenticationError
+from ..common.errors import RestError, AuthenticationError, InvalidTokenError
+from ..common.cache import token_cache
 from ..models import User
 
 
@@ -48,7 +49,7 @@ class TokenAuthenticate:
             if len(parts) > 2:
                 raise AuthenticationError(401, 'Invalid token.')
             token = parts[1]
-            user = User.verify_token(token)
+            user = self.authenticate(token)
             # 如果需要验证用户的管理员身份
             if self.admin and not user.is_admin:
                 raise AuthenticationError(403, 'No permission.')
@@ -56,3 +57,19 @@ class TokenAuthenticate:
             g.user = user
             return func(*args, **kw)
         return wrapper
+
+    @staticmethod
+    def authenticate(token):
+        """验证 token 并返回用户快照
+
+        验证通过的 token 会被缓存，缓存有效期内不再验证签名和查询数据库
+        """
+        if (user := token_cache.get(token)) is not None:
+            return user
+        payload = User.decode_token(token)
+        if not (instance := User.query.get(payload['uid'])):
+            raise InvalidTokenError(403, 'User not exists.')
+        user = instance.snapshot()
+        # 缓存不能比 token 更晚过期
+        token_cache.set(token, user, payload['exp'])
+        return user
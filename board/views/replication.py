@@ -0,0 +1,18 @@
+"""该模块实现主从复制关系查询视图
+"""
+
+from ..common.rest import RestView
+from ..metrics import replication
+from .decorators import TokenAuthenticate
+
+
+class ReplicationGraphView(RestView):
+    """获取全部 Redis 服务器的主从关系和复制延迟
+    """
+
+    method_decorators = (TokenAuthenticate(), )
+
+    def get(self):
+        """数据来自后台采集器，不对 Redis 服务器执行任何命令
+        """
+        return replication.graph()
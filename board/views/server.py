@@ -1,7 +1,21 @@
-from flask import request, g
+import io
+import csv
+import json
+import time
+from redis import RedisError
+from flask import request, g, current_app, Response, stream_with_context
 
 from ..common.rest import RestView
-from ..models import Server, ServerSchema
+from ..common.errors import RestError
+from ..common.probe import probe_servers, probe, batch_deadline
+from ..common.listing import filter_query, parse_fields, restrict_columns
+from ..common.listing import paginate, int_arg, float_arg
+from ..common.serializers import get_dumper
+from ..models import db, Server, ServerSchema, MetricSample, INFO_SECTIONS
+from ..metrics import collector, broadcaster, FIELDS
+from ..metrics import SlowlogBuffer, aggregate, summarize
+from ..metrics import Topology, discover
+from ..metrics.slowlog import queue_commands, parse_results
 from .decorators import ObjectMustExists, TokenAuthenticate
 
 
@@ -11,14 +25,38 @@ class ServerListView(RestView):
 
     method_decorators = (TokenAuthenticate(admin=True), )
 
+    # 支持的过滤查询参数
+    filters = {'name__prefix': ('name', 'prefix'), 'host': ('host', 'eq'),
+            'tag': ('tag', 'eq')}
+
     def get(self):
         """获取 Redis 列表
+
+        查询参数 limit 和 cursor 用于分页，下一页的游标在响应头 X-Next-Cursor 中
+        查询参数 name__prefix 和 host 用于过滤，fields 用于指定返回的字段
         """
-        servers = Server.query.all()
+        with_status = request.args.get('with_status') == '1'
+        fields = parse_fields(ServerSchema)
+        query = filter_query(Server.query, Server, self.filters)
+        # 检测服务器状态需要用到地址、端口和密码
+        columns = fields
+        if fields is not None and with_status:
+            columns = fields + ('host', 'port', 'password')
+        query = restrict_columns(query, Server, columns)
+        servers, headers = paginate(query, Server)
+        # 预先生成的序列化函数，效果与 ServerSchema(only=fields).dump 相同
+        dump = get_dumper(ServerSchema, fields)
+        if not with_status:
+            # 返回生成器，RestView 会以流的形式逐条序列化并发送
+            return (dump(server) for server in servers), 200, headers
+        servers = list(servers)
         # data 的值是列表，列表中的元素是字典，字典由 servers 转换而来
-        # many=True 参数保证可以处理多个 Server 实例
-        data = ServerSchema().dump(servers, many=True).data
-        return data
+        data = [dump(server) for server in servers]
+        # 查询参数 with_status=1 时并发检测每个服务器的状态
+        statuses = probe_servers(servers)
+        for server, item in zip(servers, data):
+            item['status'] = statuses[server.id]
+        return data, 200, headers
 
     def post(self):
         """创建 Redis 服务器
@@ -36,6 +74,138 @@ class ServerListView(RestView):
         return {'ok': True}, 201
 
 
+class ServerBulkView(RestView):
+    """该视图类用于批量导出和批量导入 Redis 服务器
+
+    支持两种格式：JSON Lines（每行一个 JSON 对象）和带表头的 CSV
+    """
+
+    method_decorators = (TokenAuthenticate(admin=True), )
+
+    # 导入和导出的字段
+    columns = ('name', 'description', 'host', 'port', 'password', 'tag',
+            'kind', 'master_name')
+    jsonl_type = 'application/x-ndjson'
+    csv_type = 'text/csv'
+
+    def get(self):
+        """导出全部 Redis 服务器，查询参数 format=csv 时导出为 CSV
+        """
+        fmt = request.args.get('format')
+        if fmt is None:
+            best = request.accept_mimetypes.best_match(
+                    [self.jsonl_type, self.csv_type], self.jsonl_type)
+            fmt = 'csv' if best == self.csv_type else 'jsonl'
+        query = db.session.query(*[getattr(Server, c) for c in self.columns])
+        rows = (dict(zip(self.columns, row)) for row in query.yield_per(500))
+        generate = self.generate_csv if fmt == 'csv' else self.generate_jsonl
+        mimetype = self.csv_type if fmt == 'csv' else self.jsonl_type
+        # 逐行生成导出内容并以流的形式发送
+        return Response(stream_with_context(generate(rows)), mimetype=mimetype)
+
+    def generate_csv(self, rows):
+        buf = io.StringIO()
+        writer = csv.DictWriter(buf, self.columns)
+        writer.writeheader()
+        for row in rows:
+            writer.writerow(row)
+            if buf.tell() >= RestView.chunk_size:
+                yield buf.getvalue()
+                buf.seek(0)
+                buf.truncate()
+        yield buf.getvalue()
+
+    @staticmethod
+    def generate_jsonl(rows):
+        for row in rows:
+            yield json.dumps(row, ensure_ascii=False) + '\n'
+
+    def post(self):
+        """批量导入 Redis 服务器
+
+        请求头 Content-Type 为 text/csv 时按 CSV 解析，否则按 JSON Lines 解析
+        全部记录验证完毕并并发检测连接后，有效的记录在一个事务中保存
+        返回值包含每条记录的处理结果
+        """
+        rows, results = self.parse(request.get_data(as_text=True))
+        limit = current_app.config.get('BULK_MAX_ROWS', 5000)
+        if len(rows) + len(results) > limit:
+            raise RestError(400, f'Too many rows, the limit is {limit}.')
+        # 一次查询出与导入记录重名的全部服务器名
+        names = {row['name'] for row in rows.values() if row.get('name')}
+        names = {name for name, in db.session.query(Server.name).filter(
+                Server.name.in_(names))}
+        candidates = {}
+        for line, row in rows.items():
+            if row.get('host') == 'localhost':
+                row['host'] = '127.0.0.1'
+            server, errors = ServerSchema(context={'names': names}).load(row)
+            if errors:
+                results[line] = self.first_error(errors)
+                continue
+            # 同一批记录中的服务器名也不能重复
+            names.add(server.name)
+            candidates[line] = server
+        # 死机的服务器会占用检测线程，整体时限按记录数放宽
+        # 避免排在后面的可以连接的服务器因时限用尽被误判为超时
+        statuses = probe({line: server.pool_key
+            for line, server in candidates.items()},
+            deadline=batch_deadline(len(candidates),
+                current_app.config.get('BULK_PROBE_MAX_DEADLINE', 120)))
+        created = []
+        for line, server in candidates.items():
+            if statuses[line] == 'ok':
+                created.append(server)
+                results[line] = None
+            elif statuses[line] == 'timeout':
+                results[line] = f'Redis server {server.host} timed out.'
+            else:
+                results[line] = f'Redis server {server.host} can\'t be connected.'
+        db.session.add_all(created)
+        db.session.commit()
+        report = [{'line': line, 'ok': message is None, 'message': message}
+                for line, message in sorted(results.items())]
+        return {'ok': True, 'created': len(created), 'results': report}
+
+    def parse(self, content):
+        """解析请求数据
+
+        Return:
+            rows (dict): 键是行号，值是字典
+            results (dict): 键是行号，值是无法解析的记录的错误信息
+        """
+        rows, results = {}, {}
+        if request.mimetype == self.csv_type:
+            reader = csv.DictReader(io.StringIO(content))
+            # 表头是第 1 行，数据从第 2 行开始
+            for line, row in enumerate(reader, 2):
+                # 空字段视为未提供
+                rows[line] = {k: v for k, v in row.items() if k and v}
+            return rows, results
+        for line, text in enumerate(content.splitlines(), 1):
+            if not text.strip():
+                continue
+            try:
+                row = json.loads(text)
+            except ValueError:
+                results[line] = 'Invalid JSON.'
+                continue
+            if not isinstance(row, dict):
+                results[line] = 'Invalid JSON.'
+                continue
+            rows[line] = row
+        return rows, results
+
+    @staticmethod
+    def first_error(errors):
+        """从 marshmallow 的错误信息字典中取出第一条错误信息
+        """
+        for value in errors.values():
+            if isinstance(value, list) and len(value) > 0:
+                return value[0]
+            return value
+
+
 class ServerDetailView(RestView):
     """该视图类用于对某个服务器进行查询、更新和删除操作
     """
@@ -58,6 +228,8 @@ class ServerDetailView(RestView):
         # 这里需要在实例化 schema 载体的时候给 context 属性赋值
         # 也就是将 object_id 对应的 Server 实例存入 self.context 字典里
         schema = ServerSchema(context={'instance': g.instance})
+        # 反序列化会直接修改 g.instance 的属性，所以要预先记下旧的连接池键
+        pool_key = g.instance.pool_key
         # data 是字典对象，保存着由客户端发来的数据
         data = request.get_json()
         # partial=True 的作用是将 data 字典中的字段更新到 context.instance 中
@@ -69,11 +241,15 @@ class ServerDetailView(RestView):
         if errors:
             return errors, 400
         server.save()
+        # 地址、端口或密码被修改后，旧的连接池可能就没用了
+        if server.pool_key != pool_key:
+            Server.release_pool(pool_key)
         return {'ok': True}
 
     def delete(self, object_id):
         """删除服务器
         """
+        # Server.delete 方法会同时移除不再使用的连接池
         g.instance.delete()
         # 状态码 204 的意思是请求执行成功，但不跳转到新页面，也不刷新当前页面
         return {'ok': True}, 204
@@ -86,6 +262,206 @@ class ServerMetricsView(RestView):
     # 注意针对某个 Server 实例的请求须使用 ObjectMustBeExist 实例装饰器处理
     method_decorators = [TokenAuthenticate(), ObjectMustExists(Server)]
 
-    # TODO 如何限制访问频率
     def get(self, object_id):
+        """查询参数 section 是逗号分隔的 INFO 分组名称
+        查询参数 fields 是逗号分隔的字段名，只返回这些字段
+        """
+        sections = request.args.get('section')
+        fields = request.args.get('fields')
+        if sections:
+            sections = sections.lower().split(',')
+            if (unknown := set(sections) - set(INFO_SECTIONS)):
+                unknown = ','.join(sorted(unknown))
+                raise RestError(400, f'Unknown sections: {unknown}.')
+            # 指定分组时只对 Redis 服务器执行这些分组的 INFO 命令
+            info = g.instance.get_metrics(sections)
+        else:
+            info = self.get_latest(object_id)
+        if fields:
+            info = {key: info[key] for key in fields.split(',') if key in info}
+        return info
+
+    @staticmethod
+    def get_latest(object_id):
+        """获取服务器的全部默认监控信息
+        """
+        # 优先使用后台采集器最近一次采集的数据
+        # 超过两个采集间隔仍未更新，说明采集器未开启或该服务器采集失败
+        max_age = collector.interval * 2
+        if (info := collector.latest(object_id, max_age)) is not None:
+            return info
         return g.instance.get_metrics()
+
+
+class ServerSummaryView(RestView):
+    """汇总全部 Redis 服务器的最新监控数据
+    """
+
+    method_decorators = [TokenAuthenticate()]
+
+    def get(self):
+        """查询参数 group_by 为 tag 时同时返回每个标签的汇总
+        没有标签的服务器分组名为空字符串
+
+        只使用后台采集器的数据，超过两个采集间隔未更新的服务器计为不可用
+        """
+        group_by = request.args.get('group_by')
+        if group_by not in (None, 'tag'):
+            raise RestError(400, 'Invalid group_by.')
+        max_age = collector.interval * 2
+        # 只查询需要的两列，不创建映射类实例
+        rows = db.session.query(Server.id, Server.tag)
+        return summarize(((tag or '') if group_by else None,
+            collector.latest(server_id, max_age)) for server_id, tag in rows)
+
+
+class ServerMetricsStreamView(RestView):
+    """以 Server-Sent Events 的形式推送 Redis 服务器监控数据的变化
+
+    数据来自后台采集器，订阅者不会对 Redis 服务器执行任何命令
+    事件格式见 board.metrics.stream 模块
+    没有开启后台采集器时（例如开发环境的 METRICS_COLLECTOR 为 False）返回 503
+    """
+
+    method_decorators = [TokenAuthenticate(), ObjectMustExists(Server)]
+
+    def get(self, object_id):
+        if not collector.running:
+            raise RestError(503, 'Metrics collector is not running.')
+        headers = {'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+        return Response(self.generate(object_id),
+                mimetype='text/event-stream', headers=headers)
+
+    @staticmethod
+    def generate(object_id):
+        # 开始发送响应时才订阅，客户端在此之前断开时不会留下订阅者
+        sample = collector.latest_sample(object_id) or ()
+        subscriber = broadcaster.subscribe(object_id, *sample)
+        try:
+            while True:
+                message = subscriber.get(broadcaster.keepalive)
+                # 以冒号开头的行是注释，用于保持连接并及时发现客户端断开
+                yield message if message is not None else ': keepalive\n\n'
+        finally:
+            broadcaster.unsubscribe(object_id, subscriber)
+
+
+class ServerMetricsHistoryView(RestView):
+    """获取 Redis 服务器一段时间内的监控数据
+    """
+
+    method_decorators = [TokenAuthenticate(), ObjectMustExists(Server)]
+
+    def get(self, object_id):
+        """查询参数 since 是起始时间戳，fields 是逗号分隔的字段名
+
+        提供查询参数 resolution 时，从持久化的监控数据中查询
+        其值为数据精度：0 是原始数据，60 是每分钟汇总，3600 是每小时汇总
+        """
+        since = float_arg('since')
+        resolution = int_arg('resolution')
+        if resolution is None:
+            fields = self.get_fields(FIELDS)
+        elif resolution in (0, 60, 3600):
+            return self.from_store(object_id, resolution, since,
+                    self.get_fields(MetricSample.value_fields()))
+        else:
+            raise RestError(400, 'Invalid resolution.')
+        buffer = collector.history(object_id)
+        if buffer is None:
+            return {'timestamps': [], 'values': {f: [] for f in fields}}
+        return buffer.since(since, fields)
+
+    @staticmethod
+    def get_fields(available):
+        """解析查询参数 fields ，未提供时返回全部可用字段
+        """
+        if not (fields := request.args.get('fields')):
+            return available
+        fields = fields.split(',')
+        if (unknown := set(fields) - set(available)):
+            unknown = ','.join(sorted(unknown))
+            raise RestError(400, f'Unknown fields: {unknown}.')
+        return fields
+
+    @staticmethod
+    def from_store(object_id, resolution, since, fields):
+        """从持久化的监控数据中查询，返回值的格式与环形缓冲区的相同
+        """
+        samples = MetricSample.query_range(object_id, resolution, since)
+        return {'timestamps': [sample.timestamp for sample in samples],
+                'values': {name: [getattr(sample, name) for sample in samples]
+                    for name in fields}}
+
+
+class ServerSlowlogView(RestView):
+    """获取 Redis 服务器的慢查询记录和延迟监控数据
+    """
+
+    method_decorators = [TokenAuthenticate(), ObjectMustExists(Server)]
+
+    def get(self, object_id):
+        """查询参数 since 是起始时间戳，只返回开始时间晚于它的慢查询记录
+        查询参数 limit 是最多返回的慢查询记录数，按命令名汇总时不受其限制
+        """
+        since = int_arg('since')
+        limit = int_arg('limit', 100)
+        if limit < 1:
+            raise RestError(400, 'Invalid limit.')
+        buffer = collector.slowlog(object_id) or self.fetch()
+        entries = buffer.entries(since)
+        return {
+            'entries': [entry._asdict() for entry in entries[:limit]],
+            'commands': aggregate(entries),
+            'latency': buffer.latency(),
+        }
+
+    @staticmethod
+    def fetch():
+        """采集器没有该服务器的数据时，直接从 Redis 服务器获取
+        """
+        buffer = SlowlogBuffer()
+        pipe = g.instance.redis.pipeline(transaction=False)
+        queue_commands(pipe, current_app.config.get('SLOWLOG_FETCH_SIZE', 128),
+                [])
+        try:
+            results = pipe.execute(raise_on_error=False)
+        except RedisError:
+            raise RestError(400,
+                    f"Redis server {g.instance.host} can't be connected.")
+        buffer.ingest(*parse_results(results, []))
+        return buffer
+
+
+class ServerTopologyView(RestView):
+    """获取 cluster 或 sentinel 类型服务器的拓扑
+    """
+
+    method_decorators = [TokenAuthenticate(), ObjectMustExists(Server)]
+
+    def get(self, object_id):
+        """返回全部节点、每个分片的汇总数据和拓扑变化记录
+        查询参数 since 是起始时间戳，只返回此后的拓扑变化
+        """
+        server = g.instance
+        if server.kind not in ('cluster', 'sentinel'):
+            raise RestError(400, 'Server is not a cluster or sentinel.')
+        since = request.args.get('since', type=float)
+        topology = collector.topology(object_id)
+        if topology is None or topology.kind != server.kind:
+            topology = self.discover(server)
+        return topology.to_dict(since)
+
+    @staticmethod
+    def discover(server):
+        """采集器没有该服务器的拓扑时，直接从入口节点获取，此时没有节点的监控数据
+        """
+        topology = Topology(server.kind)
+        try:
+            nodes, peers = discover(server.kind, [(server.host, server.port)],
+                    server.password, server.master_name)
+        except RedisError:
+            raise RestError(400,
+                    f"Redis server {server.host} can't be connected.")
+        topology.update(time.time(), nodes, peers)
+        return topology
@@ -6,8 +6,14 @@ from flask import Blueprint
 from .index import IndexView
 from .auth import AuthView
 from .server import ServerListView, ServerDetailView, ServerMetricsView
+from .server import ServerMetricsHistoryView, ServerBulkView
+from .server import ServerSlowlogView, ServerMetricsStreamView
+from .server import ServerSummaryView, ServerTopologyView
 from .user import UserListView, UserDetailView
-from .wx import WxView, WxBindView
+from .analysis import KeyspaceAnalysisView, BigKeysView, CommandTopView
+from .alert import AlertListView, AlertRuleListView, AlertRuleDetailView
+from .replication import ReplicationGraphView
+from .wx import WxView, WxBindView, WxStatsView
 
 # 创建 API 蓝图
 api = Blueprint('api', __name__)
@@ -36,6 +42,13 @@ api.add_url_rule('/login', view_func=AuthView.as_view('login'))
 # 查询 Redis 服务器列表和新增 Redis 服务器
 api.add_url_rule('/servers/', view_func=ServerListView.as_view('server_list'))
 
+# 批量导出和批量导入 Redis 服务器
+api.add_url_rule('/servers/bulk', view_func=ServerBulkView.as_view('server_bulk'))
+
+# 汇总全部 Redis 服务器的最新监控数据
+api.add_url_rule('/servers/metrics/summary',
+        view_func=ServerSummaryView.as_view('server_summary'))
+
 # 查询、修改或删除某个 Redis 服务器
 api.add_url_rule('/servers/<int:object_id>', 
         view_func=ServerDetailView.as_view('server_detail'))
@@ -44,11 +57,51 @@ api.add_url_rule('/servers/<int:object_id>',
 api.add_url_rule('/servers/<int:object_id>/metrics',
         view_func=ServerMetricsView.as_view('server_metrics'))
 
+# 获取 Redis 服务器一段时间内的监控数据
+api.add_url_rule('/servers/<int:object_id>/metrics/history',
+        view_func=ServerMetricsHistoryView.as_view('server_metrics_history'))
+
+# 以 Server-Sent Events 的形式推送 Redis 服务器监控数据的变化
+api.add_url_rule('/servers/<int:object_id>/metrics/stream',
+        view_func=ServerMetricsStreamView.as_view('server_metrics_stream'))
+
+# 获取 Redis 服务器的慢查询记录和延迟监控数据
+api.add_url_rule('/servers/<int:object_id>/slowlog',
+        view_func=ServerSlowlogView.as_view('server_slowlog'))
+
+# 获取 Redis Cluster 或 Sentinel 的拓扑
+api.add_url_rule('/servers/<int:object_id>/topology',
+        view_func=ServerTopologyView.as_view('server_topology'))
+
+# 按键名前缀分析 Redis 服务器的内存用量
+api.add_url_rule('/servers/<int:object_id>/keyspace/analysis',
+        view_func=KeyspaceAnalysisView.as_view('keyspace_analysis'))
+
+# 查找 Redis 服务器的大键和热键
+api.add_url_rule('/servers/<int:object_id>/bigkeys',
+        view_func=BigKeysView.as_view('bigkeys'))
+
+# 查询 Redis 服务器每种命令的调用速率，以及采样统计最频繁的命令和键名前缀
+api.add_url_rule('/servers/<int:object_id>/commands/top',
+        view_func=CommandTopView.as_view('command_top'))
+
 # 用户管理
 api.add_url_rule('/users/', view_func=UserListView.as_view('user_list'))
 api.add_url_rule('/users/<int:object_id>',
         view_func=UserDetailView.as_view('user_detail'))
 
+# 当前告警和告警规则管理
+api.add_url_rule('/alerts/', view_func=AlertListView.as_view('alert_list'))
+api.add_url_rule('/alerts/rules/',
+        view_func=AlertRuleListView.as_view('alert_rule_list'))
+api.add_url_rule('/alerts/rules/<int:object_id>',
+        view_func=AlertRuleDetailView.as_view('alert_rule_detail'))
+
+# 主从复制关系和复制延迟
+api.add_url_rule('/replication/graph',
+        view_func=ReplicationGraphView.as_view('replication_graph'))
+
 # 微信接口
 api.add_url_rule('/wx', view_func=WxView.as_view('wx_view'))
 api.add_url_rule('/wx/bind/<wx_id>', view_func=WxBindView.as_view('wx_bind'))
+api.add_url_rule('/wx/stats', view_func=WxStatsView.as_view('wx_stats'))
@@ -5,6 +5,10 @@ from flask import request, g
 
 from ..common.rest import RestView
 from ..common.errors import RestError
+from ..common.cache import token_cache
+from ..common.listing import filter_query, parse_fields, restrict_columns
+from ..common.listing import paginate
+from ..common.serializers import get_dumper
 from ..models import User, UserSchema
 from .decorators import ObjectMustExists, TokenAuthenticate
 
@@ -18,11 +22,18 @@ class UserListView(RestView):
 
     method_decorators = (TokenAuthenticate(admin=True), )
 
+    # 支持的过滤查询参数
+    filters = {'name__prefix': ('name', 'prefix'), 'email': ('email', 'eq')}
+
     def get(self):
-        """获取用户列表"""
+        """获取用户列表，查询参数与服务器列表 API 的相同"""
 
-        users = User.query.all()
-        return UserSchema().dump(users, many=True).data
+        fields = parse_fields(UserSchema)
+        query = filter_query(User.query, User, self.filters)
+        query = restrict_columns(query, User, fields)
+        users, headers = paginate(query, User)
+        dump = get_dumper(UserSchema, fields)
+        return [dump(user) for user in users], 200, headers
 
     def post(self):
         """创建新用户"""
@@ -56,6 +67,8 @@ class UserDetailView(RestView):
         if errors:
             return errors, 400
         server.save()
+        # 用户信息被修改，缓存的用户快照已经过时
+        token_cache.invalidate_user(g.instance.id)
         return {'ok': True}
 
     def delete(self, object_id):
@@ -66,4 +79,5 @@ class UserDetailView(RestView):
             raise RestError(400, 'You can not delete yourself')
 
         g.instance.delete()
+        token_cache.invalidate_user(g.instance.id)
         return {'ok': True}, 204
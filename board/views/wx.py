@@ -4,11 +4,11 @@
 import hashlib
 from flask import request, current_app, abort, render_template, make_response
 from flask.views import MethodView
-from wechatpy import parse_message, create_reply
 
 from ..models import User
 from ..wx import wx_dispatcher
 from ..common.rest import RestView
+from .decorators import TokenAuthenticate
 
 
 class WxView(MethodView):
@@ -40,6 +40,9 @@ class WxView(MethodView):
     def post(self):
         """处理微信消息
         """
+        # 只有处理微信消息时才用到 wechatpy ，在这里导入以加快应用启动
+        from wechatpy import parse_message
+
         self.check_signature()
         # request.data 是 XML 标记语言编写的字符串
         # 使用 parse_message 可以将其处理成 OrderedDict 有序字典对象
@@ -80,3 +83,14 @@ class WxBindView(RestView):
         user.save()
         return {'ok': True, 'message': '绑定成功'}
 
+
+class WxStatsView(RestView):
+    """微信消息处理器的调用统计，只有管理员用户才有权限查看
+    """
+
+    method_decorators = (TokenAuthenticate(admin=True), )
+
+    def get(self):
+        """获取各个消息处理器的调用次数和耗时
+        """
+        return wx_dispatcher.stats()
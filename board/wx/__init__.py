@@ -1,3 +1,5 @@
 from .dispatchers import MessageDispatcher
+from .outbox import Outbox
 
 wx_dispatcher = MessageDispatcher()
+wx_outbox = Outbox()
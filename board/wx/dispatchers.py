@@ -1,10 +1,61 @@
 """微信消息处理逻辑
+
+初始化时为消息处理器建立两个索引：
+
+- 命令索引：键是命令，例如 'ip' 、'redis' ，值是处理该命令的处理器
+- 消息类型索引：键是消息类型，例如 'text' 、'event:subscribe'
+  值是没有命令的处理器列表，命令处理器不处理该消息时依次调用
+
+文本消息只分词一次，根据第一个词直接找到命令处理器，不必逐个调用全部处理器
+
+微信要求公众号在 5 秒内回复消息，slow 属性为 True 的处理器可能超过这个时限
+这类处理器在后台线程池中运行，公众号接口立即返回空回复
+处理结果通过客服消息接口发送给用户，每个用户同时处理的慢命令数量有限制
+
+导入 wechatpy 和创建消息处理器都比较耗时，执行 flask 命令或者运行测试时往往用不到
+微信客户端在首次使用时创建，消息处理器在首次处理消息时创建
 """
 
-from wechatpy import WeChatClient
-from wechatpy.replies import BaseReply, EmptyReply
+import time
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+
 
-from .handlers import default_handlers
+logger = logging.getLogger(__name__)
+
+
+def message_type(msg):
+    """消息类型字符串，事件消息包括事件类型，例如 'event:subscribe'
+    """
+    if msg.type == 'event':
+        return f'event:{msg.event}'
+    return msg.type
+
+
+class HandlerStats:
+    """消息处理器的调用统计
+    """
+
+    __slots__ = ('hits', 'total_time', 'max_time')
+
+    def __init__(self):
+        # 调用次数、总耗时和最大耗时，单位是秒
+        self.hits = 0
+        self.total_time = 0.0
+        self.max_time = 0.0
+
+    def record(self, elapsed):
+        self.hits += 1
+        self.total_time += elapsed
+        if elapsed > self.max_time:
+            self.max_time = elapsed
+
+    def to_dict(self):
+        average = self.total_time / self.hits if self.hits else 0.0
+        return {'hits': self.hits,
+                'avg_ms': round(average * 1000, 3),
+                'max_ms': round(self.max_time * 1000, 3)}
 
 
 class MessageDispatcher:
@@ -12,28 +63,100 @@ class MessageDispatcher:
     """
 
     def __init__(self, app=None):
-        self.handlers = []
+        self.app = None
+        self.handlers = None
+        self.commands = {}
+        self.fallbacks = {}
+        self._client = None
+        self.slow_workers = 4
+        self.max_inflight = 1
+        self._stats = {}
+        # 每个微信用户正在后台处理的慢命令数量
+        self._inflight = {}
+        self._pending = set()
+        self._executor = None
+        self._lock = threading.Lock()
         if app:
             self.init_app(app)
 
     def init_app(self, app):
-        """初始化应用
+        """初始化应用，这里只保存配置，微信客户端和消息处理器在首次使用时创建
         """
-        # 创建微信客户端需提供两个参数 appid 和 secret 
-        # 它们分别对应微信公众号页面上的 appID 和 appsecret 字段
-        self.wx_client = WeChatClient(app.config.get('WX_APP_ID'),
-                app.config.get('WX_SECRET'))
+        app.extensions['wx_dispatcher'] = self
+        self.app = app
+        self.slow_workers = app.config.get('WX_SLOW_WORKERS', 4)
+        self.max_inflight = app.config.get('WX_SLOW_MAX_INFLIGHT', 1)
+        # 每次创建应用都会调用 init_app ，清空之前创建的客户端和处理器
+        with self._lock:
+            self._client = None
+            self.handlers = None
+            self.commands = {}
+            self.fallbacks = {}
+            self._stats = {}
 
-        for handler_class in default_handlers:
-            # handler 为 handlers 模块中的消息处理类的实例
-            handler = handler_class(wx_client=self.wx_client)
-            # 将实例添加到 self.handlers 列表中
-            self.register_handler(handler)
+    @property
+    def wx_client(self):
+        """微信客户端，首次使用时创建
+        """
+        if self._client is None:
+            from wechatpy import WeChatClient
+            with self._lock:
+                if self._client is None:
+                    config = self.app.config
+                    # 创建微信客户端需提供两个参数 appid 和 secret
+                    # 它们分别对应微信公众号页面上的 appID 和 appsecret 字段
+                    self._client = WeChatClient(config.get('WX_APP_ID'),
+                            config.get('WX_SECRET'),
+                            session=self.session(self.app))
+        return self._client
+
+    def load_handlers(self):
+        """创建全部默认的消息处理器，首次处理消息时调用
+        """
+        if self.handlers is not None:
+            return self.handlers
+        from .handlers import default_handlers
+        client = self.wx_client
+        with self._lock:
+            if self.handlers is None:
+                self.handlers = []
+                for handler_class in default_handlers:
+                    # handler 为 handlers 模块中的消息处理类的实例
+                    # 将实例添加到 self.handlers 列表中，并加入索引
+                    self._register(handler_class(wx_client=client))
+        return self.handlers
+
+    def session(self, app):
+        """微信客户端保存 access token 的存储对象
+
+        access token 每天的获取次数有限，并且重新获取会使旧的很快失效
+        配置了 WX_SESSION_REDIS_URL 时保存在 Redis 中，多个进程共享同一个 access token
+        否则使用 wechatpy 默认的内存存储，只在进程内的各个线程之间共享
+        """
+        if (url := app.config.get('WX_SESSION_REDIS_URL')):
+            from redis import StrictRedis
+            from wechatpy.session.redisstorage import RedisStorage
+            return RedisStorage(StrictRedis.from_url(url), prefix='board:wx')
+        return None
 
     def register_handler(self, handler):
-        """添加消息处理类的实例到 self.handlers 列表
+        """添加消息处理类的实例到 self.handlers 列表，并根据命令或消息类型建立索引
+        """
+        self.load_handlers()
+        with self._lock:
+            self._register(handler)
+
+    def _register(self, handler):
+        """添加消息处理器，调用者须持有锁
         """
         self.handlers.append(handler)
+        if handler.command:
+            if handler.command in self.commands:
+                raise ValueError(f'Command {handler.command} already exists.')
+            self.commands[handler.command] = handler
+        else:
+            self.fallbacks.setdefault(handler.message_type, []).append(handler)
+        self._stats[handler] = HandlerStats()
 
     def dispatch(self, msg):
         """调用此私有方法处理微信公众号发来的消息
@@ -43,13 +166,99 @@ class MessageDispatcher:
     def _reply(self, msg):
         """处理消息的核心方法
         """
-        for handler in self.handlers:
-            # 每个消息处理器会判断 msg 的数据类型
-            # 如果不符合，直接返回 None
-            # 如果符合，返回处理之后的 BaseReply 实例
-            reply = handler.handle(msg)
+        from wechatpy.replies import BaseReply
+
+        self.load_handlers()
+        kind = message_type(msg)
+        if kind == 'text':
+            # 文本消息只分词一次，第一个词是命令，其余的词是命令参数
+            tokens = msg.content.split()
+            command = tokens[0].lower() if tokens else ''
+            handler = self.commands.get(command)
+            if handler is not None and handler.slow:
+                return self.defer(handler, msg, tokens[1:])
+            if handler is not None:
+                reply = self._handle(handler, msg, tokens[1:])
+                if isinstance(reply, BaseReply):
+                    return reply
+        return self._fallback(msg, kind)
+
+    def _fallback(self, msg, kind):
+        """命令处理器不处理的消息和其它类型的消息交给对应类型的处理器
+        """
+        from wechatpy.replies import BaseReply, EmptyReply
+
+        for handler in self.fallbacks.get(kind, ()):
+            reply = self._handle(handler, msg, None)
             if isinstance(reply, BaseReply):
                 return reply
         # 如果微信公众号发来的消息不符合任何一个消息处理器的处理规则
         # 返回 EmptyReply 这个类的实例
         return EmptyReply()
+
+    def defer(self, handler, msg, args):
+        """在后台线程池中运行慢命令处理器，立即返回空回复
+        """
+        from wechatpy.replies import EmptyReply, create_reply
+
+        user = msg.source
+        with self._lock:
+            if self._inflight.get(user, 0) >= self.max_inflight:
+                return create_reply('上一个命令正在处理，请稍后再试', msg)
+            self._inflight[user] = self._inflight.get(user, 0) + 1
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                        max_workers=self.slow_workers,
+                        thread_name_prefix='board-wx-slow')
+            future = self._executor.submit(self._run_deferred, handler, msg,
+                    args)
+            self._pending.add(future)
+        future.add_done_callback(self._pending.discard)
+        return EmptyReply()
+
+    def _run_deferred(self, handler, msg, args):
+        """在线程池中运行，通过客服消息接口发送处理结果
+        """
+        from wechatpy.replies import BaseReply, TextReply
+
+        try:
+            with self.app.app_context():
+                reply = self._handle(handler, msg, args)
+                if not isinstance(reply, BaseReply):
+                    reply = self._fallback(msg, 'text')
+            if isinstance(reply, TextReply):
+                self.app.extensions['wx_outbox'].put('message.send_text',
+                        msg.source, reply.content)
+        except Exception:
+            logger.exception('Handle message by %s failed.',
+                    type(handler).__name__)
+        finally:
+            with self._lock:
+                if (count := self._inflight[msg.source] - 1):
+                    self._inflight[msg.source] = count
+                else:
+                    del self._inflight[msg.source]
+
+    def join(self, timeout=None):
+        """等待后台处理中的慢命令全部完成
+        """
+        wait(list(self._pending), timeout=timeout)
+
+    def _handle(self, handler, msg, args):
+        """调用消息处理器并记录调用次数和耗时
+        """
+        start = time.perf_counter()
+        try:
+            if args is None:
+                return handler.handle(msg)
+            return handler.handle(msg, args)
+        finally:
+            elapsed = time.perf_counter() - start
+            with self._lock:
+                self._stats[handler].record(elapsed)
+
+    def stats(self):
+        """各个消息处理器的调用统计，键是处理器的类名
+        """
+        return {type(handler).__name__: stats.to_dict()
+                for handler, stats in self._stats.items()}
@@ -3,13 +3,17 @@
 
 import os
 import re
-from qqwry import QQwry
+import time
 from wechatpy.events import SubscribeEvent
 from wechatpy.messages import TextMessage
 from wechatpy import create_reply
-from flask import url_for
+from flask import url_for, current_app
 
 from ..models import User, Server
+from ..common.probe import probe_servers
+from ..analysis import job_runner, BigKeysResult, find_bigkeys
+from ..metrics import replication
+from .ipdb import get_database
 
 
 class BaseHandlerMeta(type):
@@ -27,7 +31,12 @@ class BaseHandler(metaclass=BaseHandlerMeta):
     """消息处理器基类
     """
 
+    # 处理的命令，即文本消息的第一个词，空字符串表示不处理命令
     command = ''
+    # 没有命令的处理器处理的消息类型，例如 'text' 、'event:subscribe'
+    message_type = 'text'
+    # 为 True 表示处理时间可能超过微信的回复时限，由分发器在后台处理
+    slow = False
 
     def __init__(self, wx_client=None):
         self.wx_client = wx_client
@@ -35,26 +44,36 @@ class BaseHandler(metaclass=BaseHandlerMeta):
     def check_match(self, message):
         """检查消息是否匹配某种命令模式
         """
+        return self.parse(message) is not None
+
+    def parse(self, message):
+        """将文本消息分词，第一个词是该处理器的命令时返回其余的词，否则返回 None
+
+        由消息分发器调用时，分发器已经完成了分词，处理器直接使用分发器提供的参数
+        """
         if not isinstance(message, TextMessage):
-            return False
-        # 字符串的 startswith 方法检查字符串是否以指定的值开头
-        if not message.content.strip().lower().startswith(self.command):
-            return False
-        return True
+            return None
+        tokens = message.content.split()
+        if not tokens or tokens[0].lower() != self.command:
+            return None
+        return tokens[1:]
 
 
 class SubscribeEventHandler(BaseHandler):
     """关注事件处理器，当用户关注公众号时触发的事件
     """
 
+    message_type = 'event:subscribe'
+
     def handle(self, message, *args, **kw):
         """处理消息的核心方法
         """
         # 如果消息的数据类型不是订阅事件类，直接返回 None
         if not isinstance(message, SubscribeEvent):
             return
-        # 获取微信用户信息
-        result = self.wx_client.user.get(message.source)
+        # 获取微信用户信息的调用放入出站队列，不在请求中等待微信 API 返回
+        from . import wx_outbox
+        wx_outbox.put('user.get', message.source)
         # 返回给微信公众号 BaseReply 类的实例
         return create_reply('欢迎关注 Redis Board 公众号。', message)
 
@@ -64,32 +83,41 @@ class IPLocationHandler(BaseHandler):
     """
 
     command = 'ip'
+    # 纯真 IP 数据库文件
+    database_path = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+            '../static/qqwry.dat')
+    # 一条消息最多查询的 IP 数量，避免回复超过微信消息的长度限制
+    max_batch = 20
+    pattern = re.compile(r'^\d{1,3}\.\d{1,3}\.\d{1,3}\.\d{1,3}$')
 
     def __init__(self, wx_client=None):
-        """获取 IP 地址数据
+        """获取 IP 地址数据库，数据库文件在首次查询时才映射到内存
         """
         super().__init__()
-        file = os.path.join(os.path.dirname(os.path.abspath(__file__)),
-                '../static/qqwry.dat')
-        self.q = QQwry()
-        self.q.load_file(file)
+        self.database = get_database(self.database_path)
 
-    def handle(self, message):
+    def handle(self, message, args=None):
         # 判断消息开头是否匹配
-        if not self.check_match(message):
+        if args is None and (args := self.parse(message)) is None:
             return
-        parts = message.content.strip().split()
-        if len(parts) == 1 or len(parts) > 2:
-            return create_reply('IP 地址无效', message)
-        ip = parts[1]
-        pattern = r'^\d{1,3}\.\d{1,3}\.\d{1,3}\.\d{1,3}$'
-        if not re.match(pattern, ip):
+        if not args or len(args) > self.max_batch:
             return create_reply('IP 地址无效', message)
-        result = self.q.lookup(ip)
+        if len(args) == 1:
+            return create_reply(self.locate(args[0]), message)
+        # 批量查询时每行返回一个 IP 的位置
+        content = '\n'.join(f'{ip} {self.locate(ip)}' for ip in args)
+        return create_reply(content, message)
+
+    def locate(self, ip):
+        """查询 IP 地址的位置，返回回复文本
+        """
+        if not self.pattern.match(ip):
+            return 'IP 地址无效'
+        result = self.database.lookup(ip)
         if result:
-            return create_reply(result[0], message)
-        return create_reply('未找到 IP 对应的地址', message)
-            
+            return result[0]
+        return '未找到 IP 对应的地址'
+
 
 class BindBaseHandler(BaseHandler):
     """处理绑定用户的消息
@@ -97,9 +125,9 @@ class BindBaseHandler(BaseHandler):
 
     command = 'bind'
 
-    def handle(self, message):
+    def handle(self, message, args=None):
         # 判断消息是否匹配
-        if not self.check_match(message):
+        if args is None and self.parse(message) is None:
             return
         user = User.get_user_via_wx_id(message.source)
         if user:
@@ -114,28 +142,37 @@ class RedisBaseHandler(BaseHandler):
     """
 
     command = 'redis'
+    # 获取服务器列表时要检测全部服务器的状态，在后台处理
+    slow = True
 
-    def handle(self, message):
-        if not self.check_match(message):
+    def handle(self, message, args=None):
+        if args is None and (args := self.parse(message)) is None:
             return
         user = User.get_user_via_wx_id(message.source)
         if not user:
             return create_reply('未绑定 Redis Board 用户', message)
-        parts = message.content.strip().split()
-        if len(parts) == 1:
+        if not args:
             return
-        if parts[1].lower() == 'ls':
+        if args[0].lower() == 'ls':
             return create_reply(self.server_list(), message)
-        if parts[1].lower() == 'del':
-            return create_reply(self.del_server(*parts[2:]), message)
+        if args[0].lower() == 'del':
+            return create_reply(self.del_server(*args[1:]), message)
+        if args[0].lower() == 'bigkeys':
+            return create_reply(self.bigkeys(user, *args[1:2]), message)
+        if args[0].lower() == 'repl':
+            return create_reply(self.replication(*args[1:2]), message)
         else:
             return
 
     def server_list(self):
         """获取 Redis 服务器列表的字符串
         """
-        content = '\n'.join([f'{server.name} {server.host} {server.status}'
-            for server in Server.query])
+        servers = Server.query.all()
+        # 并发检测全部服务器，超过时限的服务器状态为 timeout
+        statuses = probe_servers(servers)
+        content = '\n'.join([
+            f'{server.name} {server.host} {statuses[server.id]}'
+            for server in servers])
         if content:
             return content
         return '暂无 Redis 服务器'
@@ -155,6 +192,86 @@ class RedisBaseHandler(BaseHandler):
                 result += f'未找到 {name}\n'
         return result.strip()
 
+    def bigkeys(self, user, name=None):
+        """查看服务器的大键分析结果
+
+        没有分析结果或者结果已超过 BIGKEYS_MAX_AGE 秒时启动新的分析任务
+        分析任务会对服务器执行 SCAN 和 MEMORY USAGE 命令，只有管理员可以启动
+        """
+        if not name:
+            return '未指定服务器'
+        server = Server.query.filter_by(name=name).first()
+        if not server:
+            return f'未找到 {name}'
+        job = job_runner.get('bigkeys', server.id)
+        if job is not None and job.active:
+            return f'正在分析 {name} ，已扫描 {job.scanned} 个键'
+        config = current_app.config
+        done = job is not None and job.state == 'done'
+        if done and time.time() - job.finished_at < \
+                config.get('BIGKEYS_MAX_AGE', 3600):
+            return self.format_bigkeys(name, job.result.to_dict(),
+                    job.finished_at)
+        if not user.is_admin:
+            if done:
+                return self.format_bigkeys(name, job.result.to_dict(),
+                        job.finished_at) + '\n结果已过期，须由管理员重新分析'
+            return f'{name} 没有大键分析结果，须由管理员启动分析'
+        params = {'match': None, 'cursor': 0, 'hot': True,
+                'count': config.get('KEYSPACE_SCAN_COUNT', 1000),
+                'max_ops': config.get('KEYSPACE_MAX_OPS', 5000),
+                'top': config.get('BIGKEYS_TOP', 20),
+                'sample_rate': config.get('BIGKEYS_SAMPLE_RATE', 1.0)}
+        job_runner.submit('bigkeys', server, find_bigkeys, params,
+                BigKeysResult(params['top']))
+        return f'开始分析 {name} 的大键，请稍后再次发送该命令查看结果'
+
+    @staticmethod
+    def replication(name=None):
+        """查看主从关系和复制延迟，指定服务器时只显示与其相关的主从关系
+        """
+        graph = replication.graph()
+        names = {node['addr']: node.get('name') or node['addr']
+                for node in graph['nodes']}
+        edges = graph['edges']
+        if name:
+            edges = [edge for edge in edges if name in
+                    (names[edge['master']], names[edge['replica']])]
+        if not edges:
+            return f'{name} 没有主从关系' if name else '暂无主从关系'
+        lines = []
+        for edge in edges:
+            lag = ''
+            if edge['offset_lag'] is not None:
+                lag = f" 落后 {edge['offset_lag']}B"
+            if edge['time_lag'] is not None:
+                prefix = '' if edge['time_lag_exact'] else '>'
+                lag += f" {prefix}{edge['time_lag']:.0f}s"
+            lines.append(f"{names[edge['master']]} -> "
+                    f"{names[edge['replica']]} {edge['state']}{lag}")
+        return '\n'.join(lines)
+
+    @staticmethod
+    def format_bigkeys(name, result, finished_at=None, count=5):
+        """大键分析结果的文本，只显示前 count 个键
+
+        finished_at 是分析完成的时间戳，不为 None 时显示在第一行
+        """
+        lines = []
+        if finished_at is not None:
+            lines.append(time.strftime('分析于 %Y-%m-%d %H:%M:%S',
+                time.localtime(finished_at)))
+        lines.append(f'{name} 内存最大的键：')
+        lines.extend(f'{item["key"]} {item["type"]} {item["memory"]}B'
+                for item in result['memory'][:count])
+        if result['hot']:
+            lines.append('访问最频繁的键：')
+            lines.extend(f'{item["key"]} {item["freq"]}'
+                    for item in result['hot'][:count])
+        if not result['memory'] and not result['hot']:
+            lines[-1] = f'{name} 没有键'
+        return '\n'.join(lines)
+
 
 class EchoHandler(BaseHandler):
     """文本消息处理类
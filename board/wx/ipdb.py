@@ -0,0 +1,157 @@
+"""纯真 IP 数据库（qqwry.dat）查询模块
+
+QQwry.load_file 把整个数据库文件读入内存，每个进程、每次创建应用都要读一次
+这里使用只读的 mmap 映射数据库文件，同一台机器上的全部进程共享操作系统的页缓存
+查询时在索引区二分查找，只读取需要的几个字节，不解码整个文件
+
+数据库文件格式（整数都是小端字节序）：
+
+- 文件头 8 字节：第一条索引和最后一条索引的偏移量
+- 索引区每条记录 7 字节：起始 IP （4 字节）和对应记录的偏移量（3 字节）
+- 记录：结束 IP （4 字节）和地址信息，地址信息是 GBK 编码、以 0 结尾的国家和地区字符串
+  字符串的第一个字节为 1 表示国家和地区都重定向到 3 字节偏移量处
+  为 2 表示只有该字符串重定向到 3 字节偏移量处
+"""
+
+import os
+import mmap
+import socket
+import struct
+import logging
+import threading
+
+from ..common.cache import LRUCache
+
+
+logger = logging.getLogger(__name__)
+
+_MISSING = object()
+_databases = {}
+_databases_lock = threading.Lock()
+
+
+class IPDatabase:
+    """纯真 IP 数据库，首次查询时映射文件
+    """
+
+    def __init__(self, path, cache_size=4096):
+        self.path = path
+        self.cache = LRUCache(cache_size, ttl=86400)
+        self._data = None
+        self._index_begin = 0
+        self._count = 0
+        # 文件不存在或格式错误时为 False ，不再重复尝试打开
+        self._available = None
+        self._lock = threading.Lock()
+
+    def open(self):
+        """映射数据库文件，成功返回 True
+        """
+        with self._lock:
+            if self._available is not None:
+                return self._available
+            try:
+                with open(self.path, 'rb') as f:
+                    data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except (OSError, ValueError) as e:
+                logger.error('Open IP database %s failed: %s', self.path, e)
+                self._available = False
+                return False
+            begin, end = struct.unpack_from('<II', data, 0) \
+                    if len(data) >= 8 else (1, 0)
+            if begin > end or (end - begin) % 7 or end + 7 > len(data):
+                logger.error('Invalid IP database %s.', self.path)
+                data.close()
+                self._available = False
+                return False
+            self._data = data
+            self._index_begin = begin
+            self._count = (end - begin) // 7 + 1
+            self._available = True
+            return True
+
+    def close(self):
+        with self._lock:
+            if self._data is not None:
+                self._data.close()
+            self._data = None
+            self._available = None
+            self.cache.clear()
+
+    def lookup(self, ip):
+        """查询 IP 地址的位置
+
+        Args:
+            ip (str): 点分十进制的 IPv4 地址
+
+        Return:
+            tuple: (国家, 地区) ，地址无效或未找到时返回 None
+        """
+        if (result := self.cache.get(ip, _MISSING)) is not _MISSING:
+            return result
+        if not self.open():
+            return None
+        try:
+            number = struct.unpack('>I', socket.inet_aton(ip))[0]
+        except OSError:
+            return None
+        result = self._search(number)
+        self.cache.set(ip, result)
+        return result
+
+    def _search(self, number):
+        """在索引区中二分查找起始 IP 不大于 number 的最后一条索引
+        """
+        data = self._data
+        low, high = 0, self._count
+        while high - low > 1:
+            middle = (low + high) // 2
+            start, = struct.unpack_from('<I', data,
+                    self._index_begin + middle * 7)
+            if number < start:
+                high = middle
+            else:
+                low = middle
+        position = self._index_begin + low * 7
+        start, = struct.unpack_from('<I', data, position)
+        offset = self._int3(position + 4)
+        end, = struct.unpack_from('<I', data, offset)
+        if not start <= number <= end:
+            return None
+        return self._address(offset + 4)
+
+    def _int3(self, offset):
+        return int.from_bytes(self._data[offset:offset + 3], 'little')
+
+    def _string(self, offset):
+        end = self._data.find(b'\x00', offset)
+        return self._data[offset:end].decode('gb18030', errors='replace')
+
+    def _address(self, offset):
+        data = self._data
+        mode = data[offset]
+        if mode == 1:
+            offset = self._int3(offset + 1)
+            mode = data[offset]
+        if mode == 2:
+            country = self._string(self._int3(offset + 1))
+            offset += 4
+        else:
+            country = self._string(offset)
+            offset = data.find(b'\x00', offset) + 1
+        if data[offset] in (1, 2):
+            offset = self._int3(offset + 1)
+            # 偏移量为 0 表示没有地区信息
+            if not offset:
+                return country, ''
+        return country, self._string(offset)
+
+
+def get_database(path, cache_size=4096):
+    """获取进程内共享的数据库对象，同一个文件只映射一次
+    """
+    path = os.path.abspath(path)
+    with _databases_lock:
+        if (database := _databases.get(path)) is None:
+            database = _databases[path] = IPDatabase(path, cache_size)
+        return database
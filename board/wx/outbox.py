@@ -0,0 +1,254 @@
+"""微信公众号出站消息队列
+
+调用微信 API 的地方（关注事件获取用户信息、发送告警通知等）只把调用放入队列
+由后台线程统一发送，这样公众号的 /wx 接口和采集线程都不会被微信 API 阻塞：
+
+- 使用令牌桶限制调用频率，突发的大量调用不会超过微信 API 的频率限制
+- 每次从队列中取出一批调用，其中获取用户信息的调用合并为批量获取接口
+- 微信 API 繁忙或网络错误时按指数退避重试
+"""
+
+import time
+import heapq
+import queue
+import logging
+import itertools
+import threading
+
+
+logger = logging.getLogger(__name__)
+
+
+# 可以重试的微信 API 错误码：系统繁忙、调用频率超限
+RETRY_ERRCODES = {-1, 45009, 45011}
+
+# 批量获取用户信息接口一次最多支持 100 个用户
+USER_BATCH_SIZE = 100
+
+
+class TokenBucket:
+    """令牌桶，rate 是每秒产生的令牌数，capacity 是允许突发的令牌数
+    """
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def consume(self):
+        """取出一个令牌，成功返回 0 ，否则返回需要等待的秒数
+        """
+        now = time.monotonic()
+        self.tokens = min(self.capacity,
+                self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0
+        return (1 - self.tokens) / self.rate
+
+
+class Call:
+    """队列中的一次 API 调用
+    """
+
+    __slots__ = ('api', 'args', 'kwargs', 'callback', 'attempts')
+
+    def __init__(self, api, args, kwargs, callback):
+        # api 是微信客户端的接口名，例如 'message.send_text'
+        self.api = api
+        self.args = args
+        self.kwargs = kwargs
+        self.callback = callback
+        self.attempts = 0
+
+
+class Outbox:
+    """微信 API 出站调用队列
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self.rate = 20
+        self.burst = 20
+        self.batch_size = 50
+        self.retries = 3
+        self.backoff = 1
+        # 为 False 时不启动后台线程，需要手动调用 flush 发送
+        self.worker = True
+        self._queue = queue.Queue()
+        # 等待重试的调用：(重试时间, 序号, Call)
+        self._delayed = []
+        self._counter = itertools.count()
+        self._bucket = TokenBucket(self.rate, self.burst)
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        if app:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """根据配置项设置调用频率、队列大小和重试参数
+        """
+        config = app.config
+        self.app = app
+        self.rate = config.get('WX_OUTBOX_RATE', 20)
+        self.burst = config.get('WX_OUTBOX_BURST', 20)
+        self.batch_size = config.get('WX_OUTBOX_BATCH', 50)
+        self.retries = config.get('WX_OUTBOX_RETRIES', 3)
+        self.backoff = config.get('WX_OUTBOX_BACKOFF', 1)
+        self.worker = config.get('WX_OUTBOX_WORKER', True)
+        self._queue = queue.Queue(config.get('WX_OUTBOX_MAXSIZE', 10000))
+        self._delayed = []
+        self._bucket = TokenBucket(self.rate, self.burst)
+        app.extensions['wx_outbox'] = self
+
+    @property
+    def client(self):
+        return self.app.extensions['wx_dispatcher'].wx_client
+
+    def put(self, api, *args, callback=None, **kwargs):
+        """将一次 API 调用放入队列，后台线程未启动时启动线程
+
+        Args:
+            api (str): 微信客户端的接口名，例如 'user.get'
+            callback (function): 调用成功后以返回值为参数调用
+
+        Return:
+            bool: 队列已满时丢弃该调用并返回 False
+        """
+        try:
+            self._queue.put_nowait(Call(api, args, kwargs, callback))
+        except queue.Full:
+            logger.error('WeChat outbox is full, drop %s.', api)
+            return False
+        if self.worker:
+            self.start()
+        return True
+
+    def start(self):
+        """启动后台发送线程
+        """
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run,
+                    name='board-wx-outbox', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        """停止后台发送线程，队列中未发送的调用保留
+        """
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.flush(block=True)
+            except Exception:
+                logger.exception('Flush WeChat outbox failed.')
+
+    def take(self, block=False):
+        """取出一批待发送的调用，包括已到重试时间的调用
+        """
+        calls = []
+        now = time.monotonic()
+        while self._delayed and self._delayed[0][0] <= now:
+            calls.append(heapq.heappop(self._delayed)[2])
+        if block and not calls:
+            # 有等待重试的调用时，最多等到它的重试时间
+            timeout = self._delayed[0][0] - now if self._delayed else 1
+            try:
+                calls.append(self._queue.get(timeout=max(timeout, 0)))
+            except queue.Empty:
+                return calls
+        while len(calls) < self.batch_size:
+            try:
+                calls.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return calls
+
+    def flush(self, block=False):
+        """发送一批调用，返回本次处理的调用数
+        """
+        calls = self.take(block)
+        users, others = [], []
+        for call in calls:
+            if call.api == 'user.get' and len(call.args) == 1 \
+                    and not call.kwargs:
+                users.append(call)
+            else:
+                others.append(call)
+        for i in range(0, len(users), USER_BATCH_SIZE):
+            self.get_users(users[i:i + USER_BATCH_SIZE])
+        for call in others:
+            self.send(call)
+        return len(calls)
+
+    def acquire(self):
+        """等待令牌桶中有可用的令牌
+        """
+        while (wait := self._bucket.consume()):
+            time.sleep(wait)
+
+    def get_users(self, calls):
+        """将多个获取用户信息的调用合并为一次批量获取
+        """
+        if len(calls) == 1:
+            return self.send(calls[0])
+        self.acquire()
+        try:
+            result = self.client.user.get_batch([c.args[0] for c in calls])
+        except Exception as e:
+            for call in calls:
+                self.retry(call, e)
+            return
+        users = {user.get('openid'): user for user in result}
+        for call in calls:
+            self.done(call, users.get(call.args[0]))
+
+    def send(self, call):
+        """发送一次调用
+        """
+        self.acquire()
+        group, name = call.api.split('.')
+        method = getattr(getattr(self.client, group), name)
+        try:
+            result = method(*call.args, **call.kwargs)
+        except Exception as e:
+            return self.retry(call, e)
+        self.done(call, result)
+
+    def done(self, call, result):
+        if call.callback is None:
+            return
+        try:
+            call.callback(result)
+        except Exception:
+            logger.exception('WeChat outbox callback of %s failed.', call.api)
+
+    def retry(self, call, error):
+        """可以重试的错误按指数退避重新放入队列，否则丢弃该调用
+        """
+        from requests import RequestException
+        from wechatpy.exceptions import WeChatClientException
+
+        retryable = isinstance(error, RequestException) or (
+                isinstance(error, WeChatClientException)
+                and error.errcode in RETRY_ERRCODES)
+        call.attempts += 1
+        if not retryable or call.attempts > self.retries:
+            logger.error('Call WeChat API %s failed: %s', call.api, error)
+            return
+        delay = self.backoff * 2 ** (call.attempts - 1)
+        heapq.heappush(self._delayed,
+                (time.monotonic() + delay, next(self._counter), call))
+
+    def __len__(self):
+        return self._queue.qsize() + len(self._delayed)
@@ -0,0 +1,50 @@
+"""协程模式的应用入口文件
+
+flask run 启动的是同步的 WSGI 服务，每个请求独占一个线程
+服务器视图、监控数据视图和微信视图都会等待远程 Redis 服务器或微信接口的响应
+被监控的服务器响应缓慢时，很快所有线程都会被占满
+
+这里使用 gevent 的猴子补丁将标准库的 socket 、threading 等模块替换为协程版本
+redis 库和 wechatpy 使用的 requests 库的网络读写因此变为非阻塞的
+一个进程就可以同时处理数百个请求，视图代码无需任何修改
+
+启动方式：
+
+    $ pip install gevent
+    $ python serve.py
+
+也可以使用 gunicorn 的 gevent 工作模式：
+
+    $ gunicorn -k gevent -w 1 app:app
+"""
+
+try:
+    from gevent import monkey
+except ImportError:
+    raise SystemExit('Async mode requires gevent, run: pip install gevent')
+
+# 猴子补丁必须在导入其它模块之前完成
+monkey.patch_all()
+
+import os
+from gevent.pool import Pool
+from gevent.pywsgi import WSGIServer
+
+from board.app import create_app
+
+
+app = create_app()
+
+
+def main():
+    host = os.environ.get('BOARD_HOST', '127.0.0.1')
+    port = int(os.environ.get('BOARD_PORT', 5000))
+    # 限制同时处理的请求数量，避免被监控的服务器全部无响应时耗尽内存
+    spawn = Pool(int(os.environ.get('BOARD_MAX_CONNECTIONS', 1000)))
+    server = WSGIServer((host, port), app, spawn=spawn)
+    print(f'Serving on http://{host}:{port} with gevent.')
+    server.serve_forever()
+
+
+if __name__ == '__main__':
+    main()
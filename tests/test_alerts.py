@@ -0,0 +1,116 @@
+"""测试告警规则解析和告警引擎
+"""
+
+import pytest
+
+from board.alerts import alert_engine, parse_rule, Condition, RuleError
+from board.models import AlertRule
+from board.alerts.engine import AlertEvent
+
+
+class TestParseRule:
+    """测试告警规则解析
+    """
+
+    def test_parse_percent_rule(self):
+        condition = parse_rule('used_memory > 80% maxmemory for 2m')
+        assert condition == Condition('used_memory', '>', 0.8, 'maxmemory', 120)
+        assert condition.check({'used_memory': 90, 'maxmemory': 100})
+        assert not condition.check({'used_memory': 70, 'maxmemory': 100})
+        # maxmemory 为 0 表示不限制内存，规则不适用
+        assert condition.check({'used_memory': 90, 'maxmemory': 0}) is None
+
+    def test_parse_unit_and_unreachable(self):
+        condition = parse_rule('used_memory >= 2gb')
+        assert condition.threshold == 2 * 1024 ** 3
+        assert condition.duration == 0
+        condition = parse_rule('unreachable for 1m')
+        assert condition.unreachable and condition.duration == 60
+        assert condition.check(None)
+        assert not condition.check({})
+
+    def test_hysteresis(self):
+        condition = parse_rule('connected_clients > 100')
+        assert condition.check({'connected_clients': 98}) is False
+        assert condition.check({'connected_clients': 98}, 0.05) is True
+
+    def test_invalid_rule(self):
+        with pytest.raises(RuleError):
+            parse_rule('used_memory >> 1')
+
+
+class TestAlertEngine:
+    """测试告警引擎的状态变化
+    """
+
+    @pytest.fixture
+    def events(self, db, server, monkeypatch):
+        events = []
+        monkeypatch.setattr(alert_engine, 'notify', events.extend)
+        return events
+
+    def add_rule(self, expression, server_id=None):
+        rule = AlertRule(name='rule', expression=expression,
+                server_id=server_id)
+        rule.save()
+        alert_engine.reload()
+        return rule
+
+    def test_fire_after_duration_and_resolve(self, server, events):
+        rule = self.add_rule('connected_clients > 100 for 20s', server.id)
+        alert_engine.evaluate([(server.id, 0, {'connected_clients': 200})])
+        alert_engine.evaluate([(server.id, 10, {'connected_clients': 200})])
+        assert events == []
+        alert_engine.evaluate([(server.id, 20, {'connected_clients': 200})])
+        [event] = events
+        assert (event.rule_id, event.status, event.value) == \
+                (rule.id, 'firing', 200)
+        assert alert_engine.active()[0]['since'] == 20
+        # 告警状态下不重复通知，处于回差范围内也不恢复
+        alert_engine.evaluate([(server.id, 30, {'connected_clients': 200})])
+        alert_engine.evaluate([(server.id, 40, {'connected_clients': 98})])
+        assert len(events) == 1
+        alert_engine.evaluate([(server.id, 50, {'connected_clients': 50})])
+        assert events[-1].status == 'resolved'
+        assert alert_engine.active() == []
+
+    def test_rate_limit(self, server, events):
+        self.add_rule('unreachable')
+        alert_engine.min_interval = 300
+        for timestamp, info in ((0, None), (10, {}), (20, None), (30, {}),
+                (400, None)):
+            alert_engine.evaluate([(server.id, timestamp, info)])
+        # 第二次告警距第一次不足 300 秒，告警和恢复都不通知
+        assert [(e.status, e.timestamp) for e in events] == \
+                [('firing', 0), ('resolved', 10), ('firing', 400)]
+
+    def test_send_suppressed_alert_later(self, server, events):
+        self.add_rule('unreachable')
+        alert_engine.min_interval = 300
+        for timestamp, info in ((0, None), (10, {}), (20, None), (100, None),
+                (300, None), (400, None)):
+            alert_engine.evaluate([(server.id, timestamp, info)])
+        # 第二次告警被抑制，间隔足够时仍在告警状态，补发一次通知
+        assert [(e.status, e.timestamp) for e in events] == \
+                [('firing', 0), ('resolved', 10), ('firing', 300)]
+
+    def test_rule_for_other_server(self, server, events):
+        self.add_rule('unreachable', server.id + 1)
+        alert_engine.evaluate([(server.id, 0, None)])
+        assert events == []
+
+
+def test_notify_recipients(server, user, admin, monkeypatch):
+    user.wx_id, admin.wx_id = 'wx_user', 'wx_admin'
+    user.save()
+    admin.save()
+    sent = []
+    monkeypatch.setattr(alert_engine, 'send',
+            lambda wx_id, event, name: sent.append((wx_id, name)))
+    event = AlertEvent(1, 'rule', 'unreachable', server.id, 'firing', 0, None)
+    alert_engine.notify([event])
+    assert sent == [('wx_admin', 'test')]
+    sent.clear()
+    monkeypatch.setattr(alert_engine, 'recipients', ['test_user'])
+    alert_engine.notify([event])
+    assert sent == [('wx_user', 'test')]
@@ -0,0 +1,304 @@
+"""测试键空间分析
+"""
+
+import time
+import threading
+
+from board.analysis import job_runner, Job, PrefixTrie, scan_keyspace
+from board.analysis import TopKeys, BigKeysResult, find_bigkeys
+from board.analysis import SpaceSaving, MonitorResult, sample_monitor
+from board.analysis.bigkeys import sampled
+from board.common.pools import redis_pools
+
+
+class FakePipeline:
+
+    def __init__(self, redis):
+        self.redis = redis
+        self.commands = []
+
+    def get(self, key, index, default):
+        return self.redis.data.get(key, (None, b'none', -2, None, None))[index]
+
+    def memory_usage(self, key, samples=None):
+        self.commands.append(self.get(key, 0, None))
+
+    def type(self, key):
+        self.commands.append(self.get(key, 1, b'none'))
+
+    def ttl(self, key):
+        self.commands.append(self.get(key, 2, -2))
+
+    def execute_command(self, *args):
+        if args[0] == 'OBJECT':
+            self.commands.append(self.get(args[2], 4, None))
+        else:
+            self.commands.append(self.get(args[1], 3, None))
+
+    def execute(self, raise_on_error=True):
+        return self.commands
+
+
+class FakeRedis:
+    """按键名顺序返回 SCAN 结果的 Redis 客户端
+
+    data 的值是 (内存, 类型, TTL, 元素个数, 访问频率)
+    """
+
+    def __init__(self, data, policy='noeviction'):
+        self.data = data
+        self.keys = sorted(data)
+        self.policy = policy
+        self.scans = 0
+
+    def scan(self, cursor, match=None, count=10):
+        self.scans += 1
+        keys = self.keys[cursor:cursor + count]
+        cursor += count
+        return (0 if cursor >= len(self.keys) else cursor), keys
+
+    def pipeline(self, transaction=True):
+        return FakePipeline(self)
+
+    def info(self, section=None):
+        return {'maxmemory_policy': self.policy}
+
+
+DATA = {
+    b'user:1:profile': (100, b'hash', -1, 3, 1),
+    b'user:2:profile': (200, b'hash', 60, 5, 7),
+    b'user:2:session': (50, b'string', 60, 40, 2),
+    b'order:1': (1000, b'list', -1, 100, 0),
+    b'counter': (10, b'string', -1, 2, 9),
+}
+
+
+def make_job(trie, **params):
+    params = {'count': 2, 'max_ops': 100000, **params}
+    return Job('keyspace', 1, params, trie)
+
+
+class TestPrefixTrie:
+
+    def test_aggregate_by_prefix(self):
+        trie = PrefixTrie(':', 2)
+        for key, (memory, key_type, ttl, _, _) in DATA.items():
+            trie.add(key.decode(), memory, key_type.decode(), ttl)
+        root = trie.to_dict()
+        assert (root['keys'], root['memory'], root['no_ttl']) == (5, 1360, 3)
+        assert [c['prefix'] for c in root['children']] == ['order:', 'user:']
+        user = root['children'][1]
+        assert user['types'] == {'hash': 2, 'string': 1}
+        assert [(c['prefix'], c['memory']) for c in user['children']] == \
+                [('user:2:', 250), ('user:1:', 100)]
+
+    def test_overflow_and_limit(self):
+        trie = PrefixTrie(':', 1, max_children=2)
+        for i in range(5):
+            trie.add(f'k{i}:x', 1, 'string', -1)
+        root = trie.to_dict(limit=2)
+        assert len(trie.root.children) == 3
+        assert trie.root.children['*'].keys == 3
+        assert root['truncated'] == 1
+
+
+class TestScanKeyspace:
+
+    def test_scan_all_keys(self):
+        redis = FakeRedis(DATA)
+        job = make_job(PrefixTrie())
+        scan_keyspace(redis, job)
+        assert job.cursor == 0
+        assert job.scanned == 5
+        assert redis.scans == 3
+        assert job.result.root.memory == 1360
+
+    def test_skip_deleted_keys(self):
+        redis = FakeRedis(DATA)
+        redis.keys.append(b'zzz:deleted')
+        job = make_job(PrefixTrie(), count=10)
+        scan_keyspace(redis, job)
+        assert job.result.root.keys == 5
+
+    def test_stop_and_resume(self):
+        redis = FakeRedis(DATA)
+        job = make_job(PrefixTrie(), max_ops=1)
+        # 限速后第一批扫描完就要等待，此时停止任务
+        threading.Timer(0.1, job.stop).start()
+        scan_keyspace(redis, job)
+        assert job.cursor == 2 and job.scanned == 2
+        resumed = make_job(job.result)
+        resumed.cursor = job.cursor
+        scan_keyspace(redis, resumed)
+        assert resumed.result.root.keys == 5
+
+
+class TestBigKeys:
+
+    def test_top_keys(self):
+        top = TopKeys(2)
+        for score, key in ((3, 'a'), (1, 'b'), (5, 'c'), (4, 'd')):
+            top.push(score, key)
+        assert [key for _, key, _ in top.items()] == ['c', 'd']
+
+    def test_find_bigkeys(self):
+        job = make_job(BigKeysResult(2), sample_rate=1.0, hot=True)
+        find_bigkeys(FakeRedis(DATA), job)
+        result = job.result.to_dict()
+        assert result['sampled'] == 5
+        assert [item['key'] for item in result['memory']] == \
+                ['order:1', 'user:2:profile']
+        assert result['length']['string'] == [
+                {'key': 'user:2:session', 'length': 40},
+                {'key': 'counter', 'length': 2}]
+        # 内存淘汰策略不是 LFU 时不查找热键
+        assert result['hot'] is None
+
+    def test_find_hot_keys_with_lfu(self):
+        job = make_job(BigKeysResult(2), sample_rate=1.0, hot=True)
+        find_bigkeys(FakeRedis(DATA, 'allkeys-lfu'), job)
+        result = job.result.to_dict()
+        assert [(item['key'], item['freq']) for item in result['hot']] == \
+                [('counter', 9), ('user:2:profile', 7)]
+
+    def test_sampling(self):
+        keys = [f'key:{i}'.encode() for i in range(10000)]
+        count = sum(sampled(key, 0.1) for key in keys)
+        assert 800 < count < 1200
+        # 同一个键的采样结果不变
+        assert [sampled(key, 0.1) for key in keys[:100]] == \
+                [sampled(key, 0.1) for key in keys[:100]]
+        data = {key: (1, b'string', -1, 1, None) for key in keys[:100]}
+        job = make_job(BigKeysResult(), sample_rate=0.5, count=1000)
+        find_bigkeys(FakeRedis(data), job)
+        assert job.scanned == 100
+        assert job.result.sampled == sum(sampled(k, 0.5) for k in keys[:100])
+
+
+class FakeMonitor:
+    """依次返回给定命令的 MONITOR 对象
+    """
+
+    def __init__(self, lines):
+        self.lines = list(lines)
+        self.connection = self
+        self.closed = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.closed = True
+
+    def can_read(self, timeout):
+        if self.lines:
+            return True
+        time.sleep(timeout)
+        return False
+
+    def next_command(self):
+        return {'command': self.lines.pop(0)}
+
+
+class TestMonitor:
+
+    def test_space_saving(self):
+        top = SpaceSaving(2)
+        for item in 'aabacaad':
+            top.add(item)
+        assert top.total == 8
+        assert len(top) == 2
+        # a 的次数超过 total / size ，一定被保存且没有误差
+        assert top.items(1) == [('a', 5, 0)]
+        # c 替换了 b ，d 又替换了 c ，继承被替换元素的次数作为误差
+        assert top.items()[1] == ('d', 3, 2)
+
+    def test_monitor_result(self):
+        result = MonitorResult(10)
+        for line in ('GET user:1', 'set user:2 foo', 'GET order:1',
+                'PING', 'INFO memory', 'GET counter', ''):
+            result.add(line)
+        data = result.to_dict()
+        assert data['sampled'] == 6
+        assert data['commands'][0] == {'command': 'GET', 'count': 3,
+                'error': 0}
+        assert {item['prefix']: item['count'] for item in data['prefixes']} \
+                == {'user:': 2, 'order:': 1, 'counter': 1}
+
+    def test_sample_monitor_limits(self):
+        monitor = FakeMonitor(['GET a'] * 10)
+        redis = FakeRedis({})
+        redis.monitor = lambda: monitor
+        job = Job('monitor', 1, {'duration': 5, 'max_commands': 3},
+                MonitorResult())
+        sample_monitor(redis, job)
+        assert job.scanned == 3 and monitor.closed
+        # 没有新命令时到达采样时间即结束
+        monitor = FakeMonitor([])
+        job = Job('monitor', 1, {'duration': 0.05, 'max_commands': 3},
+                MonitorResult())
+        started = time.monotonic()
+        sample_monitor(redis, job)
+        assert time.monotonic() - started < 1
+        assert job.scanned == 0
+
+
+class TestJobRunner:
+
+    def test_submit_and_stop(self, server):
+        started = threading.Event()
+
+        def task(client, job):
+            started.set()
+            while not job.wait(0.01):
+                pass
+
+        job, created = job_runner.submit('test', server, task, {},
+                PrefixTrie())
+        assert created
+        started.wait(1)
+        assert job_runner.submit('test', server, task, {},
+                PrefixTrie()) == (job, False)
+        job_runner.stop('test', server.id)
+        for _ in range(100):
+            if not job.active:
+                break
+            time.sleep(0.01)
+        assert job.state == 'stopped'
+
+    def test_failed_job(self, server):
+        def task(client, job):
+            raise ValueError('boom')
+
+        job, _ = job_runner.submit('test', server, task, {}, PrefixTrie())
+        for _ in range(100):
+            if not job.active:
+                break
+            time.sleep(0.01)
+        assert (job.state, job.error) == ('failed', 'boom')
+
+    def test_running_job_keeps_pool(self, server, monkeypatch):
+        started = threading.Event()
+        pools = []
+
+        def task(client, job):
+            pools.append(client.connection_pool)
+            started.set()
+            while not job.wait(0.01):
+                pass
+
+        job, _ = job_runner.submit('test', server, task, {}, PrefixTrie())
+        assert started.wait(1)
+        # 任务运行期间，其他请求触发的空闲清理不会移除该连接池
+        monkeypatch.setattr(redis_pools, 'idle_timeout', 0.001)
+        time.sleep(0.01)
+        redis_pools.get('127.0.0.1', 6399)
+        assert redis_pools.get(*server.pool_key) is pools[0]
+        job_runner.stop('test', server.id)
+        for _ in range(100):
+            if not job.active:
+                break
+            time.sleep(0.01)
+        time.sleep(0.01)
+        redis_pools.get('127.0.0.1', 6399)
+        assert server.pool_key not in redis_pools
@@ -0,0 +1,41 @@
+"""测试缓存模块
+"""
+
+import time
+
+from board.common.cache import LRUCache
+
+
+class TestLRUCache:
+    """测试带过期时间的 LRU 缓存
+    """
+
+    def test_get_and_set(self):
+        cache = LRUCache()
+        assert cache.get('a') is None
+        cache.set('a', 1)
+        assert cache.get('a') == 1
+
+    def test_evict_least_recently_used(self):
+        cache = LRUCache(maxsize=2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        # 访问 a 之后，b 成为最久未被使用的缓存对象
+        cache.get('a')
+        cache.set('c', 3)
+        assert len(cache) == 2
+        assert cache.get('b') is None
+        assert cache.get('a') == 1
+
+    def test_expire(self):
+        cache = LRUCache(ttl=60)
+        cache.set('a', 1, expire_at=time.time() - 1)
+        assert cache.get('a') is None
+
+    def test_remove_if(self):
+        cache = LRUCache()
+        for i in range(4):
+            cache.set(i, i)
+        cache.remove_if(lambda value: value % 2)
+        assert cache.get(1) is None
+        assert cache.get(2) == 2
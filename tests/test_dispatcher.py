@@ -0,0 +1,172 @@
+"""测试微信消息分发
+"""
+
+import time
+import threading
+from wechatpy import parse_message
+from wechatpy.replies import TextReply, EmptyReply
+
+from board.wx import wx_dispatcher, wx_outbox
+
+
+def text_message(content, source='wx_user'):
+    return parse_message(f'''<xml>
+<ToUserName>board</ToUserName><FromUserName>{source}</FromUserName>
+<CreateTime>1600000000</CreateTime><MsgType>text</MsgType>
+<Content><![CDATA[{content}]]></Content><MsgId>1</MsgId>
+</xml>''')
+
+
+def subscribe_event(source='wx_user'):
+    return parse_message(f'''<xml>
+<ToUserName>board</ToUserName><FromUserName>{source}</FromUserName>
+<CreateTime>1600000000</CreateTime><MsgType>event</MsgType>
+<Event>subscribe</Event>
+</xml>''')
+
+
+def test_lazy_handlers(app):
+    # 创建应用时不创建微信客户端和消息处理器
+    assert wx_dispatcher.handlers is None
+    assert wx_dispatcher._client is None
+    wx_dispatcher.load_handlers()
+    assert wx_dispatcher._client is not None
+    assert len(wx_dispatcher.handlers) == 5
+
+
+def test_command_index(app):
+    wx_dispatcher.load_handlers()
+    assert set(wx_dispatcher.commands) == {'ip', 'bind', 'redis'}
+    assert [type(h).__name__ for h in wx_dispatcher.fallbacks['text']] == \
+            ['EchoHandler']
+
+
+def test_dispatch_command(db):
+    reply = wx_dispatcher.dispatch(text_message('ip 1.2.3'))
+    assert isinstance(reply, TextReply)
+    assert reply.content == 'IP 地址无效'
+
+
+def test_dispatch_fallback(db):
+    # 第一个词不是命令，由回显处理器处理
+    reply = wx_dispatcher.dispatch(text_message('iphone'))
+    assert reply.content == 'iphone'
+    stats = wx_dispatcher.stats()
+    assert stats['EchoHandler']['hits'] == 1
+    assert stats['IPLocationHandler']['hits'] == 0
+
+
+def test_dispatch_event(app):
+    wx_outbox.worker = False
+    reply = wx_dispatcher.dispatch(subscribe_event())
+    assert reply.content == '欢迎关注 Redis Board 公众号。'
+    assert len(wx_outbox) == 1
+    assert wx_dispatcher.stats()['SubscribeEventHandler']['hits'] == 1
+
+
+def test_dispatch_unknown_event(app):
+    msg = parse_message('''<xml>
+<ToUserName>board</ToUserName><FromUserName>wx_user</FromUserName>
+<CreateTime>1600000000</CreateTime><MsgType>event</MsgType>
+<Event>unsubscribe</Event>
+</xml>''')
+    assert isinstance(wx_dispatcher.dispatch(msg), EmptyReply)
+
+
+def test_dispatch_slow_command(db, monkeypatch):
+    wx_outbox.worker = False
+    sent = []
+    monkeypatch.setattr(wx_outbox, 'put',
+            lambda api, *args: sent.append((api, ) + args))
+    # 慢命令立即返回空回复，处理结果通过客服消息发送
+    reply = wx_dispatcher.dispatch(text_message('REDIS ls'))
+    assert isinstance(reply, EmptyReply)
+    wx_dispatcher.join()
+    assert sent == [('message.send_text', 'wx_user', '未绑定 Redis Board 用户')]
+    assert wx_dispatcher.stats()['RedisBaseHandler']['hits'] == 1
+
+
+def test_slow_command_inflight_limit(db, monkeypatch):
+    wx_dispatcher.load_handlers()
+    handler = wx_dispatcher.commands['redis']
+    monkeypatch.setattr(wx_outbox, 'put', lambda *args: None)
+    started = threading.Event()
+    release = threading.Event()
+
+    def handle(message, args):
+        started.set()
+        release.wait(5)
+
+    monkeypatch.setattr(handler, 'handle', handle)
+    assert isinstance(wx_dispatcher.dispatch(text_message('redis ls')),
+            EmptyReply)
+    started.wait(5)
+    # 同一用户的上一个慢命令还在处理中
+    reply = wx_dispatcher.dispatch(text_message('redis ls'))
+    assert reply.content == '上一个命令正在处理，请稍后再试'
+    # 其他用户不受影响
+    reply = wx_dispatcher.dispatch(text_message('redis ls', source='other'))
+    assert isinstance(reply, EmptyReply)
+    release.set()
+    wx_dispatcher.join()
+    assert wx_dispatcher._inflight == {}
+
+
+def test_format_bigkeys():
+    from board.wx.handlers import RedisBaseHandler
+    result = {'memory': [{'key': 'a', 'type': 'hash', 'memory': 100}],
+            'hot': [{'key': 'b', 'type': 'string', 'freq': 9}]}
+    assert RedisBaseHandler.format_bigkeys('test', result) == \
+            'test 内存最大的键：\na hash 100B\n访问最频繁的键：\nb 9'
+    assert RedisBaseHandler.format_bigkeys('test',
+            {'memory': [], 'hot': None}) == 'test 没有键'
+
+
+def test_bigkeys_command_starts_job(server, user, admin, monkeypatch):
+    from board.analysis import job_runner
+    submitted = []
+    monkeypatch.setattr(job_runner, 'submit',
+            lambda kind, server, task, params, result: submitted.append(
+                (kind, server.id, params['top'])))
+    wx_dispatcher.load_handlers()
+    handler = wx_dispatcher.commands['redis']
+    assert handler.bigkeys(admin, 'missing') == '未找到 missing'
+    # 普通用户不能启动分析任务
+    assert handler.bigkeys(user, 'test') == 'test 没有大键分析结果，须由管理员启动分析'
+    assert submitted == []
+    assert handler.bigkeys(admin, 'test').startswith('开始分析 test 的大键')
+    assert submitted == [('bigkeys', server.id, 20)]
+
+
+def test_bigkeys_result_expires(app, server, user, admin, monkeypatch):
+    from board.analysis import job_runner, BigKeysResult
+    from board.analysis.jobs import Job
+    job = Job('bigkeys', server.id, {}, BigKeysResult(5))
+    job.state = 'done'
+    job.finished_at = time.time() - 10
+    submitted = []
+    monkeypatch.setattr(job_runner, 'get', lambda kind, server_id: job)
+    monkeypatch.setattr(job_runner, 'submit',
+            lambda *args: submitted.append(args))
+    wx_dispatcher.load_handlers()
+    handler = wx_dispatcher.commands['redis']
+    reply = handler.bigkeys(user, 'test')
+    assert reply.startswith('分析于 ') and reply.endswith('test 没有键')
+    app.config['BIGKEYS_MAX_AGE'] = 5
+    assert handler.bigkeys(user, 'test').endswith('结果已过期，须由管理员重新分析')
+    assert submitted == []
+    assert handler.bigkeys(admin, 'test').startswith('开始分析 test 的大键')
+    assert len(submitted) == 1
+
+
+def test_repl_command(server):
+    from board.metrics import replication
+    wx_dispatcher.load_handlers()
+    handler = wx_dispatcher.commands['redis']
+    assert handler.replication() == '暂无主从关系'
+    replication.update([(server.id, 100, {'role': 'master',
+        'master_repl_offset': 100, 'slave0': {'ip': '10.0.0.2',
+            'port': 6379, 'state': 'online', 'offset': 60, 'lag': 1}})])
+    assert handler.replication('test') == \
+            'test -> 10.0.0.2:6379 online 落后 40B >0s'
+    assert handler.replication('missing') == 'missing 没有主从关系'
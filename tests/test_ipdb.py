@@ -0,0 +1,89 @@
+"""测试纯真 IP 数据库查询
+"""
+
+import socket
+import struct
+import pytest
+from wechatpy import parse_message
+
+from board.wx.ipdb import IPDatabase, get_database
+from board.wx.handlers import IPLocationHandler
+
+
+def ip_number(ip):
+    return struct.unpack('>I', socket.inet_aton(ip))[0]
+
+
+def build_database(path):
+    """生成一个包含三条记录的数据库文件，覆盖直接存储和两种重定向方式
+    """
+    data = bytearray(8)
+    offsets = []
+    # 第一条记录直接存储国家和地区
+    offsets.append(len(data))
+    country = len(data) + 4
+    data += struct.pack('<I', ip_number('1.0.0.255'))
+    data += '中国'.encode('gbk') + b'\x00' + '北京'.encode('gbk') + b'\x00'
+    # 第二条记录的国家和地区都重定向到第一条记录
+    offsets.append(len(data))
+    data += struct.pack('<I', ip_number('2.0.0.255'))
+    data += b'\x01' + country.to_bytes(3, 'little')
+    # 第三条记录只有国家重定向到第一条记录
+    offsets.append(len(data))
+    data += struct.pack('<I', ip_number('3.0.0.255'))
+    data += b'\x02' + country.to_bytes(3, 'little')
+    data += '上海'.encode('gbk') + b'\x00'
+    begin = len(data)
+    for start, offset in zip(('1.0.0.0', '2.0.0.0', '3.0.0.0'), offsets):
+        data += struct.pack('<I', ip_number(start)) + offset.to_bytes(3, 'little')
+    data[:8] = struct.pack('<II', begin, len(data) - 7)
+    path.write_bytes(bytes(data))
+    return str(path)
+
+
+@pytest.fixture
+def database(tmp_path):
+    database = IPDatabase(build_database(tmp_path / 'qqwry.dat'))
+    yield database
+    database.close()
+
+
+def test_lookup(database):
+    assert database.lookup('1.0.0.1') == ('中国', '北京')
+    assert database.lookup('2.0.0.255') == ('中国', '北京')
+    assert database.lookup('3.0.0.0') == ('中国', '上海')
+    assert database.lookup('1.0.1.0') is None
+    assert database.lookup('0.0.0.1') is None
+    assert database.lookup('300.1.1.1') is None
+
+
+def test_lookup_cache(database):
+    assert database.lookup('1.0.0.1') == ('中国', '北京')
+    assert database.cache.get('1.0.0.1') == ('中国', '北京')
+    database.lookup('1.0.1.0')
+    assert len(database.cache) == 2
+
+
+def test_missing_file(tmp_path):
+    database = IPDatabase(str(tmp_path / 'missing.dat'))
+    assert database.lookup('1.0.0.1') is None
+
+
+def test_shared_database(tmp_path):
+    path = str(tmp_path / 'qqwry.dat')
+    assert get_database(path) is get_database(path)
+
+
+def test_batch_command(tmp_path, monkeypatch):
+    database = IPDatabase(build_database(tmp_path / 'qqwry.dat'))
+    handler = IPLocationHandler()
+    monkeypatch.setattr(handler, 'database', database)
+    message = parse_message('''<xml>
+<ToUserName>board</ToUserName><FromUserName>wx_user</FromUserName>
+<CreateTime>1600000000</CreateTime><MsgType>text</MsgType>
+<Content>ip 1.0.0.1 3.0.0.1 9.9.9.9 abc</Content><MsgId>1</MsgId>
+</xml>''')
+    reply = handler.handle(message)
+    assert reply.content.split('\n') == ['1.0.0.1 中国', '3.0.0.1 中国',
+            '9.9.9.9 未找到 IP 对应的地址', 'abc IP 地址无效']
+    database.close()
@@ -0,0 +1,327 @@
+"""测试监控数据采集相关功能
+"""
+
+import json
+
+from board.models import Server, MetricSample
+from board.models.metric import RAW, MINUTE
+from board.metrics import collector, store
+from board.metrics.ring import RingBuffer
+from board.metrics.slowlog import SlowlogBuffer, aggregate, parse_results
+from board.metrics.commands import CommandRates, parse_commandstats
+from board.metrics.stream import MetricsBroadcaster, diff
+from board.metrics.summary import summarize, percentile
+
+
+class TestRingBuffer:
+    """测试环形缓冲区
+    """
+
+    def test_append_and_since(self):
+        buffer = RingBuffer(('a', 'b'), 3)
+        assert len(buffer) == 0
+        assert buffer.latest_time() is None
+        buffer.append(1, {'a': 1, 'b': 'x'})
+        buffer.append(2, {'a': 2})
+        data = buffer.since()
+        assert data['timestamps'] == [1, 2]
+        # 无法转换为数值的数据和缺失的数据都是 None
+        assert data['values'] == {'a': [1, 2], 'b': [None, None]}
+        assert buffer.latest_time() == 2
+
+    def test_overwrite_oldest(self):
+        buffer = RingBuffer(('a',), 3)
+        for i in range(5):
+            buffer.append(i, {'a': i * 10})
+        assert len(buffer) == 3
+        data = buffer.since()
+        assert data['timestamps'] == [2, 3, 4]
+        assert data['values'] == {'a': [20, 30, 40]}
+
+    def test_since_timestamp_and_fields(self):
+        buffer = RingBuffer(('a', 'b'), 10)
+        for i in range(4):
+            buffer.append(i, {'a': i, 'b': -i})
+        data = buffer.since(1, ['b'])
+        assert data['timestamps'] == [2, 3]
+        assert data['values'] == {'b': [-2, -3]}
+
+
+def slowlog_item(id, start_time, duration, command):
+    return {'id': id, 'start_time': start_time, 'duration': duration,
+            'command': command}
+
+
+class TestSlowlogBuffer:
+    """测试慢查询和延迟数据缓冲区
+    """
+
+    def test_ingest_incrementally(self):
+        buffer = SlowlogBuffer()
+        buffer.ingest([slowlog_item(2, 20, 300, b'get a'),
+            slowlog_item(1, 10, 200, b'keys *')], [], {})
+        # 已经读过的记录不会重复保存
+        buffer.ingest([slowlog_item(3, 30, 100, b'get b'),
+            slowlog_item(2, 20, 300, b'get a')], [], {})
+        assert buffer.last_id == 3
+        assert [entry.id for entry in buffer.entries()] == [3, 2, 1]
+        assert [entry.id for entry in buffer.entries(since=10)] == [3, 2]
+        assert buffer.entries()[0].command == 'GET'
+        assert buffer.entries()[0].args == 'get b'
+
+    def test_ingest_after_reset(self):
+        buffer = SlowlogBuffer(capacity=2)
+        buffer.ingest([slowlog_item(5, 10, 100, b'get a')], [], {})
+        # 服务器重启后 ID 从头开始
+        buffer.ingest([slowlog_item(0, 20, 100, b'set a 1')], [], {})
+        buffer.ingest([slowlog_item(1, 30, 100, b'del a'),
+            slowlog_item(0, 20, 100, b'set a 1')], [], {})
+        assert [entry.id for entry in buffer.entries()] == [1, 0]
+
+    def test_latency(self):
+        buffer = SlowlogBuffer(history_size=2)
+        buffer.ingest([], [[b'command', 100, 5, 20]], {})
+        assert buffer.events == ['command']
+        buffer.ingest([], [[b'command', 110, 6, 20]],
+                {'command': [[100, 5], [105, 20], [110, 6]]})
+        buffer.ingest([], [], {'command': [[105, 20], [110, 6]]})
+        assert buffer.latency() == {'command': {'timestamp': 110,
+            'latest': 6, 'max': 20, 'history': [(105, 20), (110, 6)]}}
+
+    def test_parse_results_with_errors(self):
+        error = Exception('unknown command')
+        assert parse_results([[], error, error], ['command']) == ([], [], {})
+
+    def test_aggregate(self):
+        buffer = SlowlogBuffer()
+        buffer.ingest([slowlog_item(3, 30, 100, b'get b'),
+            slowlog_item(2, 20, 300, b'GET a'),
+            slowlog_item(1, 10, 200, b'keys *')], [], {})
+        assert aggregate(buffer.entries()) == [
+            {'command': 'GET', 'count': 2, 'total': 400, 'max': 300,
+                'avg': 200},
+            {'command': 'KEYS', 'count': 1, 'total': 200, 'max': 200,
+                'avg': 200},
+        ]
+
+
+def commandstats(**commands):
+    return {f'cmdstat_{name}': {'calls': calls, 'usec': usec,
+        'usec_per_call': usec / calls} for name, (calls, usec)
+        in commands.items()}
+
+
+class TestCommandRates:
+    """测试根据 INFO commandstats 计算命令调用速率
+    """
+
+    def test_parse(self):
+        stats = commandstats(get=(10, 50))
+        stats['cmdstat_config|get'] = {'calls': 1, 'usec': 3}
+        assert parse_commandstats(stats) == {'GET': (10, 50),
+                'CONFIG|GET': (1, 3)}
+
+    def test_update(self):
+        rates = CommandRates()
+        rates.update(100, commandstats(get=(100, 500), set=(10, 100)))
+        # 只有一次采样时不能计算速率
+        assert rates.to_dict() is None
+        rates.update(110, commandstats(get=(300, 900), set=(10, 100),
+            hgetall=(5, 500)))
+        data = rates.to_dict()
+        assert data['interval'] == 10
+        assert data['commands'] == [
+            {'command': 'GET', 'calls': 200, 'calls_per_sec': 20,
+                'usec_per_call': 2, 'usec_per_sec': 40},
+            {'command': 'HGETALL', 'calls': 5, 'calls_per_sec': 0.5,
+                'usec_per_call': 100, 'usec_per_sec': 50},
+        ]
+        assert len(rates.to_dict(limit=1)['commands']) == 1
+
+    def test_reset(self):
+        rates = CommandRates()
+        rates.update(100, commandstats(get=(100, 500), set=(10, 100)))
+        rates.update(110, commandstats(get=(200, 600), set=(20, 200)))
+        # 某个命令的计数器变小时只跳过该命令，下一轮以变小后的值为基准
+        rates.update(120, commandstats(get=(5, 10), set=(30, 300)))
+        assert [item['command'] for item in rates.to_dict()['commands']] \
+                == ['SET']
+        rates.update(130, commandstats(get=(15, 30), set=(30, 300)))
+        assert rates.to_dict()['commands'][0]['calls'] == 10
+
+
+def parse_event(message):
+    """解析 Server-Sent Events 格式的字符串，返回 (事件名, 数据)
+    """
+    fields = dict(line.split(': ', 1) for line in message.strip().split('\n'))
+    return fields['event'], json.loads(fields['data'])
+
+
+def event_id(message):
+    return int(message.split('\n', 1)[0].split(': ', 1)[1])
+
+
+class TestMetricsBroadcaster:
+    """测试监控数据增量推送
+    """
+
+    def test_diff(self):
+        assert diff({'a': 1, 'b': 2, 'c': 3}, {'a': 1, 'b': 5, 'd': 4}) == \
+                {'b': 5, 'c': None, 'd': 4}
+
+    def test_snapshot_and_delta(self):
+        broadcaster = MetricsBroadcaster()
+        broadcaster.snapshot_every = 3
+        subscriber = broadcaster.subscribe(1, 100, {'a': 1, 'b': 2})
+        other = broadcaster.subscribe(1)
+        # 未订阅的服务器不计算增量
+        broadcaster.publish([(1, 110, {'a': 1, 'b': 3}), (2, 110, {'a': 1})])
+        broadcaster.publish([(1, 120, {'a': 2, 'b': 3})])
+        broadcaster.publish([(1, 130, {'a': 2, 'b': 3})])
+        broadcaster.publish([(1, 140, None)])
+        broadcaster.publish([(1, 150, {'a': 3})])
+        messages = [subscriber.get(0) for _ in range(6)]
+        events = [parse_event(message) for message in messages]
+        assert events == [
+            ('snapshot', {'timestamp': 100, 'data': {'a': 1, 'b': 2}}),
+            ('delta', {'timestamp': 110, 'data': {'b': 3}}),
+            ('delta', {'timestamp': 120, 'data': {'a': 2}}),
+            # 每隔 3 轮发送一次完整数据
+            ('snapshot', {'timestamp': 130, 'data': {'a': 2, 'b': 3}}),
+            ('unavailable', {'timestamp': 140}),
+            ('snapshot', {'timestamp': 150, 'data': {'a': 3}}),
+        ]
+        # 订阅之后的事件对全部订阅者只序列化一次
+        others = [other.get(0) for _ in range(6)]
+        assert all(a is b for a, b in zip(others[1:], messages[1:]))
+        assert broadcaster._channels[1].subscribers == {subscriber, other}
+        assert 2 not in broadcaster._channels
+
+    def test_lagging_subscriber(self):
+        broadcaster = MetricsBroadcaster()
+        broadcaster.queue_size = 2
+        subscriber = broadcaster.subscribe(1, 100, {'a': 1})
+        for i in range(2, 5):
+            broadcaster.publish([(1, 100 + i, {'a': i})])
+        # 积压的事件被丢弃，从完整数据重新开始
+        assert subscriber.queue.qsize() == 1
+        assert parse_event(subscriber.get(0)) == \
+                ('snapshot', {'timestamp': 104, 'data': {'a': 4}})
+        broadcaster.unsubscribe(1, subscriber)
+        assert 1 not in broadcaster._channels
+
+    def test_event_ids_contiguous(self):
+        broadcaster = MetricsBroadcaster()
+        broadcaster.queue_size = 2
+        lagging = broadcaster.subscribe(1, 100, {'a': 1})
+        other = broadcaster.subscribe(1)
+        ids = [event_id(other.get(0))]
+        for i in range(2, 6):
+            broadcaster.publish([(1, 100 + i, {'a': i})])
+            ids.append(event_id(other.get(0)))
+        # 为积压的订阅者重新同步不会占用序号，其他订阅者的序号连续
+        assert ids == [1, 2, 3, 4, 5]
+        assert event_id(lagging.get(0)) == 4
+
+
+class TestSummary:
+    """测试全部服务器的监控数据汇总
+    """
+
+    def test_percentile(self):
+        values = list(range(1, 101))
+        assert percentile(values, 50) == 50
+        assert percentile(values, 99) == 99
+        assert percentile([3], 90) == 3
+        assert percentile([], 50) is None
+
+    def test_summarize(self):
+        master = {'used_memory': 100, 'instantaneous_ops_per_sec': 10,
+                'role': 'master', 'keyspace_hits': 3, 'keyspace_misses': 1}
+        slave = {'used_memory': 50, 'instantaneous_ops_per_sec': 5,
+                'role': 'slave', 'keyspace_hits': 1, 'keyspace_misses': 1}
+        idle = {'used_memory': 10, 'role': 'master'}
+        result = summarize([('a', master), ('a', slave), ('b', idle),
+            ('b', None)])
+        total = result['total']
+        assert (total['servers'], total['available']) == (4, 3)
+        assert total['used_memory'] == 160
+        assert total['ops_per_sec'] == 15
+        assert total['roles'] == {'master': 2, 'slave': 1}
+        # 没有读取过键的服务器不参与命中率统计
+        assert total['hit_ratio']['min'] == 0.5
+        assert total['hit_ratio']['max'] == 0.75
+        assert total['hit_ratio']['p50'] == 0.5
+        assert result['groups']['a']['used_memory'] == 150
+        assert result['groups']['b']['hit_ratio']['avg'] is None
+        assert summarize([(None, master)])['groups'] == {}
+
+
+class TestCollector:
+    """测试监控数据采集器
+    """
+
+    def test_record_and_latest(self, app):
+        collector.record(1, 100, {'used_memory': 1024})
+        assert collector.latest(1) == {'used_memory': 1024}
+        # 数据过期后返回 None
+        assert collector.latest(1, max_age=10) is None
+        assert collector.history(1).since()['values']['used_memory'] == [1024]
+
+    def test_retain(self, app):
+        collector.record(1, 100, {})
+        collector.record(2, 100, {})
+        collector.retain([2])
+        assert collector.history(1) is None
+        assert collector.latest(1) is None
+        assert collector.history(2) is not None
+
+    def test_record_slowlog(self, app):
+        collector.record_slowlog(1, [slowlog_item(1, 10, 200, b'keys *')],
+                [[b'command', 10, 5, 5]], {})
+        assert collector.slowlog_events(1) == ['command']
+        assert collector.slowlog(1).last_id == 1
+        collector.retain([])
+        assert collector.slowlog(1) is None
+        assert collector.slowlog_events(1) == []
+
+    def test_collect_skip_unreachable_server(self, db):
+        server = Server(name='haha', host='127.0.0.1', port=6399)
+        server.save()
+        collector.record(123, 100, {})
+        # 无法连接的服务器本轮没有数据，已删除的服务器的数据被移除
+        [(server_id, _, info)] = collector.collect()
+        assert server_id == server.id
+        assert info is None
+        assert collector.latest(server.id) is None
+        assert collector.history(123) is None
+
+
+class TestStore:
+    """测试监控数据持久化
+    """
+
+    def test_save_and_rollup(self, db):
+        store.save([(1, 60 * i + 1, {'used_memory': 100 * i,
+            'keyspace_hits': i}) for i in range(3)])
+        raw = MetricSample.query_range(1, RAW)
+        assert [s.timestamp for s in raw] == [1, 61, 121]
+        # 第三个样本所在的分钟尚未结束，所以只汇总了前两分钟
+        minutes = MetricSample.query_range(1, MINUTE)
+        assert [s.timestamp for s in minutes] == [0, 60]
+        assert [s.used_memory for s in minutes] == [0, 100]
+
+    def test_rollup_aggregate(self, db):
+        store.save([(1, 3600 + i * 10, {'used_memory': i * 10,
+            'keyspace_hits': i}) for i in range(6)])
+        store.save([(1, 3660, {'used_memory': 0})])
+        minute = MetricSample.query_range(1, MINUTE)[0]
+        # 普通字段取平均值，累计型字段取最大值
+        assert minute.used_memory == 25
+        assert minute.keyspace_hits == 5
+
+    def test_expire(self, db):
+        store.save([(1, 0, {'used_memory': 1})])
+        store.save([(1, store.retention[RAW] + 10, {'used_memory': 2})])
+        raw = MetricSample.query_range(1, RAW)
+        assert [s.used_memory for s in raw] == [2]
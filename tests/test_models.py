@@ -1,5 +1,7 @@
 from board.models import Server
+from board.models.upgrade import upgrade_schema
 from board.common.errors import RestError
+from board.common.pools import redis_pools
 
 
 class TestServer:
@@ -35,3 +37,55 @@ class TestServer:
             assert e.code == 400
             message = f'Redis server {server.host} can\'t be connected.'
             assert e.message == message
+
+    def test_redis_reuse_pool(self, server):
+        # 多次访问 redis 属性得到的客户端对象共享同一个连接池
+        assert server.redis.connection_pool is server.redis.connection_pool
+        assert server.pool_key in redis_pools
+
+    def test_delete_invalidate_pool(self, server):
+        pool = server.redis.connection_pool
+        key = server.pool_key
+        server.delete()
+        assert key not in redis_pools
+        # 重新创建的连接池与之前的不是同一个对象
+        assert redis_pools.get(*key) is not pool
+
+    def test_delete_keep_shared_pool(self, server):
+        # 地址、端口和密码相同的另一个服务器仍在使用连接池
+        other = Server(name='other', host=server.host, port=server.port)
+        other.save()
+        pool = server.redis.connection_pool
+        server.delete()
+        assert other.redis.connection_pool is pool
+        other.delete()
+        assert server.pool_key not in redis_pools
+
+
+# 旧版本的 redis_server 数据表结构
+OLD_SERVER_TABLE = '''CREATE TABLE redis_server (
+    created_time DATETIME, updated_time DATETIME, id INTEGER NOT NULL,
+    name VARCHAR(64), description VARCHAR(512), host VARCHAR(15),
+    port INTEGER, password VARCHAR, PRIMARY KEY (id), UNIQUE (name))'''
+
+
+class TestUpgradeSchema:
+    """测试为已有的数据库添加新增的列
+    """
+
+    def test_upgrade_old_table(self, db):
+        db.engine.execute('DROP TABLE alert_rule')
+        db.engine.execute('DROP TABLE redis_server')
+        db.engine.execute(OLD_SERVER_TABLE)
+        db.engine.execute("INSERT INTO redis_server (id, name, host, port) "
+                "VALUES (1, 'old', '127.0.0.1', 6379)")
+        added = upgrade_schema()
+        assert {'redis_server.tag', 'redis_server.kind',
+                'redis_server.master_name', 'ix_redis_server_host',
+                'ix_redis_server_tag'} <= set(added)
+        server = Server.query.one()
+        assert server.name == 'old'
+        # 已有的记录使用字段的默认值
+        assert server.kind == 'standalone' and server.master_name is None
+        # 重复执行不会再添加列
+        assert upgrade_schema() == []
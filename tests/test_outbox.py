@@ -0,0 +1,88 @@
+"""测试微信 API 出站队列
+"""
+
+from types import SimpleNamespace
+import pytest
+from wechatpy.exceptions import WeChatClientException
+
+from board.wx import wx_outbox
+from board.wx.outbox import TokenBucket
+
+
+class FakeClient:
+    """记录调用的微信客户端
+    """
+
+    def __init__(self, failures=0):
+        self.calls = []
+        self.failures = failures
+        self.user = SimpleNamespace(get=self.get, get_batch=self.get_batch)
+        self.message = SimpleNamespace(send_text=self.send_text)
+
+    def get(self, openid):
+        self.calls.append(('get', openid))
+        return {'openid': openid}
+
+    def get_batch(self, openids):
+        self.calls.append(('get_batch', openids))
+        return [{'openid': openid} for openid in openids]
+
+    def send_text(self, openid, content):
+        self.calls.append(('send_text', openid))
+        if self.failures:
+            self.failures -= 1
+            raise WeChatClientException(-1, 'system error')
+
+
+@pytest.fixture
+def outbox(app):
+    wx_outbox.worker = False
+    wx_outbox.backoff = 0
+    return wx_outbox
+
+
+def use_client(app, client):
+    app.extensions['wx_dispatcher'] = SimpleNamespace(wx_client=client)
+    return client
+
+
+def test_token_bucket():
+    bucket = TokenBucket(10, 2)
+    assert bucket.consume() == 0
+    assert bucket.consume() == 0
+    assert bucket.consume() > 0
+
+
+def test_merge_user_get(app, outbox):
+    client = use_client(app, FakeClient())
+    results = []
+    for openid in ('a', 'b', 'c'):
+        outbox.put('user.get', openid, callback=results.append)
+    outbox.put('message.send_text', 'a', 'hello')
+    assert len(outbox) == 4
+    assert outbox.flush() == 4
+    assert client.calls == [('get_batch', ['a', 'b', 'c']), ('send_text', 'a')]
+    assert [user['openid'] for user in results] == ['a', 'b', 'c']
+    assert len(outbox) == 0
+
+
+def test_retry_with_backoff(app, outbox):
+    client = use_client(app, FakeClient(failures=2))
+    outbox.put('message.send_text', 'a', 'hello')
+    outbox.flush()
+    # 第一次失败后进入重试队列
+    assert len(outbox) == 1
+    outbox.flush()
+    outbox.flush()
+    assert len(outbox) == 0
+    assert client.calls == [('send_text', 'a')] * 3
+
+
+def test_drop_after_retries(app, outbox):
+    client = use_client(app, FakeClient(failures=10))
+    outbox.retries = 1
+    outbox.put('message.send_text', 'a', 'hello')
+    outbox.flush()
+    outbox.flush()
+    assert len(outbox) == 0
+    assert len(client.calls) == 2
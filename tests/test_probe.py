@@ -0,0 +1,49 @@
+"""测试并发检测服务器状态的功能
+"""
+
+import time
+import socket
+
+from board.models import Server
+from board.common.probe import probe, probe_servers
+
+
+class TestProbe:
+    """测试 probe_servers 函数
+    """
+
+    def test_probe_unreachable_server(self, db):
+        # 6399 端口没有 Redis 服务，检测结果为 error
+        server = Server(name='haha', host='127.0.0.1', port=6399)
+        server.save()
+        assert probe_servers([server]) == {server.id: 'error'}
+
+    def test_probe_many_servers(self, db):
+        servers = [Server(name=f'test{i}', host='127.0.0.1', port=6390 + i)
+                for i in range(5)]
+        for server in servers:
+            server.save()
+        result = probe_servers(servers, timeout=1, deadline=2)
+        # 每个服务器都有检测结果
+        assert set(result) == {server.id for server in servers}
+        assert set(result.values()) <= {'ok', 'error', 'timeout'}
+
+    def test_probe_no_server(self, db):
+        assert probe_servers([]) == {}
+
+    def test_probe_timeout_bounds_socket(self, app):
+        # 只监听不回复的端口，PING 会一直等待回复
+        listener = socket.socket()
+        listener.bind(('127.0.0.1', 0))
+        listener.listen(1)
+        port = listener.getsockname()[1]
+        try:
+            with app.app_context():
+                start = time.monotonic()
+                result = probe({'silent': ('127.0.0.1', port, None)},
+                        timeout=0.2, deadline=5)
+            assert result == {'silent': 'timeout'}
+            # 由套接字超时结束检测，不会等到整体时限
+            assert time.monotonic() - start < 2
+        finally:
+            listener.close()
@@ -0,0 +1,93 @@
+"""测试主从复制关系和复制延迟
+"""
+
+from board.metrics import replication
+from board.metrics.replication import OffsetHistory, parse_replication
+
+
+def master_info(offset, *replicas):
+    info = {'role': 'master', 'master_repl_offset': offset,
+            'connected_slaves': len(replicas)}
+    for i, (port, replica_offset) in enumerate(replicas):
+        info[f'slave{i}'] = {'ip': '127.0.0.1', 'port': port,
+                'state': 'online', 'offset': replica_offset, 'lag': 0}
+    return info
+
+
+def replica_info(offset, port=6379):
+    return {'role': 'slave', 'master_host': '127.0.0.1',
+            'master_port': port, 'master_link_status': 'up',
+            'master_repl_offset': offset, 'slave_repl_offset': offset}
+
+
+class TestParse:
+
+    def test_parse_master(self):
+        state = parse_replication(master_info(100, (6380, 90)))
+        assert state['role'] == 'master'
+        assert state['replicas'] == [{'addr': '127.0.0.1:6380',
+            'state': 'online', 'offset': 90, 'ack_lag': 0}]
+
+    def test_parse_replica(self):
+        state = parse_replication(replica_info(90))
+        assert (state['master'], state['link_status'], state['offset']) == \
+                ('127.0.0.1:6379', 'up', 90)
+        # cluster 的汇总数据不参与
+        assert parse_replication({'role': 'cluster'}) is None
+
+
+class TestOffsetHistory:
+
+    def test_lag(self):
+        history = OffsetHistory(3)
+        assert history.lag(0) == (None, False)
+        for timestamp, offset in ((100, 10), (110, 20), (120, 20), (130, 40)):
+            history.append(timestamp, offset)
+        assert history.lag(40) == (0, True)
+        # 从节点包含主节点在 120 之前写入的数据
+        assert history.lag(20) == (10, True)
+        assert history.lag(30) == (10, True)
+        # 早于保存的最早数据时返回下限
+        assert history.lag(15) == (20, False)
+        # 偏移量变小后重新开始
+        history.append(140, 1)
+        assert list(history.offsets) == [1]
+
+
+class TestReplicationTracker:
+
+    def test_graph(self, app):
+        servers = [(1, 'master', '127.0.0.1', 6379),
+                (2, 'replica', '127.0.0.1', 6380),
+                (3, 'orphan', '127.0.0.1', 6390)]
+        replication.update([(1, 100, master_info(100, (6380, 100))),
+            (2, 100, replica_info(100)), (3, 100, replica_info(5, 7000))])
+        replication.update([(1, 110, master_info(200, (6380, 100),
+            (6381, 200))), (2, 110, replica_info(100)),
+            (3, 110, replica_info(5, 7000))])
+        graph = replication.graph(servers)
+        edges = {(edge['master'], edge['replica']): edge
+                for edge in graph['edges']}
+        edge = edges[('127.0.0.1:6379', '127.0.0.1:6380')]
+        assert (edge['offset_lag'], edge['time_lag'], edge['time_lag_exact']) \
+                == (100, 10, True)
+        # 未登记的从节点和主节点也作为节点
+        assert edges[('127.0.0.1:6379', '127.0.0.1:6381')]['offset_lag'] == 0
+        orphan = edges[('127.0.0.1:7000', '127.0.0.1:6390')]
+        assert orphan['state'] == 'up' and orphan['offset_lag'] is None
+        assert {node['addr'] for node in graph['nodes']} == {'127.0.0.1:6379',
+                '127.0.0.1:6380', '127.0.0.1:6381', '127.0.0.1:6390',
+                '127.0.0.1:7000'}
+        assert graph['changes'] == []
+
+    def test_role_changes(self, app):
+        replication.update([(1, 100, replica_info(100))])
+        # 无法连接时保留上一次的数据
+        replication.update([(1, 110, None)])
+        replication.update([(1, 120, master_info(150))])
+        graph = replication.graph([(1, 'test', '127.0.0.1', 6380)])
+        assert graph['changes'] == [{'timestamp': 120, 'server_id': 1,
+            'name': 'test', 'from': 'slave', 'to': 'master'}]
+        # 已删除的服务器的数据被移除
+        replication.update([])
+        assert replication.graph([])['nodes'] == []
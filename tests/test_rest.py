@@ -0,0 +1,40 @@
+"""测试 RestView 视图基类
+"""
+
+import json
+
+from board.common.rest import RestView
+
+
+class StreamView(RestView):
+    """返回生成器的视图
+    """
+
+    def get(self):
+        return ({'id': i} for i in range(1000))
+
+
+class TestRestView:
+    """测试流式响应
+    """
+
+    def setup_app(self, app):
+        app.add_url_rule('/stream', view_func=StreamView.as_view('stream'))
+
+    def test_stream_json_array(self, app, client):
+        self.setup_app(app)
+        resp = client.get('/stream')
+        assert resp.status_code == 200
+        assert resp.is_streamed
+        assert resp.headers['Content-Type'] == RestView.content_type
+        assert resp.json == [{'id': i} for i in range(1000)]
+
+    def test_stream_ndjson(self, app, client):
+        self.setup_app(app)
+        resp = client.get('/stream',
+                headers={'Accept': 'application/x-ndjson'})
+        assert resp.status_code == 200
+        assert resp.headers['Content-Type'] == RestView.ndjson_content_type
+        lines = resp.data.decode().splitlines()
+        assert [json.loads(line) for line in lines] == [{'id': i}
+                for i in range(1000)]
@@ -0,0 +1,56 @@
+"""测试序列化模块
+"""
+
+import json
+import pytest
+from datetime import datetime
+from marshmallow import Schema, fields
+
+from board.models import Server, ServerSchema, UserSchema
+from board.models import dump_server, dump_user
+from board.common.serializers import get_dumper, json_dumps
+
+
+class TestDumper:
+    """预先生成的序列化函数与 marshmallow 的序列化结果相同
+    """
+
+    def test_dump_server(self, server):
+        assert dump_server(server) == ServerSchema().dump(server).data
+
+    def test_dump_server_with_none(self, db):
+        server = Server(name='test', host='127.0.0.1')
+        assert dump_server(server) == ServerSchema().dump(server).data
+
+    def test_dump_user(self, user):
+        user.login_time = datetime.now()
+        data = dump_user(user)
+        assert data == UserSchema().dump(user).data
+        # 只能反序列化的字段不会出现在结果中
+        assert 'password' not in data
+
+    def test_dump_only(self, server):
+        dump = get_dumper(ServerSchema, ('id', 'name'))
+        assert dump(server) == {'id': server.id, 'name': server.name}
+        assert get_dumper(ServerSchema, ['name', 'id']) is dump
+
+    def test_unsupported_field(self):
+        class TestSchema(Schema):
+            value = fields.Method('get_value')
+
+        with pytest.raises(ValueError):
+            get_dumper(TestSchema)
+
+
+class TestJsonDumps:
+    """测试 JSON 序列化
+    """
+
+    def test_json_dumps(self, app):
+        data = [{'a': 1, 'b': '中文', 'c': None, 'd': 1.5}]
+        with app.app_context():
+            assert json.loads(json_dumps(data)) == data
+
+    def test_json_dumps_sort_keys(self, app):
+        with app.app_context():
+            assert list(json.loads(json_dumps({'b': 1, 'a': 2}))) == ['a', 'b']
@@ -0,0 +1,178 @@
+"""测试 Redis Cluster 和 Sentinel 的拓扑发现
+"""
+
+import importlib
+from redis import RedisError
+
+from board.models import Server, ServerSchema
+from board.metrics import collector, FIELDS
+from board.metrics.topology import Topology, parse_cluster_nodes
+from board.metrics.topology import sentinel_nodes, diff_nodes, discover
+
+
+CLUSTER_NODES = b'''\
+a1 10.0.0.1:7000@17000 myself,master - 0 0 1 connected 0-5460
+a2 10.0.0.2:7000@17000 master - 0 0 2 connected 5461-10922 [10923->-a3]
+a3 10.0.0.3:7000@17000,redis-3 master - 0 0 3 connected 10923-16383
+b1 10.0.0.4:7000@17000 slave a1 0 0 4 connected
+b2 10.0.0.5:7000@17000 slave,fail a2 0 0 5 disconnected
+c1 :0@0 master,noaddr - 0 0 0 disconnected
+'''
+
+
+def node_info(used_memory, ops, keys=0):
+    return {'used_memory': used_memory, 'instantaneous_ops_per_sec': ops,
+            'uptime_in_seconds': used_memory, 'role': 'master',
+            'db0': {'keys': keys, 'expires': 0}}
+
+
+class TestDiscover:
+
+    def test_parse_cluster_nodes(self):
+        nodes = parse_cluster_nodes(CLUSTER_NODES)
+        # 没有地址的节点被忽略
+        assert len(nodes) == 5
+        master = nodes['10.0.0.2:7000']
+        assert master.role == 'master' and master.master is None
+        # 迁移中的槽被忽略
+        assert master.slots == ((5461, 10922),)
+        assert nodes['10.0.0.3:7000'].host == '10.0.0.3'
+        replica = nodes['10.0.0.5:7000']
+        assert (replica.role, replica.master, replica.state) == \
+                ('replica', '10.0.0.2:7000', 'fail')
+
+    def test_sentinel_nodes(self):
+        nodes = sentinel_nodes({'ip': '10.0.0.1', 'port': 6379},
+                [{'ip': '10.0.0.2', 'port': 6379, 'is_sdown': True}])
+        assert nodes['10.0.0.1:6379'].role == 'master'
+        replica = nodes['10.0.0.2:6379']
+        assert (replica.master, replica.state) == ('10.0.0.1:6379', 'fail')
+
+    def test_discover_sentinel_peers(self, monkeypatch):
+        class FakeSentinel:
+
+            def __init__(self, connection_pool):
+                self.host = connection_pool.connection_kwargs['host']
+
+            def sentinel_master(self, name):
+                if self.host == '10.0.0.1':
+                    raise RedisError('Connection refused.')
+                return {'ip': '10.0.1.1', 'port': 6379}
+
+            def sentinel_slaves(self, name):
+                return []
+
+            def sentinel_sentinels(self, name):
+                return [{'ip': '10.0.0.1', 'port': 26379},
+                        {'ip': '10.0.0.3', 'port': 26379}]
+
+        monkeypatch.setattr('board.metrics.topology.StrictRedis',
+                FakeSentinel)
+        nodes, peers = discover('sentinel', [('10.0.0.1', 26379),
+            ('10.0.0.2', 26379)], master_name='mymaster')
+        assert list(nodes) == ['10.0.1.1:6379']
+        topology = Topology('sentinel')
+        topology.update(100, nodes, peers)
+        # 入口节点之后尝试其他 Sentinel ，而不是不能执行 SENTINEL 命令的数据节点
+        assert topology.entries('10.0.0.1', 26379) == [('10.0.0.1', 26379),
+                ('10.0.0.3', 26379)]
+
+
+class TestTopology:
+
+    def test_update_changes(self):
+        topology = Topology('cluster')
+        nodes = parse_cluster_nodes(CLUSTER_NODES)
+        # 第一次发现时不记录变化
+        assert topology.update(100, nodes) == []
+        assert topology.entries('10.0.0.1', 7000) == [('10.0.0.1', 7000)]
+        failover = dict(nodes)
+        failover['10.0.0.4:7000'] = nodes['10.0.0.4:7000']._replace(
+                role='master', master=None, slots=((0, 5460),))
+        del failover['10.0.0.1:7000']
+        changes = topology.update(110, failover, [('10.0.0.4', 7000)])
+        assert [(c['type'], c['node']) for c in changes] == [
+            ('removed', '10.0.0.1:7000'), ('role', '10.0.0.4:7000'),
+            ('master', '10.0.0.4:7000'), ('slots', '10.0.0.4:7000')]
+        assert diff_nodes(failover, failover) == []
+        data = topology.to_dict(since=100)
+        assert len(data['changes']) == 4
+        assert data['changes'][0]['timestamp'] == 110
+        assert topology.entries('10.0.0.1', 7000)[0] == ('10.0.0.1', 7000)
+        assert ('10.0.0.4', 7000) in topology.entries('10.0.0.1', 7000)
+
+    def test_record_and_shards(self):
+        topology = Topology('cluster')
+        topology.update(100, parse_cluster_nodes(CLUSTER_NODES))
+        info = topology.record({
+            '10.0.0.1:7000': node_info(100, 10, keys=5461),
+            '10.0.0.2:7000': node_info(200, 20),
+            '10.0.0.3:7000': None,
+            '10.0.0.4:7000': node_info(50, 5, keys=5461),
+            'unknown:7000': node_info(1000, 1000),
+        }, FIELDS)
+        assert info['role'] == 'cluster'
+        assert info['used_memory'] == 350
+        assert info['uptime_in_seconds'] == 50
+        assert (info['cluster_nodes'], info['cluster_nodes_available']) == \
+                (5, 3)
+        assert info['cluster_slots_assigned'] == 16384
+        shard = topology.shards()[0]
+        assert shard['master'] == '10.0.0.1:7000'
+        assert shard['replicas'] == ['10.0.0.4:7000']
+        assert (shard['used_memory'], shard['available']) == (150, 2)
+        # 键数只统计主节点
+        assert shard['keys'] == 5461 and shard['keys_per_slot'] == 1
+        assert topology.record({}, FIELDS) is None
+
+
+class TestCollectTopology:
+
+    def test_collect_cluster(self, db, monkeypatch):
+        server = Server(name='cluster', host='10.0.0.1', port=7000,
+                kind='cluster')
+        server.save()
+        # board.metrics 的 collector 属性是采集器实例，不是同名模块
+        module = importlib.import_module('board.metrics.collector')
+        entries = []
+
+        def discover(kind, candidates, password=None, master_name=None):
+            entries.append(candidates)
+            nodes = parse_cluster_nodes(CLUSTER_NODES)
+            return nodes, [(node.host, node.port) for node in nodes.values()
+                    if node.role == 'master']
+
+        def fetch(pool, *args):
+            port = pool.connection_kwargs['host'].rsplit('.', 1)[1]
+            return node_info(int(port) * 100, 1), None, None
+
+        monkeypatch.setattr(module, 'discover', discover)
+        monkeypatch.setattr(module, 'fetch', fetch)
+        [(server_id, _, info)] = collector.collect()
+        assert server_id == server.id
+        assert info['used_memory'] == 1500
+        assert collector.latest(server.id)['cluster_nodes'] == 5
+        # 之后的发现也会尝试已知的主节点
+        collector.collect()
+        assert len(entries[1]) == 3
+        assert collector.topology(server.id).kind == 'cluster'
+
+
+class TestServerSchema:
+
+    def test_host(self, db):
+        for host in ('redis-1.internal', 'localhost', '10.0.0.1'):
+            _, errors = ServerSchema().load({'name': host, 'host': host})
+            assert not errors
+        _, errors = ServerSchema().load({'name': 'haha',
+            'host': '127.0.0.1234'})
+        assert errors['host'] == ['String does not match expected pattern.']
+
+    def test_sentinel_master_name(self, db):
+        data = {'name': 'haha', 'host': '10.0.0.1', 'kind': 'sentinel'}
+        _, errors = ServerSchema().load(data)
+        assert errors['master_name'] == ['Sentinel master name is required.']
+        server, errors = ServerSchema().load({**data, 'master_name': 'mymaster'})
+        assert not errors and server.master_name == 'mymaster'
+        _, errors = ServerSchema().load({**data, 'kind': 'haha'})
+        assert 'kind' in errors
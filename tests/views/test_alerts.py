@@ -0,0 +1,76 @@
+"""测试告警规则管理 API
+"""
+
+import json
+from flask import url_for
+
+from board.alerts import alert_engine
+from board.models import AlertRule
+from tests.base import TokenHeaderMixin
+
+
+class TestAlertRule(TokenHeaderMixin):
+    """测试告警规则的增删改查，只有管理员用户才有相关权限
+    """
+
+    def test_create_and_list_rule(self, client, admin, server):
+        headers = self.token_header(admin)
+        data = {'name': 'memory', 'server_id': server.id,
+                'expression': 'used_memory > 80% maxmemory for 2m'}
+        resp = client.post(url_for('api.alert_rule_list'),
+                data=json.dumps(data), headers=headers)
+        assert resp.status_code == 201
+        resp = client.get(url_for('api.alert_rule_list'), headers=headers)
+        [rule] = resp.json
+        assert rule['expression'] == data['expression']
+        assert rule['enabled'] is True
+
+    def test_create_rule_for_unknown_server(self, client, admin):
+        data = {'name': 'memory', 'server_id': 42,
+                'expression': 'connected_clients > 10'}
+        resp = client.post(url_for('api.alert_rule_list'),
+                data=json.dumps(data), headers=self.token_header(admin))
+        assert resp.status_code == 400
+        assert resp.json['message'] == 'Redis server not exists.'
+
+    def test_delete_server_deletes_rules(self, admin, server):
+        AlertRule(name='clients', expression='connected_clients > 10',
+                server_id=server.id).save()
+        AlertRule(name='all', expression='connected_clients > 10').save()
+        server.delete()
+        assert [rule.name for rule in AlertRule.query] == ['all']
+
+    def test_create_invalid_rule(self, client, admin):
+        data = {'name': 'memory', 'expression': 'used_memory >>> 1'}
+        resp = client.post(url_for('api.alert_rule_list'),
+                data=json.dumps(data), headers=self.token_header(admin))
+        assert resp.status_code == 400
+        assert AlertRule.query.count() == 0
+
+    def test_update_rule_reloads_engine(self, client, admin):
+        rule = AlertRule(name='clients', expression='connected_clients > 10')
+        rule.save()
+        alert_engine.load_rules()
+        url = url_for('api.alert_rule_detail', object_id=rule.id)
+        resp = client.put(url, data=json.dumps({'enabled': False}),
+                headers=self.token_header(admin))
+        assert resp.json == {'ok': True}
+        assert alert_engine.load_rules() == {}
+
+    def test_delete_rule(self, client, admin):
+        rule = AlertRule(name='clients', expression='connected_clients > 10')
+        rule.save()
+        url = url_for('api.alert_rule_detail', object_id=rule.id)
+        resp = client.delete(url, headers=self.token_header(admin))
+        assert resp.status_code == 204
+        assert AlertRule.query.count() == 0
+
+    def test_rule_permission(self, client, user):
+        resp = client.get(url_for('api.alert_rule_list'),
+                headers=self.token_header(user))
+        assert resp.status_code == 403
+
+    def test_active_alerts(self, client, user):
+        resp = client.get(url_for('api.alert_list'),
+                headers=self.token_header(user))
+        assert resp.json == []
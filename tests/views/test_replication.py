@@ -0,0 +1,30 @@
+"""测试主从复制关系 API
+"""
+
+from flask import url_for
+
+from board.metrics import replication
+from tests.base import TokenHeaderMixin
+
+
+class TestReplicationGraph(TokenHeaderMixin):
+
+    def test_graph(self, client, user, server):
+        replication.update([(server.id, 100, {'role': 'master',
+            'master_repl_offset': 100, 'slave0': {'ip': '10.0.0.2',
+                'port': 6379, 'state': 'online', 'offset': 60, 'lag': 1}})])
+        resp = client.get(url_for('api.replication_graph'),
+                headers=self.token_header(user))
+        assert resp.status_code == 200
+        [edge] = resp.json['edges']
+        assert edge['master'] == '127.0.0.1:6379'
+        assert edge['offset_lag'] == 40
+        names = {node['addr']: node.get('name') for node in resp.json['nodes']}
+        assert names == {'127.0.0.1:6379': 'test', '10.0.0.2:6379': None}
+
+    def test_graph_skips_cluster_servers(self, client, user, server):
+        server.kind = 'cluster'
+        server.save()
+        resp = client.get(url_for('api.replication_graph'),
+                headers=self.token_header(user))
+        assert resp.json['nodes'] == []
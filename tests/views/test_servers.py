@@ -1,7 +1,16 @@
 import json
+import time
+import threading
+import pytest
 from flask import url_for, g
 
 from board.models import Server
+from board.common.pools import redis_pools
+from board.metrics import collector, store, broadcaster
+from board.analysis import job_runner
+from board.metrics.topology import parse_cluster_nodes
+from board.views.server import ServerMetricsStreamView
+from board.views.analysis import KeyspaceAnalysisView, CommandTopView
 from tests.base import TokenHeaderMixin
 
 
@@ -36,6 +45,65 @@ class TestServerListView(TokenHeaderMixin):
         assert h['host'] == server.host
         assert h['port'] == server.port
 
+    def test_get_servers_with_status(self, db, client, admin):
+        """获取 Redis 服务器列表时附带服务器状态"""
+
+        server = Server(name='haha', host='127.0.0.1', port=6399)
+        server.save()
+        resp = client.get(url_for(self.endpoint, with_status=1),
+                headers=self.token_header(admin))
+        assert resp.status_code == 200
+        assert resp.json[0]['status'] == 'error'
+
+    def test_get_servers_with_pagination(self, db, client, admin):
+        """使用游标分页获取 Redis 服务器列表"""
+
+        for i in range(5):
+            Server(name=f'test{i}', host='127.0.0.1').save()
+        headers = self.token_header(admin)
+        resp = client.get(url_for(self.endpoint, limit=3), headers=headers)
+        assert [s['name'] for s in resp.json] == ['test0', 'test1', 'test2']
+        cursor = resp.headers['X-Next-Cursor']
+        resp = client.get(url_for(self.endpoint, limit=3, cursor=cursor),
+                headers=headers)
+        assert [s['name'] for s in resp.json] == ['test3', 'test4']
+        # 已经是最后一页，响应头中没有下一页的游标
+        assert 'X-Next-Cursor' not in resp.headers
+        # 无效的 limit 不能被当作未提供而返回全部数据
+        resp = client.get(url_for(self.endpoint, limit='abc'),
+                headers=headers)
+        assert resp.status_code == 400
+        assert resp.json['message'] == 'Invalid limit.'
+
+    def test_get_servers_with_filters(self, db, client, admin):
+        """使用名字前缀和地址过滤 Redis 服务器列表"""
+
+        Server(name='redis-a', host='127.0.0.1').save()
+        Server(name='redis-b', host='10.0.0.1').save()
+        Server(name='other', host='127.0.0.1').save()
+        headers = self.token_header(admin)
+        resp = client.get(url_for(self.endpoint, name__prefix='redis'),
+                headers=headers)
+        assert [s['name'] for s in resp.json] == ['redis-a', 'redis-b']
+        resp = client.get(url_for(self.endpoint, name__prefix='redis',
+            host='127.0.0.1'), headers=headers)
+        assert [s['name'] for s in resp.json] == ['redis-a']
+        # 以最大的 Unicode 字符结尾的前缀不能导致服务器错误
+        resp = client.get(url_for(self.endpoint,
+            name__prefix='redis\U0010ffff'), headers=headers)
+        assert resp.status_code == 200 and resp.json == []
+
+    def test_get_servers_with_fields(self, server, client, admin):
+        """只获取 Redis 服务器的部分字段"""
+
+        resp = client.get(url_for(self.endpoint, fields='id,name'),
+                headers=self.token_header(admin))
+        assert resp.json == [{'id': server.id, 'name': server.name}]
+        resp = client.get(url_for(self.endpoint, fields='name,haha'),
+                headers=self.token_header(admin))
+        assert resp.status_code == 400
+        assert resp.json == {'ok': False, 'message': 'Unknown fields: haha.'}
+
     def test_create_server_success(self, db, client, admin):
         """测试创建 Redis 服务器成功"""
 
@@ -134,6 +202,17 @@ class TestServerDetailView(TokenHeaderMixin):
                 data = json.dumps(data), headers=self.token_header(admin))
         assert resp.status_code == 200
 
+    def test_update_server_invalidate_pool(self, server, client, admin):
+        """测试修改服务器端口后旧的连接池被移除"""
+        old_key = server.pool_key
+        server.redis
+        assert old_key in redis_pools
+        data = {'port': 6380}
+        resp = client.put(url_for(self.endpoint, object_id=server.id),
+                data = json.dumps(data), headers=self.token_header(admin))
+        assert resp.status_code == 200
+        assert old_key not in redis_pools
+
     def test_update_server_fail(self, server, client, admin):
         """测试更新某个 Redis 服务器失败"""
         assert Server.query.count() == 1
@@ -186,6 +265,31 @@ class TestServerMetricsView(TokenHeaderMixin):
         assert 'used_cpu_sys' in metrics
         assert 'used_memory' in metrics
 
+    def test_get_metrics_from_collector(self, server, client, admin):
+        """测试监控信息来自后台采集器最近一次采集的数据"""
+        collector.record(server.id, time.time(), {'used_memory': 1024})
+        resp = client.get(url_for(self.endpoint, object_id=server.id),
+                headers=self.token_header(admin))
+        assert resp.status_code == 200
+        assert resp.json == {'used_memory': 1024}
+
+    def test_get_metrics_with_fields(self, server, client, admin):
+        """测试只获取指定字段的监控信息"""
+        collector.record(server.id, time.time(),
+                {'used_memory': 1024, 'connected_clients': 1})
+        url = url_for(self.endpoint, object_id=server.id,
+                fields='used_memory,haha')
+        resp = client.get(url, headers=self.token_header(admin))
+        assert resp.status_code == 200
+        assert resp.json == {'used_memory': 1024}
+
+    def test_get_metrics_with_unknown_section(self, server, client, admin):
+        """测试获取不存在的 INFO 分组失败"""
+        url = url_for(self.endpoint, object_id=server.id, section='memory,haha')
+        resp = client.get(url, headers=self.token_header(admin))
+        assert resp.status_code == 400
+        assert resp.json == {'ok': False, 'message': 'Unknown sections: haha.'}
+
     def test_get_metrics_fail(self, server, client, admin):
         """测试获取某个 Redis 服务器的监控信息失败"""
         not_exist_id = 123
@@ -195,3 +299,439 @@ class TestServerMetricsView(TokenHeaderMixin):
         assert resp.status_code == 404
         errors = {'message': 'Object not exists.', 'ok': False}
         assert resp.json == errors
+
+
+class TestServerMetricsHistoryView(TokenHeaderMixin):
+    """测试获取 Redis 服务器历史监控数据的 API
+    """
+
+    endpoint = 'api.server_metrics_history'
+
+    def test_get_history(self, server, client, admin):
+        """测试按起始时间和字段获取历史监控数据"""
+        for i in range(3):
+            collector.record(server.id, i, {'used_memory': i * 100,
+                'connected_clients': i})
+        url = url_for(self.endpoint, object_id=server.id, since=0,
+                fields='used_memory')
+        resp = client.get(url, headers=self.token_header(admin))
+        assert resp.status_code == 200
+        assert resp.json == {'timestamps': [1, 2],
+                'values': {'used_memory': [100, 200]}}
+
+    def test_get_history_without_samples(self, server, client, admin):
+        """测试没有采集数据时返回空列表"""
+        url = url_for(self.endpoint, object_id=server.id,
+                fields='used_memory')
+        resp = client.get(url, headers=self.token_header(admin))
+        assert resp.status_code == 200
+        assert resp.json == {'timestamps': [], 'values': {'used_memory': []}}
+
+    def test_get_history_with_unknown_field(self, server, client, admin):
+        """测试查询不存在的字段失败"""
+        url = url_for(self.endpoint, object_id=server.id, fields='haha')
+        resp = client.get(url, headers=self.token_header(admin))
+        assert resp.status_code == 400
+        assert resp.json == {'ok': False, 'message': 'Unknown fields: haha.'}
+
+    def test_get_history_from_store(self, server, client, admin):
+        """测试从持久化的监控数据中查询"""
+        store.save([(server.id, 100, {'used_memory': 1024})])
+        url = url_for(self.endpoint, object_id=server.id, resolution=0,
+                fields='used_memory')
+        resp = client.get(url, headers=self.token_header(admin))
+        assert resp.status_code == 200
+        assert resp.json == {'timestamps': [100],
+                'values': {'used_memory': [1024]}}
+
+    def test_get_history_with_invalid_params(self, server, client, admin):
+        """测试无效的 since 和 resolution 返回 400 ，而不是被当作未提供"""
+        for params in ({'since': 'abc'}, {'resolution': 'abc'}):
+            url = url_for(self.endpoint, object_id=server.id, **params)
+            resp = client.get(url, headers=self.token_header(admin))
+            assert resp.status_code == 400
+            assert resp.json['message'] == f'Invalid {next(iter(params))}.'
+
+
+class TestServerSummaryView(TokenHeaderMixin):
+    """测试汇总全部 Redis 服务器监控数据的 API
+    """
+
+    endpoint = 'api.server_summary'
+
+    def test_summary(self, server, client, user):
+        other = Server(name='haha', host='127.0.0.1', port=6380, tag='cache')
+        other.save()
+        now = time.time()
+        collector.record(server.id, now, {'used_memory': 100,
+            'role': 'master'})
+        collector.record(other.id, now, {'used_memory': 50, 'role': 'slave'})
+        resp = client.get(url_for(self.endpoint),
+                headers=self.token_header(user))
+        assert resp.status_code == 200
+        assert resp.json['total']['used_memory'] == 150
+        assert resp.json['total']['roles'] == {'master': 1, 'slave': 1}
+        assert resp.json['groups'] == {}
+        resp = client.get(url_for(self.endpoint, group_by='tag'),
+                headers=self.token_header(user))
+        groups = resp.json['groups']
+        assert groups['cache']['used_memory'] == 50
+        assert groups['']['used_memory'] == 100
+
+    def test_summary_without_samples(self, server, client, user):
+        """没有最新数据的服务器计为不可用"""
+        collector.record(server.id, time.time() - 3600, {'used_memory': 100})
+        resp = client.get(url_for(self.endpoint),
+                headers=self.token_header(user))
+        assert resp.json['total']['servers'] == 1
+        assert resp.json['total']['available'] == 0
+
+    def test_invalid_group_by(self, client, user):
+        resp = client.get(url_for(self.endpoint, group_by='host'),
+                headers=self.token_header(user))
+        assert resp.status_code == 400
+
+
+class TestServerMetricsStreamView(TokenHeaderMixin):
+    """测试以 Server-Sent Events 的形式推送监控数据的 API
+    """
+
+    endpoint = 'api.server_metrics_stream'
+
+    @pytest.fixture
+    def running(self, monkeypatch):
+        monkeypatch.setattr(type(collector), 'running', True)
+
+    def test_stream(self, server, client, user, running):
+        collector.record(server.id, 100, {'used_memory': 1024})
+        url = url_for(self.endpoint, object_id=server.id)
+        resp = client.get(url, headers=self.token_header(user),
+                buffered=False)
+        assert resp.status_code == 200
+        assert resp.mimetype == 'text/event-stream'
+        events = iter(resp.response)
+        assert next(events) == (b'id: 1\nevent: snapshot\n'
+                b'data: {"timestamp":100,"data":{"used_memory":1024}}\n\n')
+        broadcaster.publish([(server.id, 110, {'used_memory': 2048})])
+        assert b'event: delta' in next(events)
+        resp.close()
+        assert server.id not in broadcaster._channels
+
+    def test_keepalive(self, server, client, user, running, monkeypatch):
+        monkeypatch.setattr(broadcaster, 'keepalive', 0.01)
+        url = url_for(self.endpoint, object_id=server.id)
+        resp = client.get(url, headers=self.token_header(user),
+                buffered=False)
+        # 采集器没有数据时只发送保活注释
+        assert next(iter(resp.response)) == b': keepalive\n\n'
+        resp.close()
+
+    def test_collector_not_running(self, server, client, user):
+        url = url_for(self.endpoint, object_id=server.id)
+        resp = client.get(url, headers=self.token_header(user))
+        assert resp.status_code == 503
+
+    def test_subscribe_when_iterated(self, server):
+        generate = ServerMetricsStreamView.generate(server.id)
+        # 响应还没有开始发送时不订阅，客户端断开不会留下订阅者
+        assert server.id not in broadcaster._channels
+        generate.close()
+        assert server.id not in broadcaster._channels
+
+
+class TestServerTopologyView(TokenHeaderMixin):
+    """测试获取 Redis Cluster 拓扑的 API
+    """
+
+    endpoint = 'api.server_topology'
+
+    def test_get_topology(self, server, client, user):
+        server.kind = 'cluster'
+        server.save()
+        topology = collector.topology(server.id, 'cluster')
+        topology.update(100, parse_cluster_nodes(
+            b'a1 127.0.0.1:7000@17000 master - 0 0 1 connected 0-16383\n'))
+        url = url_for(self.endpoint, object_id=server.id)
+        resp = client.get(url, headers=self.token_header(user))
+        assert resp.status_code == 200
+        assert resp.json['nodes'][0]['slots'] == [[0, 16383]]
+        assert resp.json['shards'][0]['slots'] == 16384
+
+    def test_standalone_server(self, server, client, user):
+        url = url_for(self.endpoint, object_id=server.id)
+        resp = client.get(url, headers=self.token_header(user))
+        assert resp.status_code == 400
+
+
+class TestServerSlowlogView(TokenHeaderMixin):
+    """测试获取 Redis 服务器慢查询记录的 API
+    """
+
+    endpoint = 'api.server_slowlog'
+
+    def test_get_slowlog(self, server, client, admin):
+        """测试获取采集器保存的慢查询记录并按命令名汇总"""
+        collector.record_slowlog(server.id, [
+            {'id': 2, 'start_time': 20, 'duration': 300, 'command': b'get a'},
+            {'id': 1, 'start_time': 10, 'duration': 100, 'command': b'get b'},
+        ], [], {})
+        url = url_for(self.endpoint, object_id=server.id, since=15)
+        resp = client.get(url, headers=self.token_header(admin))
+        assert resp.status_code == 200
+        assert [entry['id'] for entry in resp.json['entries']] == [2]
+        assert resp.json['commands'] == [{'command': 'GET', 'count': 1,
+            'total': 300, 'max': 300, 'avg': 300}]
+        assert resp.json['latency'] == {}
+
+    def test_get_slowlog_with_limit(self, server, client, admin):
+        """测试 limit 只限制返回的记录数，不影响汇总结果"""
+        collector.record_slowlog(server.id, [
+            {'id': i, 'start_time': i, 'duration': 10, 'command': b'get a'}
+            for i in range(3, 0, -1)], [], {})
+        url = url_for(self.endpoint, object_id=server.id, limit=1)
+        resp = client.get(url, headers=self.token_header(admin))
+        assert [entry['id'] for entry in resp.json['entries']] == [3]
+        assert resp.json['commands'][0]['count'] == 3
+
+        url = url_for(self.endpoint, object_id=server.id, limit=0)
+        resp = client.get(url, headers=self.token_header(admin))
+        assert resp.status_code == 400
+        url = url_for(self.endpoint, object_id=server.id, limit='abc')
+        resp = client.get(url, headers=self.token_header(admin))
+        assert resp.status_code == 400
+        assert resp.json['message'] == 'Invalid limit.'
+
+
+class TestServerBulkView(TokenHeaderMixin):
+    """测试批量导出和批量导入 Redis 服务器的 API
+    """
+
+    endpoint = 'api.server_bulk'
+
+    def test_export_jsonl(self, server, client, admin):
+        """测试导出为 JSON Lines"""
+        resp = client.get(url_for(self.endpoint),
+                headers=self.token_header(admin))
+        assert resp.status_code == 200
+        assert resp.mimetype == 'application/x-ndjson'
+        lines = resp.data.decode().splitlines()
+        assert len(lines) == 1
+        row = json.loads(lines[0])
+        assert row['name'] == server.name
+        assert row['port'] == server.port
+
+    def test_export_csv(self, server, client, admin):
+        """测试导出为 CSV"""
+        resp = client.get(url_for(self.endpoint, format='csv'),
+                headers=self.token_header(admin))
+        assert resp.status_code == 200
+        assert resp.mimetype == 'text/csv'
+        lines = resp.data.decode().splitlines()
+        assert lines[0] == \
+                'name,description,host,port,password,tag,kind,master_name'
+        assert lines[1].startswith(f'{server.name},')
+
+    def test_import_success(self, db, client, admin):
+        """测试批量导入成功"""
+        content = '\n'.join(json.dumps({'name': f'test{i}',
+            'host': '127.0.0.1'}) for i in range(3))
+        resp = client.post(url_for(self.endpoint), data=content,
+                headers=self.token_header(admin))
+        assert resp.status_code == 200
+        assert resp.json['created'] == 3
+        assert Server.query.count() == 3
+
+    def test_import_report(self, server, client, admin):
+        """测试批量导入时每条记录的处理结果"""
+        rows = [
+            {'name': server.name, 'host': '127.0.0.1'},     # 与已有服务器重名
+            {'name': 'haha', 'host': '127.0.0.1234'},       # 无效的地址
+            {'name': 'hehe', 'host': '127.0.0.1', 'port': 6399},  # 无法连接
+            {'name': 'hehe', 'host': '127.0.0.1'},          # 与上一行重名
+        ]
+        content = '\n'.join(json.dumps(row) for row in rows) + '\n{haha'
+        resp = client.post(url_for(self.endpoint), data=content,
+                headers=self.token_header(admin))
+        assert resp.status_code == 200
+        assert resp.json['created'] == 0
+        messages = [r['message'] for r in resp.json['results']]
+        assert messages == [
+            'Redis server is already existed.',
+            'String does not match expected pattern.',
+            "Redis server 127.0.0.1 can't be connected.",
+            'Redis server is already existed.',
+            'Invalid JSON.',
+        ]
+        assert Server.query.count() == 1
+
+    def test_import_timeout(self, db, client, admin, monkeypatch):
+        """测试检测超时的记录单独报告，整体时限按记录数放宽"""
+        deadlines = []
+
+        def probe(targets, deadline=None):
+            deadlines.append(deadline)
+            return {line: 'timeout' for line in targets}
+        monkeypatch.setattr('board.views.server.probe', probe)
+        content = '\n'.join(json.dumps({'name': f'test{i}',
+            'host': '127.0.0.1'}) for i in range(100))
+        resp = client.post(url_for(self.endpoint), data=content,
+                headers=self.token_header(admin))
+        assert resp.json['results'][0]['message'] == \
+                'Redis server 127.0.0.1 timed out.'
+        # 100 条记录分 4 批检测，每批最多 3 * PROBE_TIMEOUT 秒
+        assert deadlines == [24]
+
+    def test_import_csv(self, db, client, admin):
+        """测试导入 CSV 格式的数据"""
+        content = 'name,host,port\nhaha,127.0.0.1,6399\n'
+        headers = self.token_header(admin)
+        headers['Content-Type'] = 'text/csv'
+        resp = client.post(url_for(self.endpoint), data=content,
+                headers=headers)
+        assert resp.status_code == 200
+        assert resp.json['results'] == [{'line': 2, 'ok': False,
+            'message': "Redis server 127.0.0.1 can't be connected."}]
+
+
+class TestKeyspaceAnalysisView(TokenHeaderMixin):
+    """测试键空间分析 API
+    """
+
+    endpoint = 'api.keyspace_analysis'
+
+    def wait(self, job):
+        for _ in range(100):
+            if not job.active:
+                return
+            time.sleep(0.01)
+
+    def test_start_stop_and_resume(self, client, admin, server, monkeypatch):
+        cursors = []
+        started = threading.Event()
+
+        def task(redis, job):
+            cursors.append(job.cursor)
+            started.set()
+            job.cursor = 42
+            job.result.add('user:1', 10, 'string', -1)
+            while not job.wait(0.01):
+                pass
+
+        monkeypatch.setattr(KeyspaceAnalysisView, 'task', staticmethod(task))
+        url = url_for(self.endpoint, object_id=server.id)
+        headers = self.token_header(admin)
+        resp = client.get(url, headers=headers)
+        assert resp.status_code == 404
+        data = {'delimiter': ':', 'depth': 2}
+        resp = client.post(url, data=json.dumps(data), headers=headers)
+        assert resp.status_code == 202
+        assert resp.json['params']['depth'] == 2
+        resp = client.post(url, data=json.dumps(data), headers=headers)
+        assert resp.status_code == 409
+        assert started.wait(1)
+        started.clear()
+        resp = client.delete(url, headers=headers)
+        assert resp.json == {'ok': True}
+        self.wait(job_runner.get('keyspace', server.id))
+        resp = client.get(url, headers=headers)
+        assert resp.json['state'] == 'stopped'
+        assert resp.json['cursor'] == 42
+        assert resp.json['result']['children'][0]['prefix'] == 'user:'
+        # 从停止的位置继续，之前的结果保留
+        resp = client.post(url, data=json.dumps({'resume': True}),
+                headers=headers)
+        assert resp.status_code == 202
+        assert started.wait(1)
+        job_runner.stop('keyspace', server.id)
+        self.wait(job_runner.get('keyspace', server.id))
+        assert cursors == [0, 42]
+        resp = client.get(url, headers=headers)
+        assert resp.json['result']['keys'] == 2
+        for limit in (0, -1, 'abc'):
+            resp = client.get(url_for(self.endpoint, object_id=server.id,
+                limit=limit), headers=headers)
+            assert resp.status_code == 400
+            assert resp.json['message'] == 'Invalid limit.'
+
+    def test_invalid_params(self, client, admin, server):
+        url = url_for(self.endpoint, object_id=server.id)
+        resp = client.post(url, data=json.dumps({'count': 0}),
+                headers=self.token_header(admin))
+        assert resp.status_code == 400
+        assert resp.json['message'] == 'Invalid count.'
+
+    def test_bigkeys_invalid_params(self, client, admin, server):
+        url = url_for('api.bigkeys', object_id=server.id)
+        headers = self.token_header(admin)
+        resp = client.get(url, headers=headers)
+        assert resp.status_code == 404
+        resp = client.post(url, data=json.dumps({'sample_rate': 0}),
+                headers=headers)
+        assert resp.json['message'] == 'Invalid sample_rate.'
+
+    @pytest.mark.parametrize('endpoint', ['api.keyspace_analysis',
+        'api.bigkeys'])
+    def test_user_can_only_query(self, client, user, server, endpoint):
+        """普通用户只能查询，不能启动和停止分析任务"""
+        url = url_for(endpoint, object_id=server.id)
+        resp = client.get(url, headers=self.token_header(user))
+        assert resp.status_code == 404
+        for method in (client.post, client.delete):
+            resp = method(url, headers=self.token_header(user))
+            assert resp.status_code == 403
+
+
+class TestCommandTopView(TokenHeaderMixin):
+    """测试命令流量分布 API
+    """
+
+    endpoint = 'api.command_top'
+
+    def test_get_commandstats(self, client, user, server):
+        url = url_for(self.endpoint, object_id=server.id)
+        resp = client.get(url, headers=self.token_header(user))
+        assert resp.json == {'commandstats': None, 'monitor': None}
+        stats = {'cmdstat_get': {'calls': 10, 'usec': 20}}
+        collector.record_commands(server.id, 100, stats)
+        stats = {'cmdstat_get': {'calls': 30, 'usec': 60}}
+        collector.record_commands(server.id, 110, stats)
+        resp = client.get(url, headers=self.token_header(user))
+        assert resp.json['commandstats']['commands'] == [{'command': 'GET',
+            'calls': 20, 'calls_per_sec': 2, 'usec_per_call': 2,
+            'usec_per_sec': 4}]
+
+    def test_monitor(self, client, admin, server, monkeypatch):
+        def task(redis, job):
+            job.result.add('GET user:1')
+            job.scanned += 1
+
+        monkeypatch.setattr(CommandTopView, 'task', staticmethod(task))
+        url = url_for(self.endpoint, object_id=server.id)
+        headers = self.token_header(admin)
+        # 采样时间不能超过配置的上限
+        resp = client.post(url, data=json.dumps({'duration': 3600}),
+                headers=headers)
+        assert resp.status_code == 202
+        assert resp.json['params']['duration'] == \
+                client.application.config['MONITOR_MAX_DURATION']
+        job = job_runner.get('monitor', server.id)
+        for _ in range(100):
+            if not job.active:
+                break
+            time.sleep(0.01)
+        resp = client.get(url, headers=headers)
+        assert resp.json['monitor']['state'] == 'done'
+        assert resp.json['monitor']['result']['prefixes'] == [
+                {'prefix': 'user:', 'count': 1, 'error': 0}]
+
+    def test_invalid_params(self, client, admin, server):
+        url = url_for(self.endpoint, object_id=server.id)
+        resp = client.post(url, data=json.dumps({'duration': 0}),
+                headers=self.token_header(admin))
+        assert resp.json['message'] == 'Invalid duration.'
+
+    def test_user_cannot_start_monitor(self, client, user, server):
+        url = url_for(self.endpoint, object_id=server.id)
+        for method in (client.post, client.delete):
+            resp = method(url, headers=self.token_header(user))
+            assert resp.status_code == 403
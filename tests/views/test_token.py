@@ -1,8 +1,10 @@
 """该模块用于测试基于 token 的认证功能
 """
 
+import json
 from flask import url_for
 
+from board.common.cache import token_cache
 from tests.base import TokenHeaderMixin
 
 
@@ -42,3 +44,40 @@ class TestTokenAuth(TokenHeaderMixin):
                 headers = self.token_header(user))
         assert resp.status_code == 403
         assert resp.json == {'message': 'No permission.', 'ok': False}
+
+    def test_auth_cache(self, client, admin):
+        """测试 token 验证通过后被缓存
+        """
+        headers = self.token_header(admin)
+        resp = client.get(url_for(self.endpoint), headers=headers)
+        assert resp.status_code == 200
+        token = headers['Authorization'].split()[1]
+        assert token_cache.get(token) == admin.snapshot()
+
+    def test_auth_cache_invalidated_by_update(self, client, admin, user):
+        """测试修改用户后缓存失效
+        """
+        headers = self.token_header(user)
+        client.get(url_for(self.endpoint), headers=headers)
+        # 将普通用户修改为管理员，之前的 token 重新验证后获得管理员权限
+        url = url_for('api.user_detail', object_id=user.id)
+        resp = client.put(url, data=json.dumps({'is_admin': True}),
+                headers=self.token_header(admin))
+        assert resp.status_code == 200
+        resp = client.get(url_for(self.endpoint), headers=headers)
+        assert resp.status_code == 200
+
+    def test_auth_cache_invalidated_by_delete(self, client, admin, user):
+        """测试删除用户后缓存失效
+        """
+        user.is_admin = True
+        user.save()
+        headers = self.token_header(user)
+        assert client.get(url_for(self.endpoint),
+                headers=headers).status_code == 200
+        url = url_for('api.user_detail', object_id=user.id)
+        resp = client.delete(url, headers=self.token_header(admin))
+        assert resp.status_code == 204
+        resp = client.get(url_for(self.endpoint), headers=headers)
+        assert resp.status_code == 403
+        assert resp.json == {'message': 'User not exists.', 'ok': False}
@@ -28,6 +28,25 @@ class TestUserList(TokenHeaderMixin):
         assert 'created_time' in resp_user
         assert 'updated_time' in resp_user
 
+    def test_get_user_list_with_pagination(self, client, admin, user):
+        """测试分页获取用户列表，并只返回部分字段
+        """
+        headers = self.token_header(admin)
+        url = url_for(self.endpoint, limit=1, fields='name')
+        resp = client.get(url, headers=headers)
+        assert resp.json == [{'name': admin.name}]
+        cursor = resp.headers['X-Next-Cursor']
+        url = url_for(self.endpoint, limit=1, cursor=cursor, fields='name')
+        resp = client.get(url, headers=headers)
+        assert resp.json == [{'name': user.name}]
+
+    def test_get_user_list_with_filter(self, client, admin, user):
+        """测试按邮箱过滤用户列表
+        """
+        url = url_for(self.endpoint, email=user.email)
+        resp = client.get(url, headers=self.token_header(admin))
+        assert [u['name'] for u in resp.json] == [user.name]
+
     def test_create_user_success(self, client, admin):
         """测试创建用户成功
         """